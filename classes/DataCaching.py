@@ -11,7 +11,8 @@ __date__ = "November 17th, 2011"
 
 
 """ Import python base modules """
-import sys, datetime, logging, shelve
+import sys, os, datetime, time, math, logging, threading, contextlib, fcntl, cPickle
+from multiprocessing.pool import ThreadPool
 
 """ Import Analytics modules """
 import config.settings as projSet
@@ -26,28 +27,335 @@ import classes.Helper as Hlp
 LOGGING_STREAM = sys.stderr
 logging.basicConfig(level=logging.DEBUG, stream=LOGGING_STREAM, format='%(asctime)s %(levelname)-8s %(message)s', datefmt='%b-%d %H:%M:%S')
 
+"""
+
+    CLASS :: SnapshotStore
+    
+    Versioned store for the data produced by the caching jobs.  Each generation is written in full to a new temporary 
+    file and published by renaming it over the snapshot path - the rename is atomic so readers see either the previous 
+    generation or the new one, never a partially written file, and are never blocked by the writer.  Superseded 
+    generations are removed by the filesystem once no reader has them open.
+    
+    A snapshot file is a header line followed by the pickled dict of cached data:
+    
+        SNAPSHOT <generation> <published timestamp>
+    
+    Readers unpickle a generation once per process and reuse it until the snapshot path is replaced - checking costs a 
+    single stat() call.  The loaded data is shared by every request in the process and must be treated as read only.
+    
+    Writers hold an exclusive lock on <path>.lock (flock) while they read the current generation and publish the next 
+    one, so that generations are unique and a writer never publishes over keys added by another.
+    
+    METHODS:
+            get_generation      - the generation currently published (0 if nothing has been published)
+            load                - the data of the current generation, loaded at most once per generation and process
+            load_signed         - load, also returning the signature of the snapshot file the data was read from
+            publish             - write and publish a new generation
+            update              - publish a new generation computed from the current one
+            get_versions        - (static) the generation of every snapshot loaded or published by this process
+
+"""
+class SnapshotStore(object):
+    
+    _HEADER_ = 'SNAPSHOT'
+    
+    """ path -> (generation, published, data, file signature) of the snapshots held by this process """
+    _loaded_ = dict()
+    _lock_ = threading.Lock()
+    
+    def __init__(self, path):
+        self._path_ = path
+    
+    """
+        Read the header line of an open snapshot file
+        
+        RETURN: 
+                generation, published timestamp
+    """
+    def _read_header(self, snapshot_file):
+        
+        fields = snapshot_file.readline().split()
+        
+        if len(fields) != 3 or fields[0] != self._HEADER_:
+            raise IOError('SnapshotStore -- Not a snapshot file: %s' % self._path_)
+        
+        return int(fields[1]), fields[2]
+    
+    def get_generation(self):
+        
+        try:
+            with open(self._path_, 'rb') as snapshot_file:
+                return self._read_header(snapshot_file)[0]
+        except (IOError, OSError):
+            return 0
+    
+    """
+        Identifies the file behind the snapshot path - publishing renames a new file over the path
+    """
+    def _get_signature(self, stat_result):
+        return (stat_result.st_ino, stat_result.st_mtime, stat_result.st_size)
+    
+    """
+        Returns the generation held by this process if the snapshot path has not been replaced since it was loaded
+    """
+    def _get_loaded(self, signature):
+        
+        SnapshotStore._lock_.acquire()
+        try:
+            if self._path_ in SnapshotStore._loaded_ and SnapshotStore._loaded_[self._path_][3] == signature:
+                return SnapshotStore._loaded_[self._path_]
+            return None
+        finally:
+            SnapshotStore._lock_.release()
+    
+    """
+        RETURN: 
+                generation          - the generation of the data, 0 if nothing has been published
+                data                - dict of the cached data
+    """
+    def load(self):
+        
+        generation, data, signature = self.load_signed()
+        return generation, data
+    
+    """
+        RETURN: 
+                generation          - the generation of the data, 0 if nothing has been published
+                data                - dict of the cached data
+                signature           - identifies the snapshot file the data was read from, None if nothing has been 
+                                      published.  Unlike the generation it changes whenever the snapshot path is replaced.
+    """
+    def load_signed(self):
+        
+        try:
+            signature = self._get_signature(os.stat(self._path_))
+        except OSError:
+            return 0, dict(), None
+        
+        loaded = self._get_loaded(signature)
+        if loaded != None:
+            return loaded[0], loaded[2], signature
+        
+        try:
+            snapshot_file = open(self._path_, 'rb')
+        except (IOError, OSError):
+            return 0, dict(), None
+        
+        try:
+            """ The path may have been replaced since the stat - identify the file that was opened """
+            signature = self._get_signature(os.fstat(snapshot_file.fileno()))
+            loaded = self._get_loaded(signature)
+            
+            if loaded != None:
+                return loaded[0], loaded[2], signature
+            
+            generation, published = self._read_header(snapshot_file)
+            
+            logging.info('Loading generation %s of %s ...' % (str(generation), self._path_))
+            data = cPickle.load(snapshot_file)
+            
+        finally:
+            snapshot_file.close()
+        
+        SnapshotStore._lock_.acquire()
+        try:
+            SnapshotStore._loaded_[self._path_] = (generation, published, data, signature)
+        finally:
+            SnapshotStore._lock_.release()
+        
+        return generation, data, signature
+    
+    """
+        Exclusive lock on the snapshot path shared by the writers of every process - released when the lock file is closed
+    """
+    @contextlib.contextmanager
+    def _write_lock(self):
+        
+        lock_file = open(self._path_ + '.lock', 'a')
+        
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            yield
+        finally:
+            lock_file.close()
+    
+    """
+        Publish data as the next generation
+        
+        RETURN: 
+                generation          - the generation published
+    """
+    def publish(self, data):
+        
+        with self._write_lock():
+            return self._publish(data)
+    
+    """
+        Publish update_function(data) as the next generation, where data is a copy of the current generation's data.  No 
+        other writer can publish in between.
+        
+        RETURN: 
+                generation          - the generation published
+    """
+    def update(self, update_function):
+        
+        with self._write_lock():
+            return self._publish(update_function(dict(self.load()[1])))
+    
+    """
+        Writes and renames the next generation over the snapshot path - the caller holds the write lock
+    """
+    def _publish(self, data):
+        
+        generation = self.get_generation() + 1
+        published = TP.timestamp_from_obj(datetime.datetime.utcnow(), 1, 3)
+        tmp_path = '%s.%s.%s.tmp' % (self._path_, str(generation), str(os.getpid()))
+        
+        try:
+            with open(tmp_path, 'wb') as snapshot_file:
+                snapshot_file.write('%s %s %s\n' % (self._HEADER_, str(generation), published))
+                cPickle.dump(data, snapshot_file, cPickle.HIGHEST_PROTOCOL)
+                snapshot_file.flush()
+                os.fsync(snapshot_file.fileno())
+                signature = self._get_signature(os.fstat(snapshot_file.fileno()))
+            
+            os.rename(tmp_path, self._path_)
+        
+        except:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        
+        SnapshotStore._lock_.acquire()
+        try:
+            SnapshotStore._loaded_[self._path_] = (generation, published, data, signature)
+        finally:
+            SnapshotStore._lock_.release()
+        
+        logging.info('Published generation %s of %s.' % (str(generation), self._path_))
+        
+        return generation
+    
+    """
+        RETURN: 
+                dict keyed on snapshot path of {'generation' : generation, 'published' : publish timestamp}
+    """
+    @staticmethod
+    def get_versions():
+        
+        SnapshotStore._lock_.acquire()
+        try:
+            return dict([(path, {'generation' : SnapshotStore._loaded_[path][0], 'published' : SnapshotStore._loaded_[path][1]}) \
+                         for path in SnapshotStore._loaded_])
+        finally:
+            SnapshotStore._lock_.release()
+
+
 """
 
     BASE CLASS :: DataCaching
     
-    Defines the basic functionality of a caching class - storing and retrieving data from a serialized object
+    Defines the basic functionality of a caching class - storing and retrieving data from a versioned snapshot (see 
+    SnapshotStore) at CACHING_HOME.  Every call to cache_data or clear_cached_data publishes a new generation.
+    
+    Views may also keep artifacts derived from the cached data (tables, plot data) with get_derived.  These are built at 
+    most once per snapshot file and process and are dropped when a new generation is published.
+    
+    Until a caching job has published data for a key, retrieve_cached_data and get_derived return None for it.
                    
 """
 class DataCaching(object):
     
     DATA_DIR = projSet.__data_file_dir__
+    CACHING_HOME = None
+    
+    """ Derived artifacts kept per cache key, e.g. one for each filter posted to a view """
+    _MAX_DERIVED_ = 64
+    
+    """ (CACHING_HOME, key) -> (snapshot signature, Hlp.LRUCache of derived artifacts) """
+    _derived_ = dict()
+    _derived_lock_ = threading.Lock()
+    
+    def __init__(self):        
+        self.open_serialized_obj()
     
     def open_serialized_obj(self, **kwargs): 
-        self._serialized_obj_ = None
+        self._serialized_obj_ = SnapshotStore(self.CACHING_HOME)
 
     def cache_data(self, data, key):
-        self._serialized_obj_[key] = data
-                    
+        
+        def set_key(cached_data):
+            cached_data[key] = data
+            return cached_data
+        
+        return self._serialized_obj_.update(set_key)
+    
+    """
+        RETURN: 
+                the data cached for key, None if it has not been cached
+    """
     def retrieve_cached_data(self, key):
-        return self._serialized_obj_[key]
+        
+        cached_data = self._serialized_obj_.load()[1]
+        
+        if not(key in cached_data):
+            logging.info('Nothing has been cached for %s in %s.' % (str(key), self.CACHING_HOME))
+            return None
+        
+        return cached_data[key]
     
     def clear_cached_data(self, key):        
-        self._serialized_obj_[key] = None
+        
+        def clear_key(cached_data):
+            if key in cached_data:
+                del cached_data[key]
+            return cached_data
+        
+        return self._serialized_obj_.update(clear_key)
+    
+    """
+        Returns an artifact derived from the cached data for key, building it with build_function(data, *args) only if 
+        it has not been built from the current snapshot file.  name identifies the artifact and must include any 
+        arguments that it depends on.  The artifact is shared between requests and must be treated as read only.  
+        
+        Returns None if nothing has been cached for key.
+    """
+    def get_derived(self, key, name, build_function, *args):
+        
+        generation, cached_data, signature = self._serialized_obj_.load_signed()
+        memo_key = (self.CACHING_HOME, key)
+        
+        if not(key in cached_data):
+            logging.info('Nothing has been cached for %s in %s.' % (str(key), self.CACHING_HOME))
+            return None
+        
+        DataCaching._derived_lock_.acquire()
+        try:
+            if not(memo_key in DataCaching._derived_) or DataCaching._derived_[memo_key][0] != signature:
+                DataCaching._derived_[memo_key] = (signature, Hlp.LRUCache(self._MAX_DERIVED_))
+            
+            memo = DataCaching._derived_[memo_key][1]
+            if name in memo:
+                return memo.get(name)
+        finally:
+            DataCaching._derived_lock_.release()
+        
+        """ Built outside of the lock - concurrent requests may both build an artifact, the results are the same """
+        derived = build_function(cached_data[key], *args)
+        
+        DataCaching._derived_lock_.acquire()
+        try:
+            memo.put(name, derived)
+        finally:
+            DataCaching._derived_lock_.release()
+        
+        return derived
+    
+    """
+        The generation of the cached data currently published, for monitoring
+    """
+    def get_generation(self):
+        return self._serialized_obj_.get_generation()
         
         
         
@@ -59,19 +367,9 @@ class DataCaching(object):
 """
 class Fundraiser_Totals_DataCaching(DataCaching):
 
-    CACHING_HOME = projSet.__data_file_dir__ + 'fundraiser_totals_vars.s'
+    CACHING_HOME = projSet.__data_file_dir__ + 'fundraiser_totals_vars.snap'
     ALL_COUNTRIES = 'Total'
     
-    def __init__(self):        
-        self.open_serialized_obj()        
-    
-    """ Close the connection to the serialized obj """
-    def __del__(self):
-        self._serialized_obj_.close()
-
-    def open_serialized_obj(self, **kwargs):        
-        self._serialized_obj_ = shelve.open(self.CACHING_HOME)
-        
     """
         Executes the processing of data for the long term trends view in live results
     """
@@ -143,9 +441,9 @@ class Fundraiser_Totals_DataCaching(DataCaching):
             data = list()
             data.append(dr.get_data_lists([''], empty_data))
             
-            dict_param[country] = Hlp.combine_data_lists(data)
+            """ Series are cached as packed arrays - see Hlp.unpack_data_lists for the template data """
+            dict_param[country] = Hlp.pack_data_lists(Hlp.combine_data_lists(data))
         
-        self.clear_cached_data(key)
         self.cache_data(dict_param, key)
         
         logging.info('Caching complete.')
@@ -159,18 +457,34 @@ class Fundraiser_Totals_DataCaching(DataCaching):
 """
 class LTT_DataCaching(DataCaching):
     
-    CACHING_HOME = projSet.__data_file_dir__ + 'ltt_vars.s'
+    CACHING_HOME = projSet.__data_file_dir__ + 'ltt_vars.snap'
     VIEW_DURATION_HRS = projSet.__HRS_BACK_LTT__
     
-    def __init__(self):        
-        self.open_serialized_obj()
+    """ Maximum number of distinct queries run at once, each on its own pooled connection """
+    _MAX_QUERY_THREADS_ = 8
     
-    """ Close the connection to the serialized obj """
-    def __del__(self):
-        self._serialized_obj_.close()
-
-    def open_serialized_obj(self, **kwargs):        
-        self._serialized_obj_ = shelve.open(self.CACHING_HOME)
+    """
+        Executes a long term trends statement on a pooled connection for every metric that shares the statement - run on the 
+        query threads of execute_process.  The rows are streamed from the server and parsed for each metric by the loader 
+        that fetches them (LongTermTrendsLoader.run_shared_query).  Parsing is pure python and holds the GIL, so the grouping 
+        of the rows of different statements runs serially - only the waits on the server overlap.
+        
+        INPUT:
+                metric_args     - list of (query_type, time_unit, run_kwargs) of the metrics sharing the statement
+        
+        RETURN: 
+                list of (times, counts) aligned on a common time grid, one for each entry of metric_args
+    """
+    def fetch_rows(self, start_time, end_time, metric_args):
+        
+        series = list()
+        
+        with DL.LongTermTrendsLoader(db=DL.LongTermTrendsFactLoader.FACT_DB) as lttdl:
+            
+            for (times, counts), (query_type, time_unit, run_kwargs) in zip(lttdl.run_shared_query(start_time, end_time, metric_args), metric_args):
+                series.append(TP.align_to_grid(times, counts, TP.UNIT_MINUTES[time_unit], time_unit=time_unit))
+        
+        return series
         
     """
         Executes the processing of data for the long term trends view in live results
@@ -188,8 +502,12 @@ class LTT_DataCaching(DataCaching):
         countries = countries[1:6]
         
         """ set the metrics to plot """
-        lttdl = DL.LongTermTrendsLoader(db='storage3')
-                
+        lttdl = DL.LongTermTrendsLoader(db=DL.LongTermTrendsFactLoader.FACT_DB)
+
+        """ Bring the hourly fact tables up to date - only the hours since the last refresh are aggregated from the raw data.
+            A first refresh must cover the view and the week-over-week comparison window. """
+        DL.LongTermTrendsFactLoader().refresh(backfill_hours=self.VIEW_DURATION_HRS + 24 + 168)
+
         """ Dictionary object storing lists of regexes - each expression must pass for a label to persist """
         # country_groups = {'US': ['(US)'], 'CA': ['(CA)'], 'JP': ['(JP)'], 'IN': ['(IN)'], 'NL': ['(NL)']}
         payment_groups = {'Credit Card' : ['^cc$'], 'Paypal': ['^pp$']}
@@ -230,17 +548,54 @@ class LTT_DataCaching(DataCaching):
         """ END CONFIG """
         
         
+        """ Metrics that differ only in how the rows are grouped share one execution of their statement """
+        run_kwargs = list()
+        statements = list()
+        statement_index = list()
+        
+        for index in range(len(metrics)):
+            
+            run_kwargs.append({'metric_name' : metrics[index], 'metric_type' : metric_types[index], 'groups' : groups[index], \
+                               'group_metric' : group_metrics[index], 'include_other' : include_others[index], \
+                               'include_total' : include_totals[index], 'hours_back' : hours_back[index], 'weight_name' : weights[index]})
+            
+            sql = lttdl.format_query(start_time, end_time, metrics_index[index], time_unit=time_unit[index], **run_kwargs[index])[0]
+            
+            if not(sql in statements):
+                statements.append(sql)
+            statement_index.append(statements.index(sql))
+        
+        logging.info('Running %s distinct queries for %s metrics ...' % (str(len(statements)), str(len(metrics))))
+        
+        """ 
+            Run the distinct statements concurrently, each on its own pooled connection.  The metrics of a statement are 
+            parsed on its thread as its rows arrive - the parsing itself is serialized by the GIL.
+        """
+        pool = ThreadPool(processes=min(len(statements), self._MAX_QUERY_THREADS_))
+        series = [None] * len(metrics)
+        
+        try:
+            fetches = list()
+            for statement in range(len(statements)):
+                
+                indices = [index for index in range(len(metrics)) if statement_index[index] == statement]
+                metric_args = [(metrics_index[index], time_unit[index], run_kwargs[index]) for index in indices]
+                
+                fetches.append((indices, pool.apply_async(self.fetch_rows, (start_time, end_time, metric_args))))
+            
+            for indices, fetch in fetches:
+                for index, metric_series in zip(indices, fetch.get()):
+                    series[index] = metric_series
+        
+        finally:
+            pool.terminate()
+        
         """ For each metric use the LongTermTrendsLoader to generate the data to plot """
         for index in range(len(metrics)):
             
             dr = DR.DataReporting()
             
-            times, counts = lttdl.run_query(start_time, end_time, metrics_index[index], metric_name=metrics[index], metric_type=metric_types[index], \
-                                            groups=groups[index], group_metric=group_metrics[index], include_other=include_others[index], \
-                                            include_total=include_totals[index], hours_back=hours_back[index], weight_name=weights[index], \
-                                            time_unit=time_unit[index])
-            
-            times = TP.normalize_timestamps(times, False, time_unit[index])
+            times, counts = series[index]
             
             dr._counts_ = counts
             dr._times_ = times
@@ -248,11 +603,11 @@ class LTT_DataCaching(DataCaching):
             empty_data = [0] * len(times[times.keys()[0]])
             data.append(dr.get_data_lists([''], empty_data))
             
-        dict_param = Hlp.combine_data_lists(data)
+        """ Series are cached as packed arrays - see Hlp.unpack_data_lists for the template data """
+        dict_param = Hlp.pack_data_lists(Hlp.combine_data_lists(data))
         dict_param['interval'] = self.VIEW_DURATION_HRS    
         dict_param['end_time'] = TP.timestamp_convert_format(end_time,1,2)
         
-        self.clear_cached_data(key)
         self.cache_data(dict_param, key)
         
         logging.info('Caching complete.')
@@ -263,29 +618,87 @@ class LTT_DataCaching(DataCaching):
     
     DataCaching for the long term trends view
     
+    The interval results behind the confidence table and the donation plots are kept with the cached data ('interval_state').  
+    Results are only reported up to the settled end time of the log miners (SquidLogTableLoader.get_settled_end_time) - 
+    a log only counts once its requests are loaded, and a log abandoned while being mined stops holding the time back.  
+    Each run queries only the intervals from the previous run's settled end time, less _SETTLE_MINUTES_, onward - the 
+    earlier intervals still in the window are carried over.  The trailing intervals are queried again on every run so 
+    that impressions and donations loaded late are picked up.
+    
 """
 class LiveResults_DataCaching(DataCaching):
     
-    CACHING_HOME = projSet.__data_file_dir__ + 'live_results_vars.s'
+    CACHING_HOME = projSet.__data_file_dir__ + 'live_results_vars.snap'
     DURATION_HRS = projSet.__HRS_BACK_LIVE_RESULTS__
     
-    def __init__(self):        
-        self.open_serialized_obj()      
+    """ Minutes before the previous run's settled end time that every run queries again """
+    _SETTLE_MINUTES_ = 60
     
-    """ Close the connection to the serialized obj """
-    def __del__(self):
-        self._serialized_obj_.close()
-
-    def open_serialized_obj(self, **kwargs):        
-        self._serialized_obj_ = shelve.open(self.CACHING_HOME)
+    """
+        Returns the interval state of the previous generation if it was computed for the same campaign filter and one step 
+        setting, None otherwise
+    """
+    def get_interval_state(self, key, campaign, one_step):
+        
+        cached_data = self._serialized_obj_.load()[1]
+        
+        if not(key in cached_data) or not('interval_state' in cached_data[key]):
+            return None
+        
+        interval_state = cached_data[key]['interval_state']
         
+        if interval_state['campaign'] != campaign or interval_state['one_step'] != one_step:
+            return None
+        
+        return interval_state
+    
+    """
+        Returns an IntervalResults object for the loader's query from start_time to end_time.  When previous_results holds 
+        the results of the same query from the last run only the intervals from previous_timestamp (the settled end time 
+        of that run) less the settle window onward are queried - the remaining intervals in the window are carried over 
+        from previous_results.
+        
+        INPUT:
+                settle_minutes      - (kwarg) minutes before previous_timestamp that are queried again, defaults to 
+                                      _SETTLE_MINUTES_
+    """
+    def run_interval_query(self, loader, previous_results, previous_timestamp, start_time, end_time, interval, campaign, **kwargs):
+        
+        settle_minutes = self._SETTLE_MINUTES_
+        if 'settle_minutes' in kwargs:
+            settle_minutes = kwargs['settle_minutes']
+            del kwargs['settle_minutes']
+        
+        start_time_obj = TP.timestamp_to_obj(start_time, 1)
+        start_time_obj = start_time_obj.replace(minute=int(math.floor(start_time_obj.minute / interval) * interval), second=0)
+        
+        end_time_obj = TP.timestamp_to_obj(end_time, 1)
+        end_time_obj = end_time_obj.replace(minute=int(math.floor(end_time_obj.minute / interval) * interval), second=0)
+        
+        if previous_results is None or previous_results._interval_ != interval:
+            return loader.run_query_columnar(start_time, end_time, interval, campaign, **kwargs)
+        
+        delta_start_obj = TP.timestamp_to_obj(previous_timestamp, 1) - datetime.timedelta(minutes=settle_minutes)
+        delta_start_obj = delta_start_obj.replace(minute=int(math.floor(delta_start_obj.minute / interval) * interval), second=0)
+        
+        if delta_start_obj <= start_time_obj or delta_start_obj > end_time_obj:
+            return loader.run_query_columnar(start_time, end_time, interval, campaign, **kwargs)
+        
+        delta_start = TP.timestamp_from_obj(delta_start_obj, 1, 3)
+        logging.info('Querying intervals from %s (%s) ...' % (delta_start, loader._query_type_))
+        
+        results = previous_results.regrid(start_time_obj, end_time_obj)
+        results.splice(loader.run_query_columnar(delta_start, end_time, interval, campaign, **kwargs))
+        
+        return results
+    
     """
         Executes the processing of data for the long term trends view in live results
     """
     def execute_process(self, key, **kwargs):
         
         logging.info('Commencing caching of live results data at:  %s' % self.CACHING_HOME)
-        shelve_key = key
+        cache_key = key
         
         """ Find the earliest and latest page views for a given campaign  """
         lptl = DL.LandingPageTableLoader(db='db1025')
@@ -301,18 +714,57 @@ class LiveResults_DataCaching(DataCaching):
         use_one_step = lptl.is_one_step(start_time, end_time, 'C11')  # Assume it is a one step test if there are no impressions for this campaign in the landing page table
         
         """ 
-            Retrieve the latest time for which impressions have been loaded
-            ===============================================================
+            Retrieve the latest time for which impressions and page views have been loaded
+            ===============================================================================
         """
         
-        sql_stmnt = 'select max(end_time) as latest_ts from squid_log_record where log_completion_pct = 100.00'
+        sltl = DL.SquidLogTableLoader(db='db1025')
         
-        results = dl.execute_SQL(sql_stmnt)
-        latest_timestamp = results[0][0]
-        latest_timestamp = TP.timestamp_from_obj(latest_timestamp, 2, 3)
-        latest_timestamp_flat = TP.timestamp_convert_format(latest_timestamp, 2, 1)
+        try:
+            latest_timestamp = sltl.get_settled_end_time()
+        finally:
+            sltl.close_db()
+        
+        if latest_timestamp == None:
+            logging.error('No squid log has been fully mined, the live results were not cached.')
+            return
+        
+        latest_timestamp_flat = TP.timestamp_from_obj(latest_timestamp, 1, 3)
     
-        ret = DR.ConfidenceReporting(query_type='', hyp_test='', db='db1025').get_confidence_on_time_range(start_time, end_time, campaign_regexp_filter, one_step=use_one_step)
+        """ 
+            Bring the interval results of the last run up to date
+            =====================================================
+        """
+        
+        interval_state = self.get_interval_state(cache_key, campaign_regexp_filter, use_one_step)
+        
+        previous_results = dict()
+        previous_timestamp = None
+        
+        if interval_state:
+            previous_results = interval_state['results']
+            
+            """ The settled end time moves back while a log is re-mined - query again from the earlier of the two """
+            previous_timestamp = min(interval_state['latest_timestamp'], latest_timestamp_flat)
+        else:
+            logging.info('No interval state for this campaign, querying the full window ...')
+        
+        interval_results = dict()
+        
+        """ Minutely banner/landing page results for the confidence table """
+        
+        ir_bannerlp = DR.IntervalReporting(query_type=FDH._QTYPE_BANNER_LP_, generate_plot=False, db='db1025')
+        interval_results[FDH._QTYPE_BANNER_LP_] = self.run_interval_query(ir_bannerlp._data_loader_, previous_results.get(FDH._QTYPE_BANNER_LP_), \
+                                                                          previous_timestamp, start_time, end_time, 1, campaign_regexp_filter, one_step=use_one_step)
+        
+        measured_metrics_counts = dict()
+        for metric in ['impressions', 'views', 'donations', 'amount_normal']:
+            ir_bannerlp.run(start_time, end_time, 1, metric, campaign_regexp_filter, {}, include_all_artifacts=True, columnar=True, \
+                            results=interval_results[FDH._QTYPE_BANNER_LP_])
+            measured_metrics_counts[metric] = ir_bannerlp._counts_
+        
+        ret = DR.ConfidenceReporting(query_type='', hyp_test='', db='db1025').get_confidence_on_time_range(start_time, end_time, campaign_regexp_filter, \
+                                                                                                             measured_metrics_counts=measured_metrics_counts)
         measured_metrics_counts = ret[1]
         
         """ Prepare Summary results """
@@ -364,10 +816,14 @@ class LiveResults_DataCaching(DataCaching):
         ir_banner = DR.IntervalReporting(query_type=FDH._QTYPE_BANNER_ + FDH._QTYPE_TIME_, generate_plot=False, db='db1025')
         ir_lp = DR.IntervalReporting(query_type=FDH._QTYPE_LP_ + FDH._QTYPE_TIME_, generate_plot=False, db='db1025')
             
-        """ Execute queries """        
-        ir_cmpgn.run(start_time, end_time, sampling_interval, 'donations', '',{})
-        ir_banner.run(start_time, end_time, sampling_interval, 'donations', '',{})
-        ir_lp.run(start_time, end_time, sampling_interval, 'donations', '',{})
+        """ Execute queries - only the intervals since the last run are queried """        
+        for ir in [ir_cmpgn, ir_banner, ir_lp]:
+            
+            query_type = ir._data_loader_._query_type_
+            interval_results[query_type] = self.run_interval_query(ir._data_loader_, previous_results.get(query_type), previous_timestamp, \
+                                                                   start_time, end_time, sampling_interval, '', stream=True)
+            
+            ir.run(start_time, end_time, sampling_interval, 'donations', '',{}, columnar=True, results=interval_results[query_type])
         
         
         """ Prepare serialized objects """
@@ -395,8 +851,208 @@ class LiveResults_DataCaching(DataCaching):
         dict_param['ir_banner_times'] = ir_banner._times_
         dict_param['ir_lp_times'] = ir_lp._times_
         
-        self.clear_cached_data(shelve_key)
-        self.cache_data(dict_param, shelve_key)
+        dict_param['interval_state'] = {'campaign' : campaign_regexp_filter, 'one_step' : use_one_step, 'latest_timestamp' : latest_timestamp_flat, \
+                                        'results' : interval_results}
+        
+        self.cache_data(dict_param, cache_key)
         
         logging.info('Caching complete.')
-        
\ No newline at end of file
+                
+        
+"""
+
+    CLASS :: CachingScheduler
+    
+    Runs the execute_process of DataCaching jobs at fixed cadences in a single long lived process.  Every job shares the 
+    classes already imported and the connections of DL.connection_pool.
+    
+    Before the due jobs are run the watermarks are read once: the log miner watermark 
+    (SquidLogTableLoader.get_settled_end_time) and the donation watermark (CiviCRMLoader.get_donation_watermark).  A job 
+    added with watch_watermark is skipped if its last successful run saw the same watermarks - no new impression, page 
+    view or donation data has been loaded since.  The duration of each run and the staleness of the data served (time 
+    since the log miner watermark of the last successful run) are logged and kept in get_stats.
+    
+    METHODS:
+            add_job             - schedule a DataCaching job
+            get_watermark       - the current log miner watermark
+            get_donation_watermark  - the current donation watermark
+            run_pending         - run the jobs that are due
+            run                 - run jobs as they fall due until stopped
+            stop                - stop run after the current job
+            get_stats           - runs, skips, failures, durations and staleness per job
+
+"""
+class CachingScheduler(object):
+    
+    """ Longest sleep between checks for due jobs, in seconds """
+    _MAX_SLEEP_ = 60
+    
+    def __init__(self, **kwargs):
+        
+        self._watermark_db_ = 'db1025'
+        if 'watermark_db' in kwargs:
+            self._watermark_db_ = kwargs['watermark_db']
+        
+        self._jobs_ = list()
+        self._running_ = False
+    
+    """
+        Schedule a job - caching_class().execute_process(key) is run every cadence seconds, starting with the first call 
+        to run_pending.  The kwarg 'watch_watermark' (default True) skips runs while neither the log miner watermark nor 
+        the donation watermark has moved.
+    """
+    def add_job(self, name, caching_class, key, cadence, **kwargs):
+        
+        watch_watermark = True
+        if 'watch_watermark' in kwargs:
+            watch_watermark = kwargs['watch_watermark'] == True
+        
+        job = dict()
+        
+        job['name'] = name
+        job['caching'] = caching_class()
+        job['key'] = key
+        job['cadence'] = cadence
+        job['watch_watermark'] = watch_watermark
+        
+        job['next_run'] = 0
+        job['watermark'] = None
+        job['runs'] = 0
+        job['skips'] = 0
+        job['failures'] = 0
+        job['last_duration'] = None
+        job['last_run'] = None
+        job['last_failure'] = None
+        job['staleness'] = None
+        
+        self._jobs_.append(job)
+    
+    """
+        @return: the settled end time of the log miners as a datetime, None if it could not be read
+    """
+    def get_watermark(self):
+        
+        sltl = DL.SquidLogTableLoader(db=self._watermark_db_)
+        
+        try:
+            return sltl.get_settled_end_time()
+        finally:
+            sltl.close_db()
+    
+    """
+        @return: the latest (contribution id, contribution tracking id), None if they could not be read
+    """
+    def get_donation_watermark(self):
+        
+        ccl = DL.CiviCRMLoader(db=self._watermark_db_)
+        
+        try:
+            return ccl.get_donation_watermark()
+        finally:
+            ccl.close_db()
+    
+    def _run_job(self, job, watermark, donation_watermark):
+        
+        """ The data served is as fresh as the log miner watermark of the last successful run """
+        staleness = None
+        if job['watermark'] != None and job['watermark'][0] != None:
+            staleness = datetime.datetime.utcnow() - job['watermark'][0]
+        
+        watermarks = (watermark, donation_watermark)
+        
+        if job['watch_watermark'] and not(None in watermarks) and watermarks == job['watermark']:
+            job['skips'] = job['skips'] + 1
+            job['staleness'] = staleness
+            logging.info('Skipping %s - the watermarks have not moved since its last run (%s, %s).' % (job['name'], str(watermark), str(donation_watermark)))
+            return
+        
+        logging.info('Running %s ...' % job['name'])
+        start = time.time()
+        
+        try:
+            job['caching'].execute_process(job['key'])
+            
+        except Exception as inst:
+            
+            job['failures'] = job['failures'] + 1
+            job['last_failure'] = datetime.datetime.utcnow()
+            job['staleness'] = staleness
+            
+            logging.error('Unable to run %s: %s' % (job['name'], str(inst)))
+            logging.error(type(inst))     # the exception instance
+            logging.error(inst.args)      # arguments stored in .args
+            logging.error('%s is still serving the data of its last successful run, data staleness %s.' % (job['name'], str(staleness)))
+            
+            return
+        
+        finally:
+            job['last_duration'] = time.time() - start
+        
+        staleness = None
+        if watermark != None:
+            staleness = datetime.datetime.utcnow() - watermark
+        
+        job['runs'] = job['runs'] + 1
+        job['watermark'] = watermarks
+        job['last_run'] = datetime.datetime.utcnow()
+        job['staleness'] = staleness
+        
+        logging.info('%s completed in %.2f seconds - generation %s, data staleness %s (watermark %s).' % (job['name'], job['last_duration'], \
+                                                                                                         str(job['caching'].get_generation()), str(staleness), str(watermark)))
+    
+    """
+        Run every job that is due.  The watermarks are read once for all of them.
+        
+        @return: seconds until the next job is due
+    """
+    def run_pending(self):
+        
+        due_jobs = [job for job in self._jobs_ if job['next_run'] <= time.time()]
+        
+        if due_jobs:
+            
+            watermark = self.get_watermark()
+            donation_watermark = self.get_donation_watermark()
+            
+            for job in due_jobs:
+                self._run_job(job, watermark, donation_watermark)
+                job['next_run'] = time.time() + job['cadence']
+            
+            logging.info('Connection pool: %s' % str(DL.connection_pool.get_stats()))
+        
+        if not(self._jobs_):
+            return self._MAX_SLEEP_
+        
+        return max(min([job['next_run'] for job in self._jobs_]) - time.time(), 0)
+    
+    """
+        Run jobs as they fall due until stop is called.  With the kwarg 'once' each job is run (or skipped) a single time.
+    """
+    def run(self, **kwargs):
+        
+        if 'once' in kwargs:
+            if kwargs['once'] == True:
+                self.run_pending()
+                return
+        
+        self._running_ = True
+        
+        while self._running_:
+            time.sleep(min(self.run_pending(), self._MAX_SLEEP_))
+    
+    def stop(self):
+        self._running_ = False
+    
+    """
+        @return: dict keyed on job name of its run, skip and failure counts, last duration (seconds), last run, last failure and 
+                 staleness
+    """
+    def get_stats(self):
+        
+        stats = dict()
+        
+        for job in self._jobs_:
+            stats[job['name']] = {'runs' : job['runs'], 'skips' : job['skips'], 'failures' : job['failures'], 'last_duration' : job['last_duration'], \
+                                  'last_run' : job['last_run'], 'last_failure' : job['last_failure'], 'staleness' : job['staleness']}
+        
+        return stats
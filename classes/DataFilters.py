@@ -10,7 +10,7 @@ __author__ = "Ryan Faulkner"
 __revision__ = "$Rev$"
 __date__ = "July 5th, 2011"
 
-import sys, logging
+import sys, logging, numpy as np
 import classes.TimestampProcessor as TP
 
 
@@ -154,19 +154,21 @@ class TimeSeriesDataFilter(DataFilter):
             counts = self._mutable_obj_.select_metric_keys(counts)
             times = self._mutable_obj_.select_metric_keys(times)
         
-        """ Convert Times to Integers that indicate relative times AND normalize the intervals in case any are missing """
+        """ Convert Times to relative minutes AND normalize the intervals in case any are missing - all series are aligned on one 
+            grid at once.  Columnar results (numpy arrays) are already relative and aligned on the interval grid. """
+        series_times = dict()
+        series_counts = dict()
+        
         for key in times.keys():
-            times[key] = TP.normalize_timestamps(times[key], False, 3)        
-
-            """ BUG FIX - remove any repeated indices """
-            fixed_times = list()
-            for time_index in range(len(times[key]) - 1):
-                if times[key][time_index] != times[key][time_index + 1]:
-                    fixed_times.append(times[key][time_index])
-            if len(times[key]) > 0:
-                fixed_times.append(times[key][-1])
-            times[key] = fixed_times
-            times[key], counts[key] = TP.normalize_intervals(times[key], counts[key], self._interval_)                    
+            if not(isinstance(times[key], np.ndarray)):
+                series_times[key] = times[key]
+                series_counts[key] = counts[key]
+        
+        series_times, series_counts = TP.align_to_grid(series_times, series_counts, self._interval_)
+        
+        for key in series_times:
+            times[key] = series_times[key]
+            counts[key] = series_counts[key]
             
         """ If there are missing metrics add them as zeros """
         for artifact_key in self._artifact_keys_:
@@ -16,7 +16,7 @@ __date__ = "April 8th, 2011"
 
 
 """ Import python base modules """
-import sys, MySQLdb, math, datetime, re, logging, csv, operator, numpy as np
+import sys, os, MySQLdb, MySQLdb.cursors, math, datetime, time, re, logging, csv, operator, threading, contextlib, itertools, numpy as np
 
 """ Import Analytics modules """
 import config.settings as projSet
@@ -29,6 +29,492 @@ import classes.FundraiserDataHandler as FDH
 LOGGING_STREAM = sys.stderr
 logging.basicConfig(level=logging.DEBUG, stream=LOGGING_STREAM, format='%(asctime)s %(levelname)-8s %(message)s', datefmt='%b-%d %H:%M:%S')
 
+"""
+
+    CLASS :: ConnectionPool
+    
+    Process-wide pool of MySQL connections keyed on the DataLoader 'db' argument ('storage3', 'db1008', 'db1025' or 
+    'default').  DataLoader objects check a connection out in init_db and return it in close_db, so creating loaders freely 
+    reuses idle connections rather than opening one per object.
+    
+    Checked out connections are pinged and reconnected if they have gone away.  At most max_size connections per key are 
+    checked out at once (the kwarg 'max_size', __db_pool_size__ in settings for the shared pool, _MAX_SIZE_ otherwise) - 
+    further checkouts wait for a connection to be returned and raise ConnectionPoolError after checkout_timeout seconds.  
+    A loader holds its connection for its lifetime and often creates other loaders while it does, so a thread that already 
+    holds a connection for a key is never made to wait for another one - it could otherwise wait on itself.  At most 
+    max_idle (max_size by default) idle connections are kept per key.  Returned connections are rolled back so that no 
+    transaction or read snapshot carries over to the next borrower.  Connections inherited across a fork are discarded 
+    rather than shared with the parent process.
+    
+    Connections are opened by connect_function(db_key), MySQLdb.connect to the host of the key by default.  Any DB-API 
+    connection may be substituted with the 'connect_function' kwarg or set_connect_function - the reporting SQL is MySQL 
+    specific, so in practice this points keys at other MySQL servers.  Connections without a ping method are not health 
+    checked.
+    
+    METHODS:
+            set_connect_function    - replace the function that opens connections
+            checkout        - borrow a connection for a db key
+            checkin         - return a borrowed connection
+            connection      - context manager wrapping checkout/checkin
+            close_all       - close all idle connections
+            get_stats       - connection counts per db key
+
+"""
+class ConnectionPoolError(Exception):
+    pass
+
+class ConnectionPool(object):
+    
+    _MAX_SIZE_ = 16
+    _CHECKOUT_TIMEOUT_ = 30
+    
+    DEFAULT_DB = 'default'
+    
+    def __init__(self, **kwargs):
+        
+        self._max_size_ = self._MAX_SIZE_
+        self._checkout_timeout_ = self._CHECKOUT_TIMEOUT_
+        
+        if 'max_size' in kwargs:
+            if isinstance(kwargs['max_size'], int) and kwargs['max_size'] > 0:
+                self._max_size_ = kwargs['max_size']
+        
+        self._max_idle_ = self._max_size_
+        if 'max_idle' in kwargs:
+            if isinstance(kwargs['max_idle'], int) and kwargs['max_idle'] >= 0:
+                self._max_idle_ = kwargs['max_idle']
+        if 'checkout_timeout' in kwargs:
+            if isinstance(kwargs['checkout_timeout'], (int, float)) and kwargs['checkout_timeout'] >= 0:
+                self._checkout_timeout_ = kwargs['checkout_timeout']
+        
+        self._connect_function_ = self._connect
+        if 'connect_function' in kwargs:
+            self._connect_function_ = kwargs['connect_function']
+        
+        self._condition_ = threading.Condition(threading.Lock())
+        self._reset()
+    
+    def _reset(self):
+        
+        self._pid_ = os.getpid()
+        self._idle_ = dict()
+        self._checked_out_ = dict()
+        
+        """ Connections checked out by each (thread, db key) and the thread each connection was checked out by """
+        self._held_ = dict()
+        self._borrowers_ = dict()
+    
+    """
+        Open a new connection to the host associated with a db key
+    """
+    def _connect(self, db_key):
+        
+        if db_key == 'storage3':
+            host = projSet.__db_storage3__
+        elif db_key == 'db1008':
+            host = projSet.__db_db1008__
+        elif db_key == 'db1025':
+            host = projSet.__db_db1025__
+        else:
+            host = projSet.__db_server__
+        
+        return MySQLdb.connect(host=host, user=projSet.__user__, db=projSet.__db__, port=projSet.__db_port__, passwd=projSet.__pass__)
+    
+    """
+        Replace the function used to open connections - connect_function(db_key) returns a DB-API connection.  Idle 
+        connections opened by the previous function are closed, call it before any loader is created.
+    """
+    def set_connect_function(self, connect_function):
+        
+        self._condition_.acquire()
+        
+        try:
+            self._connect_function_ = connect_function
+        finally:
+            self._condition_.release()
+        
+        self.close_all()
+    
+    """
+        Forked processes must not use the parent's sockets - forget (without closing) any inherited connections
+    """
+    def _check_pid(self):
+        
+        if self._pid_ != os.getpid():
+            self._reset()
+    
+    """
+        Borrow a connection, reusing an idle one if available
+        
+        @param db_key: one of 'storage3', 'db1008', 'db1025' or 'default'
+        
+        @return: MySQLdb connection
+    """
+    def checkout(self, db_key):
+        
+        thread_id = threading.current_thread().ident
+        
+        self._condition_.acquire()
+        
+        try:
+            self._check_pid()
+            
+            deadline = time.time() + self._checkout_timeout_
+            while self._checked_out_.get(db_key, 0) >= self._max_size_ and self._held_.get((thread_id, db_key), 0) == 0:
+                
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise ConnectionPoolError('All %s connections for %s are checked out.' % (str(self._max_size_), db_key))
+                
+                self._condition_.wait(remaining)
+                self._check_pid()
+            
+            self._checked_out_[db_key] = self._checked_out_.get(db_key, 0) + 1
+            self._held_[(thread_id, db_key)] = self._held_.get((thread_id, db_key), 0) + 1
+            idle = self._idle_.setdefault(db_key, list())
+            
+            conn = None
+            if idle:
+                conn = idle.pop()
+        
+        finally:
+            self._condition_.release()
+        
+        """ Health check outside of the lock - replace connections that have gone away """
+        try:
+            if conn != None and hasattr(conn, 'ping'):
+                try:
+                    conn.ping()
+                except MySQLdb.Error:
+                    logging.info('Pooled connection for %s has gone away, reconnecting.' % db_key)
+                    self._close_quietly(conn)
+                    conn = None
+            
+            if conn == None:
+                conn = self._connect_function_(db_key)
+        
+        except:
+            self._release_slot(db_key, thread_id)
+            raise
+        
+        self._condition_.acquire()
+        
+        try:
+            self._borrowers_[id(conn)] = thread_id
+        finally:
+            self._condition_.release()
+        
+        return conn
+    
+    """
+        Return a borrowed connection to the pool
+    """
+    def checkin(self, db_key, conn):
+        
+        try:
+            conn.rollback()
+            reusable = True
+        except MySQLdb.Error:
+            reusable = False
+        
+        thread_id = None
+        self._condition_.acquire()
+        
+        try:
+            if self._pid_ != os.getpid():
+                return
+            
+            thread_id = self._borrowers_.pop(id(conn), None)
+            
+            if reusable and len(self._idle_.setdefault(db_key, list())) < self._max_idle_:
+                self._idle_[db_key].append(conn)
+                conn = None
+        
+        finally:
+            self._condition_.release()
+            self._release_slot(db_key, thread_id)
+        
+        if conn != None:
+            self._close_quietly(conn)
+    
+    def _release_slot(self, db_key, thread_id):
+        
+        self._condition_.acquire()
+        
+        try:
+            if self._checked_out_.get(db_key, 0) > 0:
+                self._checked_out_[db_key] = self._checked_out_[db_key] - 1
+            
+            if self._held_.get((thread_id, db_key), 0) > 1:
+                self._held_[(thread_id, db_key)] = self._held_[(thread_id, db_key)] - 1
+            elif (thread_id, db_key) in self._held_:
+                del self._held_[(thread_id, db_key)]
+            
+            self._condition_.notify()
+        
+        finally:
+            self._condition_.release()
+    
+    def _close_quietly(self, conn):
+        
+        try:
+            conn.close()
+        except MySQLdb.Error:
+            pass
+    
+    """
+        Context manager - borrow a connection for the duration of a with block
+        
+        e.g.    with DL.connection_pool.connection('storage3') as conn:
+                    ...
+    """
+    @contextlib.contextmanager
+    def connection(self, db_key):
+        
+        conn = self.checkout(db_key)
+        
+        try:
+            yield conn
+        finally:
+            self.checkin(db_key, conn)
+    
+    """
+        Close the idle connections - checked out connections are closed when they are returned
+    """
+    def close_all(self):
+        
+        self._condition_.acquire()
+        
+        try:
+            self._check_pid()
+            idle = self._idle_
+            self._idle_ = dict()
+        
+        finally:
+            self._condition_.release()
+        
+        for db_key in idle:
+            for conn in idle[db_key]:
+                self._close_quietly(conn)
+    
+    """
+        @return: dict keyed on db key of {'idle' : number of idle connections, 'checked_out' : number of borrowed connections}
+    """
+    def get_stats(self):
+        
+        self._condition_.acquire()
+        
+        try:
+            self._check_pid()
+            stats = dict()
+            
+            for db_key in set(self._idle_.keys()) | set(self._checked_out_.keys()):
+                stats[db_key] = {'idle' : len(self._idle_.get(db_key, list())), 'checked_out' : self._checked_out_.get(db_key, 0)}
+        
+        finally:
+            self._condition_.release()
+        
+        return stats
+
+
+""" Registry of shared connections used by all DataLoader objects in this process - older settings files may not set the pool size """
+connection_pool = ConnectionPool(max_size=getattr(projSet, '__db_pool_size__', ConnectionPool._MAX_SIZE_))
+
+
+"""
+
+    CLASS :: QueryCache
+    
+    Process-wide cache of execute_SQL results keyed on the db key and the whitespace-normalized SQL statement.  Caching 
+    is opt-in - a statement is only cached when execute_SQL is given a cache_ttl and results are served for at most that 
+    many seconds.  Entries are evicted least recently used first once max_entries are held or the estimated size of the 
+    cached rows exceeds max_bytes.
+    
+    Statements whose time range reaches into the current window are not cached unless cache_current is set, as the rows 
+    in that window are still being loaded.  A statement reaches into the current window if it calls now() (or a similar 
+    function), compares against a timestamp literal no earlier than current_window minutes ago, or has a lower bound 
+    timestamp literal but no upper bound.  Statements without timestamp literals are not time ranged and may be cached.
+    
+    METHODS:
+            get                 - cached rows for a statement, None on a miss or if the entry has expired
+            put                 - cache the rows of a statement for ttl seconds
+            is_current          - does the time range of a statement reach into the current window
+            clear               - remove all entries
+            get_stats           - hit, miss, skip and eviction counts along with the size of the cache
+
+"""
+class QueryCache(object):
+    
+    _MAX_ENTRIES_ = 10000
+    _MAX_BYTES_ = 64 * 1024 * 1024
+    _CURRENT_WINDOW_ = 60
+    
+    _WHITESPACE_RE_ = re.compile(r'\s+')
+    _TIMESTAMP_RE_ = re.compile(r"'(\d{14}|\d{4}-\d{2}-\d{2}(?: \d{2}:\d{2}:\d{2})?)'")
+    _UPPER_BOUND_RE_ = re.compile(r"(?:<=?|\bbetween\s+'[^']*'\s+and)\s*'(\d{14}|\d{4}-\d{2}-\d{2}(?: \d{2}:\d{2}:\d{2})?)'", re.IGNORECASE)
+    _NOW_RE_ = re.compile(r'\b(?:now|utc_timestamp|utc_date|curdate|curtime|current_timestamp|current_date|sysdate|unix_timestamp)\b', re.IGNORECASE)
+    
+    def __init__(self, **kwargs):
+        
+        max_entries = self._MAX_ENTRIES_
+        max_bytes = self._MAX_BYTES_
+        self._current_window_ = self._CURRENT_WINDOW_
+        
+        if 'max_entries' in kwargs:
+            if isinstance(kwargs['max_entries'], int) and kwargs['max_entries'] > 0:
+                max_entries = kwargs['max_entries']
+        if 'max_bytes' in kwargs:
+            if isinstance(kwargs['max_bytes'], int) and kwargs['max_bytes'] > 0:
+                max_bytes = kwargs['max_bytes']
+        if 'current_window' in kwargs:
+            if isinstance(kwargs['current_window'], int) and kwargs['current_window'] >= 0:
+                self._current_window_ = kwargs['current_window']
+        
+        self._lock_ = threading.Lock()
+        self._entries_ = Hlp.LRUCache(max_entries, max_weight=max_bytes)
+        
+        self._hits_ = 0
+        self._misses_ = 0
+        self._expired_ = 0
+        self._skipped_ = 0
+    
+    """
+        @return: the cache key of a statement run against a db key
+    """
+    def get_key(self, db_key, SQL_statement):
+        return (db_key, self._WHITESPACE_RE_.sub(' ', SQL_statement).strip().rstrip(';').rstrip())
+    
+    """
+        Timestamp literals are compared as 14-digit strings
+    """
+    def _to_flat_timestamp(self, timestamp):
+        return re.sub('[^0-9]', '', timestamp).ljust(14, '0')
+    
+    """
+        @return: True if the time range of the statement reaches into the still-mutating current window
+    """
+    def is_current(self, SQL_statement):
+        
+        if self._NOW_RE_.search(SQL_statement):
+            return True
+        
+        timestamps = self._TIMESTAMP_RE_.findall(SQL_statement)
+        if len(timestamps) == 0:
+            return False
+        
+        """ An open-ended range extends to the present """
+        if len(self._UPPER_BOUND_RE_.findall(SQL_statement)) == 0:
+            return True
+        
+        window_start = datetime.datetime.utcnow() - datetime.timedelta(minutes=self._current_window_)
+        window_start = TP.timestamp_from_obj(window_start, 1, 3)
+        
+        return max([self._to_flat_timestamp(ts) for ts in timestamps]) >= window_start
+    
+    """
+        Rough estimate of the memory held by a result set in bytes
+    """
+    def _estimate_size(self, rows):
+        
+        size = sys.getsizeof(rows)
+        for row in rows:
+            size = size + sys.getsizeof(row)
+            for field in row:
+                size = size + sys.getsizeof(field)
+        
+        return size
+    
+    """
+        @return: cached rows for the statement or None
+    """
+    def get(self, db_key, SQL_statement):
+        
+        key = self.get_key(db_key, SQL_statement)
+        
+        self._lock_.acquire()
+        
+        try:
+            entry = self._entries_.get(key)
+            
+            if entry == None:
+                self._misses_ = self._misses_ + 1
+                return None
+            
+            expires, rows = entry
+            
+            if time.time() >= expires:
+                self._entries_.remove(key)
+                self._expired_ = self._expired_ + 1
+                self._misses_ = self._misses_ + 1
+                return None
+            
+            self._hits_ = self._hits_ + 1
+            return rows
+        
+        finally:
+            self._lock_.release()
+    
+    """
+        Cache the rows returned by a statement for ttl seconds.  Statements reaching into the current window are skipped 
+        unless cache_current is True.
+        
+        @return: True if the rows were cached
+    """
+    def put(self, db_key, SQL_statement, rows, ttl, cache_current=False):
+        
+        if not(cache_current) and self.is_current(SQL_statement):
+            self._lock_.acquire()
+            self._skipped_ = self._skipped_ + 1
+            self._lock_.release()
+            return False
+        
+        """ Rows are shared between callers and must not be mutable """
+        rows = tuple([tuple(row) for row in rows])
+        key = self.get_key(db_key, SQL_statement)
+        size = self._estimate_size(rows) + sys.getsizeof(key[1])
+        
+        self._lock_.acquire()
+        
+        try:
+            self._entries_.put(key, (time.time() + ttl, rows), weight=size)
+        finally:
+            self._lock_.release()
+        
+        return True
+    
+    def clear(self):
+        
+        self._lock_.acquire()
+        
+        try:
+            self._entries_.clear()
+        finally:
+            self._lock_.release()
+    
+    """
+        @return: dict of entries, bytes, max_bytes, evictions, hits, misses, expired, skipped and hit_rate
+    """
+    def get_stats(self):
+        
+        self._lock_.acquire()
+        
+        try:
+            entry_stats = self._entries_.get_stats()
+            lookups = self._hits_ + self._misses_
+            hit_rate = float(self._hits_) / lookups if lookups else 0.0
+            
+            return {'entries' : entry_stats['size'], 'bytes' : entry_stats['weight'], 'max_bytes' : entry_stats['max_weight'], \
+                    'evictions' : entry_stats['evictions'], 'hits' : self._hits_, 'misses' : self._misses_, 'expired' : self._expired_, \
+                    'skipped' : self._skipped_, 'hit_rate' : hit_rate}
+        
+        finally:
+            self._lock_.release()
+
+
+""" Results of execute_SQL statements run with a cache_ttl, shared by all DataLoader objects in this process """
+query_cache = QueryCache()
+
+
 """
 
     BASE CLASS :: DataLoader
@@ -58,6 +544,9 @@ class DataLoader(object):
     ONE_STEP_PATTERN = '_1S'
     BANNER_PATTERN = 'B_'
     
+    """ Number of rows fetched from the server per round trip when streaming results """
+    _STREAM_FETCH_SIZE_ = 1000
+    
     """
         Constructor
         
@@ -78,36 +567,72 @@ class DataLoader(object):
         self._was_run_ = False
         
         
+    def __del__(self):
+        self.close_db()
+    
+    """
+        Supports use as a context manager - the connection is returned to the pool when the with block exits
+        
+        e.g.    with DL.CiviCRMLoader() as ccl:
+                    ...
+    """
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close_db()
+        return False
+    
+    """
+        Borrow a connection from the process-wide pool, the kwarg 'db' selects the host
+    """
     def init_db(self, **kwargs):
         
         """ Establish connection """
+        self._db_key_ = ConnectionPool.DEFAULT_DB
         if 'db' in kwargs:
-            if kwargs['db'] == 'storage3':
-                self._db_ = MySQLdb.connect(host=projSet.__db_storage3__, user=projSet.__user__, db=projSet.__db__, port=projSet.__db_port__, passwd=projSet.__pass__)
-            elif kwargs['db'] == 'db1008':
-                self._db_ = MySQLdb.connect(host=projSet.__db_db1008__, user=projSet.__user__, db=projSet.__db__, port=projSet.__db_port__, passwd=projSet.__pass__)
-            elif kwargs['db'] == 'db1025':
-                self._db_ = MySQLdb.connect(host=projSet.__db_db1025__, user=projSet.__user__, db=projSet.__db__, port=projSet.__db_port__, passwd=projSet.__pass__)
-        else:
-            self._db_ = MySQLdb.connect(host=projSet.__db_server__, user=projSet.__user__, db=projSet.__db__, port=projSet.__db_port__, passwd=projSet.__pass__)
-        #self._db_ = MySQLdb.connect(host=projSet.__db_server__, user=projSet.__user__, db=projSet.__db__, port=projSet.__db_port__)
+            if kwargs['db'] in ['storage3', 'db1008', 'db1025']:
+                self._db_key_ = kwargs['db']
+        
+        self._db_ = None
+        self._db_ = connection_pool.checkout(self._db_key_)
         
         """ Create cursor """
         self._cur_ = self._db_.cursor()
     
+    """
+        Release the connection - pooled connections are returned to the pool, connections opened directly are closed.  
+        Safe to call more than once.
+    """
     def close_db(self):
-        self._cur_.close()
-        self._db_.close()
+        
+        db = getattr(self, '_db_', None)
+        if db == None:
+            return
+        
+        self._db_ = None
+        
+        try:
+            self._cur_.close()
+        except MySQLdb.Error:
+            pass
+        
+        if self._db_key_ != None and connection_pool != None:
+            connection_pool.checkin(self._db_key_, db)
+        else:
+            db.close()
         
     def establish_faulkner_conn(self):
         
         self.close_db()
+        self._db_key_ = None
         self._db_ = MySQLdb.connect(host=projSet.__db_server__, user=projSet.__user__, db=projSet.__db__, port=projSet.__db_port__)
         self._cur_ = self._db_.cursor()
     
     def establish_enwiki_conn(self):
         
         self.close_db()
+        self._db_key_ = None
         self._db_ = MySQLdb.connect(host=projSet.__db_server_internproxy__, user=projSet.__user_internproxy__, db=projSet.__db_internproxy__, port=projSet.__db_port_internproxy__, passwd=projSet.__pass_internproxy__)
         self._cur_ = self._db_.cursor()
     
@@ -225,12 +750,38 @@ class DataLoader(object):
     """
         Executes a SQL statement and return the raw results.  This is good for generic queries.
         
+        Results are served from query_cache when the kwarg cache_ttl (seconds) is given - statements reaching into the 
+        current window are only cached if the kwarg cache_current is also True.  Cached results are returned as tuples.
+        
     """
-    def execute_SQL(self, SQL_statement):
+    def execute_SQL(self, SQL_statement, **kwargs):
+        
+        cache_ttl = 0
+        cache_current = False
+        
+        if 'cache_ttl' in kwargs:
+            if isinstance(kwargs['cache_ttl'], (int, float)) and kwargs['cache_ttl'] > 0:
+                cache_ttl = kwargs['cache_ttl']
+        if 'cache_current' in kwargs:
+            cache_current = kwargs['cache_current'] == True
+        
+        """ Connections opened outside of the pool have no db key to distinguish their hosts and are not cached """
+        if self._db_key_ == None:
+            cache_ttl = 0
+        
+        if cache_ttl:
+            results = query_cache.get(self._db_key_, SQL_statement)
+            if results != None:
+                return results
         
         try:
             self._cur_.execute(SQL_statement)
-            return self._cur_.fetchall()
+            results = self._cur_.fetchall()
+            
+            if cache_ttl:
+                query_cache.put(self._db_key_, SQL_statement, results, cache_ttl, cache_current=cache_current)
+            
+            return results
         
         except Exception as inst:
             
@@ -244,6 +795,41 @@ class DataLoader(object):
             
             return -1
     
+    """
+        Executes a SQL statement with a server-side cursor (MySQLdb.cursors.SSCursor) and returns a generator over the 
+        result rows.  Rows are fetched from the server _STREAM_FETCH_SIZE_ at a time rather than buffered in full on the 
+        client so memory use does not depend on the size of the result.  The column names are stored in _col_names_.
+        
+        No other statement may be run on the connection until the generator is exhausted or closed.  Unlike execute_SQL 
+        errors are raised to the caller.
+    """
+    def stream_SQL(self, SQL_statement):
+        
+        cur = self._db_.cursor(MySQLdb.cursors.SSCursor)
+        
+        try:
+            cur.execute(SQL_statement)
+        except:
+            cur.close()
+            raise
+        
+        self._col_names_ = list()
+        for elem in cur.description:
+            self._col_names_.append(elem[0])
+        
+        return self._stream_rows(cur)
+    
+    def _stream_rows(self, cur):
+        
+        try:
+            rows = cur.fetchmany(self._STREAM_FETCH_SIZE_)
+            while rows:
+                for row in rows:
+                    yield row
+                rows = cur.fetchmany(self._STREAM_FETCH_SIZE_)
+        finally:
+            cur.close()
+    
     """
         Takes raw results from a cursor object and sorts them based on a tuple unsigned integer key value
     """
@@ -411,6 +997,9 @@ class LongTermTrendsLoader(DataLoader):
         include_other = False
         include_total = True
         hours_back = 24
+        weight_name = ''
+        time_unit = TP.HOUR
+        stream = False
         
         """ Process keys -- Escape parameters """
         for key in kwargs_dict:
@@ -474,22 +1063,36 @@ class LongTermTrendsLoader(DataLoader):
                 except:
                     logging.info('LTT Loader::process_kwargs - Not a valid integer value for time_unit kwarg')
                     pass
+            
+            # stream the query results rather than fetching them in full
+            elif key == 'stream':
+                stream = kwargs_dict[key] == True
 
 
         return min_val, campaign, metric_name, metric_type, groups, group_metric, include_other, \
-                    include_total, hours_back, weight_name, time_unit
+                    include_total, hours_back, weight_name, time_unit, stream
     
     """
-        Based on the query type provided execute a query
+        Build the statement for a query type.  Only the time range, hours_back and time_unit kwargs affect the statement - 
+        the remaining kwargs of run_query only affect how its rows are parsed so runs that differ only in those can share 
+        the rows of one execution (see run_query's results kwarg).
+        
+        RETURN: 
+                sql                 - the statement, None for query type 7
+                start_time          - the start of the range truncated to the time unit
+                end_time            - the end of the range truncated to the time unit
     """
-    def run_query(self, start_time, end_time, query_type, **kwargs):
+    def format_query(self, start_time, end_time, query_type, **kwargs):
                         
         """ Escape timestamps """
         start_time = MySQLdb._mysql.escape_string(str(start_time).strip())
         end_time = MySQLdb._mysql.escape_string(str(end_time).strip())
                 
-        min_val, campaign, metric_name, metric_type, groups, \
-        group_metric, include_other, include_total, hours_back, weight_name, time_unit = self.process_kwargs(kwargs)
+        ret = self.process_kwargs(kwargs)
+        hours_back = ret[8]
+        time_unit = ret[10]
+        
+        sql = None
         
         if time_unit == TP.DAY:            
             start_time = TP.timestamp_convert_format(start_time, 0, 1)
@@ -504,57 +1107,50 @@ class LongTermTrendsLoader(DataLoader):
             end_time = end_time[:10] + '0000'
 
         """
-            FORMAT ND EXECUTE QUERY
+            FORMAT QUERY
         """
         if query_type == 0: 
             
             logging.info('Executing query for long term banner impressions ...')
-            sql = "select concat(DATE_FORMAT(on_minute,'%sY%sm%sd%sH'), '0000') as hr, country, lang as language, sum(counts) as impressions from banner_impressions " + \
-            "where on_minute >= '%s' and on_minute < '%s' group by 1,2,3 order by 1,2,3"
+            sql = "select DATE_FORMAT(hr,'%sY%sm%sd%sH0000') as hr, nullif(country, '') as country, nullif(language, '') as language, impressions from ltt_hourly_impressions " + \
+            "where hr >= '%s' and hr < '%s' order by 1,2,3"
             sql = sql % ('%', '%', '%', '%', start_time, end_time)
             
         elif query_type == 1:
             
             logging.info('Executing query for long term LP impressions ...')
-            sql = "select concat(DATE_FORMAT(request_time,'%sY%sm%sd%sH'), '0000') as hr, country, lang as language, count(*) as views from landing_page_requests " + \
-            "where request_time >= '%s' and request_time < '%s' group by 1,2,3 order by 1,2,3"
+            sql = "select DATE_FORMAT(hr,'%sY%sm%sd%sH0000') as hr, nullif(country, '') as country, nullif(language, '') as language, views from ltt_hourly_views " + \
+            "where hr >= '%s' and hr < '%s' order by 1,2,3"
             sql = sql % ('%', '%', '%', '%', start_time, end_time)
             
         elif query_type == 2:
             
             logging.info('Executing query for long term donations based on country ...')
-            sql = "select concat(DATE_FORMAT(receive_date,'%sY%sm%sd%sH'), '0000') as hr, iso_code as country, language, count(*) as donations, sum(total_amount) as amount " + \
-            "from civicrm.civicrm_contribution join civicrm.civicrm_address on civicrm.civicrm_contribution.contact_id = civicrm.civicrm_address.contact_id " + \
-            "join civicrm.civicrm_country on civicrm.civicrm_address.country_id = civicrm.civicrm_country.id " + \
-            "join drupal.contribution_tracking on civicrm.civicrm_contribution.id = drupal.contribution_tracking.contribution_id " + \
-            "where receive_date >= '%s' and receive_date < '%s' group by 1,2,3 order by 1,2,3"
+            sql = "select DATE_FORMAT(hr,'%sY%sm%sd%sH0000') as hr, nullif(country, '') as country, nullif(language, '') as language, donations, amount from ltt_hourly_donations " + \
+            "where hr >= '%s' and hr < '%s' order by 1,2,3"
             sql = sql % ('%', '%', '%', '%', start_time, end_time)
             
         elif query_type == 3:
             
             logging.info('Executing query for long term click rate ...')
-            sql = "select bi.hr, bi.country, bi.lang as language, views / impressions as click_rate from (select concat(DATE_FORMAT(on_minute,'%sY%sm%sd%sH'), '0000') as hr, country, lang, sum(counts) as impressions from banner_impressions " + \
-            "where on_minute >= '%s' and on_minute < '%s' group by 1,2,3) as bi join (select concat(DATE_FORMAT(request_time,'%sY%sm%sd%sH'), '0000') as hr, country, lang, count(*) as views from landing_page_requests " + \
-            "where request_time >= '%s' and request_time < '%s'  group by 1,2,3) as lpi on bi.hr = lpi.hr and bi.country = lpi.lang and bi.country = lpi.lang order by 1,2,3"
-            sql = sql % ('%', '%', '%', '%', start_time, end_time, '%', '%', '%', '%', start_time, end_time)
+            sql = "select DATE_FORMAT(bi.hr,'%sY%sm%sd%sH0000') as hr, nullif(bi.country, '') as country, nullif(bi.language, '') as language, lpi.views / bi.impressions as click_rate " + \
+            "from ltt_hourly_impressions as bi join ltt_hourly_views as lpi on bi.hr = lpi.hr and bi.country = lpi.country and bi.language = lpi.language " + \
+            "where bi.hr >= '%s' and bi.hr < '%s' order by 1,2,3"
+            sql = sql % ('%', '%', '%', '%', start_time, end_time)
         
         elif query_type == 4:
 
             logging.info('Executing query for long term donations based on currency ...')
-            sql = "select concat(DATE_FORMAT(receive_date,'%sY%sm%sd%sH'), '0000') as hr, substring(source,1,3) as currency, count(*) as donations, sum(total_amount) as amount " + \
-            "from civicrm.civicrm_contribution " + \
-            "where receive_date >= '%s' and receive_date < '%s' group by 1,2 order by 1,2"
+            sql = "select DATE_FORMAT(hr,'%sY%sm%sd%sH0000') as hr, nullif(currency, '') as currency, donations, amount from ltt_hourly_currency " + \
+            "where hr >= '%s' and hr < '%s' order by 1,2"
             sql = sql % ('%', '%', '%', '%', start_time, end_time)
             
         elif query_type == 5:
 
             logging.info('Executing query for percentage difference in donations ...')
             
-            sql = "select concat(DATE_FORMAT(receive_date,'%sY%sm%sd%sH'), '0000') as hr, iso_code as country, language, count(*) as donations, sum(total_amount) as amount " + \
-            "from civicrm.civicrm_contribution join civicrm.civicrm_address on civicrm.civicrm_contribution.contact_id = civicrm.civicrm_address.contact_id " + \
-            "join civicrm.civicrm_country on civicrm.civicrm_address.country_id = civicrm.civicrm_country.id " + \
-            "join drupal.contribution_tracking on civicrm.civicrm_contribution.id = drupal.contribution_tracking.contribution_id " + \
-            "where receive_date >= '%s' and receive_date < '%s' group by 1,2,3 order by 1,2,3"
+            sql = "select DATE_FORMAT(hr,'%sY%sm%sd%sH0000') as hr, country, language, donations, amount from ltt_hourly_donations " + \
+            "where hr >= '%s' and hr < '%s'"
             
             end_time_obj = TP.timestamp_to_obj(end_time, 1)
             start_time_obj = TP.timestamp_to_obj(end_time, 1) + datetime.timedelta(hours=-24)
@@ -570,7 +1166,7 @@ class LongTermTrendsLoader(DataLoader):
             start_time = start_time_2
             end_time = end_time_2
             
-            sql = "select t_new.hr, t_new.country, t_new.language," + \
+            sql = "select t_new.hr, nullif(t_new.country, '') as country, nullif(t_new.language, '') as language," + \
             "(t_new.donations - t_old.donations) * 100.0 as diff_don, " + \
             "(t_new.amount - t_old.amount) * 100.0 as diff_amt, " + \
             "t_old.donations, t_old.amount " + \
@@ -581,22 +1177,31 @@ class LongTermTrendsLoader(DataLoader):
             
             logging.info('Executing query for long term donations based on payment method ...')
             
-            sql = "select concat(DATE_FORMAT(ts,'%sY%sm%sd%sH'), '0000') as hr, substring_index(utm_source, '.', -1) as payment_method, " + \
-            "sum(not isnull(drupal.contribution_tracking.contribution_id)) as donations, sum(total_amount) as amount, " + \
-            "sum(not isnull(drupal.contribution_tracking.contribution_id)) / count(*) as conversion_rate " + \
-            "from drupal.contribution_tracking left join civicrm.civicrm_contribution on civicrm.civicrm_contribution.id = drupal.contribution_tracking.contribution_id " + \
-            "where ts >= '%s' and ts < '%s' group by 1,2 order by 1,2"
+            sql = "select DATE_FORMAT(hr,'%sY%sm%sd%sH0000') as hr, nullif(payment_method, '') as payment_method, donations, amount, " + \
+            "donations / attempts as conversion_rate from ltt_hourly_payments " + \
+            "where hr >= '%s' and hr < '%s' order by 1,2"
             sql = sql % ('%', '%', '%', '%', start_time, end_time)
             
-        elif query_type == 7:
+        return sql, start_time, end_time
+    
+    """
+        Based on the query type provided execute a query
+        
+        Rows already fetched for the statement built by format_query may be passed with the kwargs 'results' and 
+        'column_names', the query is then not executed.
+    """
+    def run_query(self, start_time, end_time, query_type, **kwargs):
+        
+        min_val, campaign, metric_name, metric_type, groups, \
+        group_metric, include_other, include_total, hours_back, weight_name, time_unit, stream = self.process_kwargs(kwargs)
+        
+        sql, start_time, end_time = self.format_query(start_time, end_time, query_type, **kwargs)
+        
+        if query_type == 7:
             
             self.run_fundrasing_totals(end_time)
              
             
-        if not(query_type == 7):        
-            self._results_ = self.execute_SQL(sql)
-        
-
         """ Parse data from query results - organize into keys based on country """
 
         counts = dict()
@@ -604,8 +1209,50 @@ class LongTermTrendsLoader(DataLoader):
         group_counts = dict()
         weight_counts = dict()
         
-        self.parse_results(self._results_, times, counts, groups, group_counts, weight_counts, weight_name, include_other, metric_name, metric_type, group_metric)
-                                                
+        if 'results' in kwargs and not(query_type == 7):
+            
+            self._results_ = kwargs['results']
+            self.parse_results(self._results_, times, counts, groups, group_counts, weight_counts, weight_name, include_other, metric_name, \
+                               metric_type, group_metric, column_names=kwargs['column_names'])
+        
+        elif stream and not(query_type == 7):
+            
+            """ Rows are parsed as they arrive from the server and are not retained in _results_ """
+            self._results_ = None
+            
+            try:
+                rows = self.stream_SQL(sql)
+                
+                try:
+                    self.parse_results(rows, times, counts, groups, group_counts, weight_counts, weight_name, include_other, metric_name, \
+                                       metric_type, group_metric, column_names=self._col_names_)
+                finally:
+                    rows.close()
+            
+            except Exception as inst:
+                
+                self._db_.rollback()
+                
+                logging.error('Could not stream: ' + sql)
+                logging.error(str(type(inst)))      # the exception instance
+                logging.error(str(inst.args))       # arguments stored in .args
+                logging.error(inst.__str__())       # __str__ allows args to printed directly
+        
+        else:
+            if not(query_type == 7):        
+                self._results_ = self.execute_SQL(sql)
+            
+            self.parse_results(self._results_, times, counts, groups, group_counts, weight_counts, weight_name, include_other, metric_name, metric_type, group_metric)
+        
+        self.complete_query(start_time, end_time, times, counts, group_counts, weight_counts, metric_type, include_total, time_unit)
+        
+        return times, counts
+    
+    """
+        The processing of the parsed rows of a query common to run_query and run_shared_query
+    """
+    def complete_query(self, start_time, end_time, times, counts, group_counts, weight_counts, metric_type, include_total, time_unit):
+        
         """ If the metric is a rate ensure that all of the samples are averaged over the number of keys """        
         self.average_rates(counts, metric_type, weight_counts=weight_counts, group_counts=group_counts)
                         
@@ -615,8 +1262,59 @@ class LongTermTrendsLoader(DataLoader):
         """ Add in the totals """
         if include_total:
             self.add_totals(counts, times, metric_type, weight_counts=weight_counts)
+    
+    """
+        Runs the metrics that share one statement (see format_query) with a single streamed execution.  Each chunk of rows 
+        fetched from the server is parsed for every metric before the next is fetched, so the rows are never held in full.  
+        parse_results keeps its state in the dicts it is given, which makes parsing in chunks the same as parsing all rows.  
+        Errors are raised to the caller.
         
-        return times, counts
+        INPUT:
+                metric_args     - list of (query_type, time_unit, run_kwargs) of the metrics sharing the statement
+        
+        RETURN: 
+                list of (times, counts), one for each entry of metric_args
+    """
+    def run_shared_query(self, start_time, end_time, metric_args):
+        
+        metric_state = list()
+        
+        for query_type, time_unit, run_kwargs in metric_args:
+            
+            kwargs = dict(run_kwargs)
+            kwargs['time_unit'] = time_unit
+            
+            sql, query_start, query_end = self.format_query(start_time, end_time, query_type, **kwargs)
+            metric_state.append((self.process_kwargs(kwargs), query_start, query_end, dict(), dict(), dict(), dict()))
+        
+        self._results_ = None
+        rows = self.stream_SQL(sql)
+        
+        try:
+            chunk = list(itertools.islice(rows, self._STREAM_FETCH_SIZE_))
+            
+            while chunk:
+                
+                for query_kwargs, query_start, query_end, times, counts, group_counts, weight_counts in metric_state:
+                    
+                    metric_name, metric_type, groups, group_metric, include_other, weight_name = \
+                        query_kwargs[2], query_kwargs[3], query_kwargs[4], query_kwargs[5], query_kwargs[6], query_kwargs[9]
+                    
+                    self.parse_results(chunk, times, counts, groups, group_counts, weight_counts, weight_name, include_other, metric_name, \
+                                       metric_type, group_metric, column_names=self._col_names_)
+                
+                chunk = list(itertools.islice(rows, self._STREAM_FETCH_SIZE_))
+        finally:
+            rows.close()
+        
+        series = list()
+        
+        for query_kwargs, query_start, query_end, times, counts, group_counts, weight_counts in metric_state:
+            
+            self.complete_query(query_start, query_end, times, counts, group_counts, weight_counts, query_kwargs[3], query_kwargs[7], query_kwargs[10])
+            series.append((times, counts))
+        
+        return series
     
 
     """
@@ -768,31 +1466,20 @@ class LongTermTrendsLoader(DataLoader):
     """
     def normalize_data(self, start_time, end_time, counts, times, time_unit):
         
-        for key in counts:
-
-            start_time_obj = TP.timestamp_to_obj(start_time, 1)
-            end_time_obj = TP.timestamp_to_obj(end_time, 1)
-            diff = end_time_obj - start_time_obj
-            
-            if time_unit == TP.HOUR:
-                num_hours = diff.seconds / (60 * 60) + diff.days * 24            
-                ts_list = TP.create_timestamp_list(start_time_obj, num_hours, 60)
-            
-            elif time_unit == TP.DAY:
-                num_days = diff.seconds / (24 * 60 * 60) + diff.days            
-                ts_list = TP.create_timestamp_list(start_time_obj, num_days, 60 * 24)
-            
-            new_counts = list()
-            count_index = 0
-            for ts in ts_list:
-                if not(ts in times[key]):                
-                    new_counts.append(0.0)
-                else:
-                    new_counts.append(counts[key][count_index])
-                    count_index = count_index + 1
-                    
-            counts[key] = new_counts
-            times[key] = ts_list
+        start_time_obj = TP.timestamp_to_obj(start_time, 1)
+        end_time_obj = TP.timestamp_to_obj(end_time, 1)
+        diff = end_time_obj - start_time_obj
+        
+        interval = TP.UNIT_MINUTES[time_unit]
+        num_samples = (diff.days * 24 * 60 + diff.seconds / 60) / interval
+        ts_list = TP.create_timestamp_list(start_time_obj, num_samples, interval)
+        
+        """ Reindex all keys on the sampling grid at once - missing samples are zero filled """
+        new_times, new_counts = TP.align_to_grid(times, counts, interval, start=start_time_obj, end=ts_list[-1])
+        
+        for key in new_counts:
+            counts[key] = new_counts[key].tolist()
+            times[key] = list(ts_list)
         
     
     """
@@ -802,9 +1489,13 @@ class LongTermTrendsLoader(DataLoader):
          
             1) Chronological time lists (timestamps)
     """    
-    def parse_results(self, results, times, counts, groups, group_counts, weight_counts, weight_name, include_other, metric_name, metric_type, group_metric):
+    def parse_results(self, results, times, counts, groups, group_counts, weight_counts, weight_name, include_other, metric_name, metric_type, group_metric, **kwargs):
+        
+        if 'column_names' in kwargs:
+            column_names = kwargs['column_names']
+        else:
+            column_names = self.get_column_names()
         
-        column_names = self.get_column_names()
         metric_index = column_names.index(metric_name)
         
         if metric_type == self._MT_RATE_WEIGHTED_:
@@ -814,7 +1505,7 @@ class LongTermTrendsLoader(DataLoader):
         for metric in group_metric:
             key_indices.append(column_names.index(metric))
             
-        for row in self._results_:
+        for row in results:
             
             """ The key for group matching is a concatenation of the metric field values (e.g. "USen" for country and language ) """
             key = ''
@@ -1096,6 +1787,227 @@ class SummaryReportingLoader(DataLoader):
         
         return winner, loser, percent_increase
     
+"""
+
+    CLASS :: IntervalResults
+    
+    Columnar representation of the results of an interval reporting query.  Rows are bucketed onto a uniform grid of 
+    sampling intervals running from the start time to the end time.  Each numeric column of the query is held as a float64 
+    array of shape (number of artifacts, number of grid points), with one row per artifact key (e.g. banner name).  Intervals 
+    without data are 0.0.
+    
+    METHODS:
+            load_rows       - bucket query rows onto the grid in one pass
+            update          - add, or replace, the artifacts of another IntervalResults over the same grid
+            regrid          - copy the results onto a new range with the same interval
+            splice          - replace the grid points covered by another IntervalResults with its values
+            get_keys        - the artifact keys
+            get_times       - the grid as a datetime64 array
+            get_metric      - the (artifacts x grid points) array of a metric
+            get_series      - per artifact metric and time arrays in the layout used by the reporting classes
+    
+"""
+class IntervalResults(object):
+    
+    _CHUNK_SIZE_ = 50000
+    
+    def __init__(self, start_time_obj, end_time_obj, interval):
+        
+        self._interval_ = interval
+        self._start_ = np.datetime64(start_time_obj, 'm')
+        
+        num_points = int((np.datetime64(end_time_obj, 'm') - self._start_) / np.timedelta64(interval, 'm')) + 1
+        self._times_ = self._start_ + np.arange(max(num_points, 1)) * np.timedelta64(interval, 'm')
+        
+        self._keys_ = list()
+        self._key_index_ = dict()
+        self._metrics_ = dict()
+    
+    """
+        Bucket query rows onto the grid.  Non-numeric columns (e.g. artifact names) are skipped and NULL values become 0.0.  
+        Rows outside of the grid are dropped.  Rows are consumed _CHUNK_SIZE_ at a time so that a streamed result is never 
+        held in full.
+        
+        @param rows: iterable of query result rows
+        @param col_names: the column names of the rows
+        @param key_func: function mapping a row to its artifact key
+        @param time_index: index of the 14-digit timestamp column
+    """
+    def load_rows(self, rows, col_names, key_func, time_index):
+        
+        rows = iter(rows)
+        chunk = list(itertools.islice(rows, self._CHUNK_SIZE_))
+        
+        while chunk:
+            self._load_chunk(chunk, col_names, key_func, time_index)
+            chunk = list(itertools.islice(rows, self._CHUNK_SIZE_))
+    
+    def _load_chunk(self, rows, col_names, key_func, time_index):
+        
+        columns = zip(*rows)
+        
+        key_column = list()
+        for key in [key_func(row) for row in rows]:
+            if not(key in self._key_index_):
+                self._key_index_[key] = len(self._keys_)
+                self._keys_.append(key)
+            key_column.append(self._key_index_[key])
+        
+        key_column = np.array(key_column, dtype=np.int64)
+        grid_column = (TP.timestamp_list_to_datetime64(columns[time_index]) - self._start_) // np.timedelta64(self._interval_, 'm')
+        grid_column = grid_column.astype(np.int64)
+        
+        in_range = (grid_column >= 0) & (grid_column < len(self._times_))
+        key_column = key_column[in_range]
+        grid_column = grid_column[in_range]
+        
+        for col_index in range(len(col_names)):
+            
+            if col_index == time_index:
+                continue
+            
+            try:
+                values = np.array(columns[col_index], dtype=np.float64)[in_range]
+            except (TypeError, ValueError):
+                continue
+            
+            values[np.isnan(values)] = 0.0
+            
+            metric = self._get_metric_array(col_names[col_index])
+            metric[key_column, grid_column] = values
+    
+    """
+        Returns the array for a metric, extended with zero rows for any artifacts added since it was created
+    """
+    def _get_metric_array(self, metric_name):
+        
+        if not(metric_name in self._metrics_):
+            self._metrics_[metric_name] = np.zeros((0, len(self._times_)))
+        
+        metric = self._metrics_[metric_name]
+        
+        if metric.shape[0] < len(self._keys_):
+            metric = np.vstack([metric, np.zeros((len(self._keys_) - metric.shape[0], len(self._times_)))])
+            self._metrics_[metric_name] = metric
+        
+        return metric
+    
+    """
+        Merge the artifacts of another result over the same grid - artifacts present in both take the values of other
+    """
+    def update(self, other):
+        
+        for key in other.get_keys():
+            if not(key in self._key_index_):
+                self._key_index_[key] = len(self._keys_)
+                self._keys_.append(key)
+        
+        for metric_name in other._metrics_:
+            
+            metric = self._get_metric_array(metric_name)
+            other_metric = other._get_metric_array(metric_name)
+            
+            for key in other.get_keys():
+                metric[self._key_index_[key]] = other_metric[other._key_index_[key]]
+    
+    """
+        Copy the results onto the grid from start_time_obj to end_time_obj (floored to the interval as in the constructor).  
+        Points outside of the current grid are 0.0, those outside of the new grid are dropped along with any artifacts left 
+        without data.
+        
+        @return: a new IntervalResults object
+    """
+    def regrid(self, start_time_obj, end_time_obj):
+        
+        results = IntervalResults(start_time_obj, end_time_obj, self._interval_)
+        offset = int((self._start_ - results._start_) / np.timedelta64(self._interval_, 'm'))
+        
+        lower = max(0, -offset)
+        upper = min(len(self._times_), len(results._times_) - offset)
+        
+        if upper <= lower:
+            return results
+        
+        """ Keep only the artifacts with data in the new range """
+        has_data = np.zeros(len(self._keys_), dtype=bool)
+        for metric_name in self._metrics_:
+            has_data |= np.any(self._get_metric_array(metric_name)[:, lower:upper] != 0.0, axis=1)
+        
+        key_rows = np.nonzero(has_data)[0]
+        for row in key_rows:
+            results._key_index_[self._keys_[row]] = len(results._keys_)
+            results._keys_.append(self._keys_[row])
+        
+        for metric_name in self._metrics_:
+            metric = results._get_metric_array(metric_name)
+            metric[:, lower + offset:upper + offset] = self._get_metric_array(metric_name)[key_rows, lower:upper]
+        
+        return results
+    
+    """
+        Replace the grid points covered by other, a result with the same interval, by its values.  Every artifact is 
+        reset to 0.0 over those points first so that the values are those other would give over the full range.
+    """
+    def splice(self, other):
+        
+        offset = int((other._start_ - self._start_) / np.timedelta64(self._interval_, 'm'))
+        
+        lower = max(0, offset)
+        upper = min(len(self._times_), len(other._times_) + offset)
+        
+        if upper <= lower:
+            return
+        
+        for key in other.get_keys():
+            if not(key in self._key_index_):
+                self._key_index_[key] = len(self._keys_)
+                self._keys_.append(key)
+        
+        for metric_name in set(self._metrics_.keys()) | set(other._metrics_.keys()):
+            self._get_metric_array(metric_name)[:, lower:upper] = 0.0
+        
+        key_rows = [self._key_index_[key] for key in other.get_keys()]
+        
+        for metric_name in other._metrics_:
+            metric = self._get_metric_array(metric_name)
+            metric[key_rows, lower:upper] = other._get_metric_array(metric_name)[:, lower - offset:upper - offset]
+    
+    def get_keys(self):
+        return list(self._keys_)
+    
+    def get_times(self):
+        return self._times_
+    
+    def get_metric(self, metric_name):
+        return self._get_metric_array(metric_name)
+    
+    """
+        Produces per artifact metric and time arrays in the layout of the time series filtered reporting data - times are 
+        minutes from the start of the range, one point per grid interval, and the value at each point is the metric of the 
+        interval ending there (the first point repeats the first interval).
+        
+        @return: [metrics, times] - dicts keyed on artifact holding float64 arrays
+    """
+    def get_series(self, metric_name):
+        
+        metric = self._get_metric_array(metric_name)
+        
+        shifted = np.empty(metric.shape)
+        shifted[:, 1:] = metric[:, :-1]
+        shifted[:, 0] = metric[:, 0]
+        
+        minutes = np.arange(len(self._times_)) * float(self._interval_)
+        
+        metrics = dict()
+        times = dict()
+        
+        for key in self._keys_:
+            metrics[key] = shifted[self._key_index_[key]]
+            times[key] = minutes.copy()
+        
+        return [metrics, times]
+
+
 """
 
     This Loader inherits the functionality of DaatLoader and handles SQL queries that group data by time intervals.  These are generally preferable for most
@@ -1193,6 +2105,49 @@ class IntervalReportingLoader(DataLoader):
                 
         return metrics, times, results
     
+    """
+        Columnar counterpart of run_query - handles both one step and two step banners and returns an IntervalResults object 
+        holding every metric of the query.  Accepts the same kwargs as run_query_base.
+    """
+    def run_query_columnar(self, start_time, end_time, interval, campaign, **kwargs):
+        
+        one_step_var = self.process_kwargs(kwargs)            
+        
+        query_name = self.get_sql_filename_for_query()
+        logging.info('Using query: ' + query_name)
+        
+        if self.get_one_step_banners(start_time, end_time, campaign) or one_step_var:
+            
+            logging.info('Using one-step query...')
+            results = self.run_query_columnar_base(start_time, end_time, interval, campaign, query_name + '_1S', **kwargs)
+            results.update(self.run_query_columnar_base(start_time, end_time, interval, campaign, query_name, **kwargs))
+        
+        else:
+            results = self.run_query_columnar_base(start_time, end_time, interval, campaign, query_name, **kwargs)
+        
+        return results
+    
+    """
+        Same as run_query but the metric and time series are built from an IntervalResults object - numpy arrays already 
+        aligned on the sampling interval grid (see IntervalResults.get_series).  With the kwarg 'results', an IntervalResults 
+        object already covering the range, no query is executed.
+        
+        RETURN: 
+                metrics        - dict of metric arrays keyed on donation pipeline handle
+                times          - dict of time arrays (minutes from start_time) keyed on donation pipeline handle
+                results        - the IntervalResults object
+    """
+    def run_query_series(self, start_time, end_time, interval, metric_name, campaign, **kwargs):
+        
+        if 'results' in kwargs:
+            results = kwargs['results']
+        else:
+            results = self.run_query_columnar(start_time, end_time, interval, campaign, **kwargs)
+        
+        metrics, times = results.get_series(metric_name)
+        
+        return metrics, times, results
+    
     """
         Executes the query which generates interval metrics and sets _results_ and _col_names_
         
@@ -1203,6 +2158,9 @@ class IntervalReportingLoader(DataLoader):
                 query_type        - query type: 'banner', 'campaign', 'LP'
                 metric_name       - the metric to report
                 campaign          - the campaign on which to select
+                stream            - (kwarg) boolean, stream rows from a server-side cursor into metrics and times rather 
+                                    than fetching them in full.  The rows are not retained - _results_ is returned empty 
+                                    and the query is re-executed by the next call.
                 
             
         RETURN: 
@@ -1211,6 +2169,14 @@ class IntervalReportingLoader(DataLoader):
                 _results_      - list containing the rows generated by the query
     """
     def run_query_base(self, start_time, end_time, interval, metric_name, campaign, query_name, **kwargs):
+        
+        stream = False
+        if 'stream' in kwargs:
+            stream = kwargs['stream'] == True
+            del kwargs['stream']
+            
+            if stream:
+                self._was_run_ = False
                         
         metrics = Hlp.AutoVivification()
         times = Hlp.AutoVivification()        
@@ -1227,26 +2193,26 @@ class IntervalReportingLoader(DataLoader):
     
         """ QUERY PREP - ONLY EXECUTED IF THE QUERY HAS NOT BEEN RUN ALREADY """
         if not(self._was_run_):
-
-            """ Load the SQL File & Format """
-            filename = projSet.__sql_home__+ query_name + '.sql'
-            sql_stmnt = Hlp.file_to_string(filename)
-            
-            campaign = MySQLdb._mysql.escape_string(str(campaign))
-            start_time = MySQLdb._mysql.escape_string(str(start_time).strip())
-            end_time = MySQLdb._mysql.escape_string(str(end_time).strip())
-            interval = int(MySQLdb._mysql.escape_string(str(interval)))
-            
-            sql_stmnt = QD.format_query(query_name, sql_stmnt, [start_time, end_time, campaign, interval], **kwargs)
+            sql_stmnt = self.format_interval_query(start_time, end_time, interval, campaign, query_name, **kwargs)
             
         """ Get Indexes into Query """
         metric_index = QD.get_metric_index(query_name, metric_name)
         time_index = QD.get_metric_index(query_name, 'day_hr')
 
+        final_time = dict()                                     # stores the last timestamp seen
+        rows = list()
+        
         """ Compose the data for each separate donor pipeline artifact """
         try:
             """ ONLY EXECUTE THE QUERY IF IT HASN'T BEEN BEFORE """
-            if not(self._was_run_):
+            if stream:
+                logging.info('Running query (streaming results) ...')
+                
+                """ Column names are set on execution, rows are consumed as they arrive """
+                rows = self.stream_SQL(sql_stmnt)
+                self._results_ = list()
+                
+            elif not(self._was_run_):
                 logging.info('Running query ...')
                 
                 self._cur_.execute(sql_stmnt)                 
@@ -1260,10 +2226,12 @@ class IntervalReportingLoader(DataLoader):
                 
                 self._was_run_ = True
             
-            final_time = dict()                                     # stores the last timestamp seen
+            if not(stream):
+                rows = self._results_
+            
             interval_obj = datetime.timedelta(minutes=interval)        # timedelta object used to shift times by _interval_ minutes
             
-            for row in self._results_:
+            for row in rows:
 
                 key_name = QD.get_key_label(query_name, row)
                 
@@ -1303,6 +2271,10 @@ class IntervalReportingLoader(DataLoader):
             logging.error(inst.args)      # arguments stored in .args
             logging.error(inst)           # __str__ allows args to printed directly
             
+            """ Release the server-side cursor before rolling back """
+            if hasattr(rows, 'close'):
+                rows.close()
+            
             self._db_.rollback()
         
 
@@ -1327,6 +2299,83 @@ class IntervalReportingLoader(DataLoader):
             metrics[key] = metrics_new
         
         return [metrics, times, self._results_]
+    
+    """
+        Load the SQL file for an interval query and format it with escaped arguments
+    """
+    def format_interval_query(self, start_time, end_time, interval, campaign, query_name, **kwargs):
+        
+        """ Load the SQL File & Format """
+        filename = projSet.__sql_home__+ query_name + '.sql'
+        sql_stmnt = Hlp.file_to_string(filename)
+        
+        campaign = MySQLdb._mysql.escape_string(str(campaign))
+        start_time = MySQLdb._mysql.escape_string(str(start_time).strip())
+        end_time = MySQLdb._mysql.escape_string(str(end_time).strip())
+        interval = int(MySQLdb._mysql.escape_string(str(interval)))
+        
+        return QD.format_query(query_name, sql_stmnt, [start_time, end_time, campaign, interval], **kwargs)
+    
+    """
+        Executes an interval query and bucket its rows into an IntervalResults object.  The grid is the same as that of 
+        run_query_base - from start_time to end_time, each floored to the interval.  With the kwarg 'stream' rows are read 
+        from a server-side cursor.  _results_ and _col_names_ are set as in run_query_base (_results_ is empty when 
+        streaming).
+    """
+    def run_query_columnar_base(self, start_time, end_time, interval, campaign, query_name, **kwargs):
+        
+        stream = False
+        if 'stream' in kwargs:
+            stream = kwargs['stream'] == True
+            del kwargs['stream']
+        
+        start_time_obj = TP.timestamp_to_obj(start_time, 1)
+        start_time_obj = start_time_obj.replace(minute=int(math.floor(start_time_obj.minute / interval) * interval), second=0)
+        
+        end_time_obj = TP.timestamp_to_obj(end_time, 1)
+        end_time_obj = end_time_obj.replace(minute=int(math.floor(end_time_obj.minute / interval) * interval), second=0)
+        
+        results = IntervalResults(start_time_obj, end_time_obj, interval)
+        
+        sql_stmnt = self.format_interval_query(start_time, end_time, interval, campaign, query_name, **kwargs)
+        time_index = QD.get_metric_index(query_name, 'day_hr')
+        rows = list()
+        
+        try:
+            if stream:
+                logging.info('Running query (streaming results) ...')
+                rows = self.stream_SQL(sql_stmnt)
+                self._results_ = list()
+            
+            else:
+                logging.info('Running query ...')
+                self._cur_.execute(sql_stmnt)
+                
+                self._col_names_ = list()
+                for i in self._cur_.description:
+                    self._col_names_.append(i[0])
+                
+                self._results_ = self._cur_.fetchall()
+                rows = self._results_
+            
+            results.load_rows(rows, self._col_names_, lambda row: QD.get_key_label(query_name, row), time_index)
+            
+            """ A re-run of run_query_base must execute its own query """
+            self._was_run_ = False
+        
+        except Exception as inst:
+            
+            logging.error(type(inst))     # the exception instance
+            logging.error(inst.args)      # arguments stored in .args
+            logging.error(inst)           # __str__ allows args to printed directly
+            
+            """ Release the server-side cursor before rolling back """
+            if hasattr(rows, 'close'):
+                rows.close()
+            
+            self._db_.rollback()
+        
+        return results
 
         
 """
@@ -1846,14 +2895,103 @@ class DonorBracketsReportingLoader(DataLoader):
             delete_row        - try to delete a record from the table
             update            - try to modify a record in the table
             
-"""
-class TableLoader(DataLoader):
-    
-       
-    def __init__(self, **kwargs):
+"""
+class TableLoader(DataLoader):
+    
+    _BATCH_SIZE_ = 1000
+       
+    def __init__(self, **kwargs):
+        
+        """ Call constructor of parent """
+        DataLoader.__init__(self, **kwargs)
+    
+    """
+        Builds the statements of a multi-row insert in chunks of at most batch_size value tuples per statement, e.g. to run 
+        them with other statements in one execute_transaction.  Accepts the same arguments as execute_batched_insert.
+        
+        RETURN: 
+                list of insert statements
+    """
+    def format_batched_insert(self, insert_stmnt, values, **kwargs):
+        
+        batch_size = self._BATCH_SIZE_
+        if 'batch_size' in kwargs:
+            if isinstance(kwargs['batch_size'], int) and kwargs['batch_size'] > 0:
+                batch_size = kwargs['batch_size']
+        
+        stmnt_suffix = ';'
+        if 'on_duplicate' in kwargs:
+            stmnt_suffix = ' on duplicate key update ' + kwargs['on_duplicate'] + ';'
+        
+        statements = list()
+        for index in range(0, len(values), batch_size):
+            statements.append(insert_stmnt + ', '.join(values[index:index + batch_size]) + stmnt_suffix)
+        
+        return statements
+    
+    """
+        Executes a multi-row insert in chunks of at most batch_size value tuples per statement.  Each chunk is committed 
+        on success and rolled back on failure.
+        
+        INPUT:
+                insert_stmnt      - the statement prefix up to and including 'values '
+                values            - list of formatted value strings, e.g. '("a","b",1)'
+                batch_size        - (kwarg) maximum number of value tuples per statement
+                on_duplicate      - (kwarg) assignment list appended as 'on duplicate key update <on_duplicate>'
+                 
+        RETURN: 
+                0 on success, -1 if any chunk fails 
+    """
+    def execute_batched_insert(self, insert_stmnt, values, **kwargs):
+        
+        for batch_stmnt in self.format_batched_insert(insert_stmnt, values, **kwargs):
+            
+            try:
+                self._cur_.execute(batch_stmnt)
+                self._db_.commit()
+                
+            except Exception as inst:
+                
+                self._db_.rollback()
+                
+                logging.error('Could not execute batch insert: %s' % insert_stmnt)
+                logging.error(str(type(inst)))      # the exception instance
+                logging.error(str(inst.args))       # arguments stored in .args
+                logging.error(inst.__str__())       # __str__ allows args to printed directly
+                
+                return -1
+        
+        return 0
+    
+    """
+        Executes a list of statements in a single transaction.  Readers of the affected tables see either none or all of the 
+        changes.
+        
+        INPUT:
+                statements        - list of SQL statements
+                 
+        RETURN: 
+                0 if the transaction is committed, -1 if it is rolled back 
+    """
+    def execute_transaction(self, statements):
+        
+        try:
+            for stmnt in statements:
+                self._cur_.execute(stmnt)
+            self._db_.commit()
+            
+        except Exception as inst:
+            
+            self._db_.rollback()
+            
+            logging.error('Could not execute transaction, rolled back: ' + '; '.join(statements))
+            logging.error(str(type(inst)))      # the exception instance
+            logging.error(str(inst.args))       # arguments stored in .args
+            logging.error(inst.__str__())       # __str__ allows args to printed directly
+            
+            return -1
         
-        """ Call constructor of parent """
-        DataLoader.__init__(self, **kwargs)
+        return 0
         
     def record_exists(self, **kwargs):
         return
@@ -2188,17 +3326,49 @@ class TestTableLoader(TableLoader):
     | end_time           | timestamp        | NO   |     | 0000-00-00 00:00:00 |                             | 
     | log_completion_pct | int(3)           | YES  |     | 0                   |                             | 
     | total_rows         | int(10) unsigned | YES  |     | NULL                |                             | 
+    | byte_offset        | bigint unsigned  | YES  |     | 0                   |                             | 
     +--------------------+------------------+------+-----+---------------------+-----------------------------+
 
+    byte_offset is the checkpoint of the tail miner - the number of bytes of the followed log that have been loaded.  Rows 
+    written by the quarter-hourly miners leave it at the default.
             
 """
 class SquidLogTableLoader(TableLoader):
     
+    ADD_BYTE_OFFSET = 'alter table squid_log_record add column byte_offset bigint unsigned default 0;'
+    
+    """ The requests each record type is mined for - the batch and tail miners load the same source """
+    _LOG_SOURCES_ = {'banner_impression' : 'banner', 'banner_tail' : 'banner', 'lp_view' : 'lp', 'lp_tail' : 'lp'}
+    
+    """ 
+        log_completion_pct of a log whose requests have been loaded, and of a log whose requests could not be loaded.  
+        Progress while a log is read stays below LOADED_PCT. 
+    """
+    LOADED_PCT = 100
+    FAILED_PCT = -1
+    
+    """ Hours after its copy time at which a log that is still not loaded is taken to be abandoned """
+    _ABANDON_HOURS_ = 6
+    
     def __init__(self, **kwargs):
         
         """ Call constructor of parent """
         TableLoader.__init__(self, **kwargs)
     
+    """
+        Does squid_log_record have the byte_offset column (ADD_BYTE_OFFSET) used by the tail miner checkpoints?  An error is 
+        logged if it does not.
+    """
+    def has_byte_offset(self):
+        
+        results = self.execute_SQL("show columns from squid_log_record like 'byte_offset'")
+        
+        if results == -1 or len(results) == 0:
+            logging.error('squid_log_record has no byte_offset column.  Add it with: ' + self.ADD_BYTE_OFFSET)
+            return False
+        
+        return True
+    
     def __del__(self):
         self.close_db()
 
@@ -2211,6 +3381,7 @@ class SquidLogTableLoader(TableLoader):
         end_time =  'NULL'
         log_completion_pct = 'NULL'
         total_rows = 'NULL'
+        byte_offset = 'NULL'
 
         """ Process keys -- Escape parameters """
         for key in kwargs_dict:
@@ -2231,16 +3402,17 @@ class SquidLogTableLoader(TableLoader):
                 log_completion_pct = log_completion_pct
             elif key == 'total_rows':
                 total_rows = MySQLdb._mysql.escape_string(str(kwargs_dict[key]))
+            elif key == 'byte_offset':
+                byte_offset = MySQLdb._mysql.escape_string(str(kwargs_dict[key]))
         
-        return [type, log_copy_time, start_time, end_time, log_completion_pct, total_rows]
+        return [type, log_copy_time, start_time, end_time, log_completion_pct, total_rows, byte_offset]
     
+    """
+        The byte_offset column is only written when the 'byte_offset' argument is given
+    """
     def insert_row(self, **kwargs):
         
-        insert_stmnt = 'insert into squid_log_record values '
-        
-        type, log_copy_time, start_time, end_time, log_completion_pct, total_rows = self.process_kwargs(kwargs)
-    
-        insert_stmnt = insert_stmnt + '(' + type + ',' + log_copy_time + ',' + start_time + ',' + end_time + ',' + log_completion_pct + ',' + total_rows + ')'
+        insert_stmnt = self.format_insert_row(**kwargs)
         
         try:
             self._cur_.execute(insert_stmnt)
@@ -2253,6 +3425,33 @@ class SquidLogTableLoader(TableLoader):
         return 0
 
     
+    """
+        The statements of insert_row and update_table_row, e.g. to checkpoint in the same transaction as the rows loaded 
+        (see TableLoader.execute_transaction)
+    """
+    def format_insert_row(self, **kwargs):
+        
+        type, log_copy_time, start_time, end_time, log_completion_pct, total_rows, byte_offset = self.process_kwargs(kwargs)
+        
+        cols = 'type, log_copy_time, start_time, end_time, log_completion_pct, total_rows'
+        vals = type + ',' + log_copy_time + ',' + start_time + ',' + end_time + ',' + log_completion_pct + ',' + total_rows
+        
+        if 'byte_offset' in kwargs:
+            cols = cols + ', byte_offset'
+            vals = vals + ',' + byte_offset
+        
+        return 'insert into squid_log_record (' + cols + ') values (' + vals + ')'
+    
+    def format_update_table_row(self, **kwargs):
+        
+        type, log_copy_time, start_time, end_time, log_completion_pct, total_rows, byte_offset = self.process_kwargs(kwargs)
+        
+        cols = ' type = ' + type + ', log_copy_time = ' + log_copy_time + ', start_time = ' +  start_time + ', end_time = ' +  end_time + ', log_completion_pct = ' +  log_completion_pct + ', total_rows = ' +  total_rows
+        if 'byte_offset' in kwargs:
+            cols = cols + ', byte_offset = ' + byte_offset
+        
+        return 'update squid_log_record set' + cols + ' where log_copy_time = ' + log_copy_time
+    
     def get_table_row(self, log_copy_time):
         
         log_copy_time = self.process_kwargs({'log_copy_time' : log_copy_time})[1]
@@ -2289,10 +3488,7 @@ class SquidLogTableLoader(TableLoader):
     
     def update_table_row(self, **kwargs):
         
-        type, log_copy_time, start_time, end_time, log_completion_pct, total_rows = self.process_kwargs(kwargs)
-        
-        cols = ' type = ' + type + ', log_copy_time = ' + log_copy_time + ', start_time = ' +  start_time + ', end_time = ' +  end_time + ', log_completion_pct = ' +  log_completion_pct + ', total_rows = ' +  total_rows
-        update_stmnt = 'update squid_log_record set' + cols + ' where log_copy_time = ' + log_copy_time
+        update_stmnt = self.format_update_table_row(**kwargs)
         
         try:
             self._cur_.execute(update_stmnt)
@@ -2335,6 +3531,123 @@ class SquidLogTableLoader(TableLoader):
         
         return results
     
+    """
+        Retrieve the most recent tail miner checkpoint for a record type
+        
+        @param type: the squid_log_record type written by the tail miner, e.g. 'banner_tail'
+        
+        @return: tuple of (log_copy_time, start_time, end_time, total_rows, byte_offset), None if no checkpoint exists
+    """
+    def get_tail_checkpoint(self, type):
+        
+        type = self.process_kwargs({'type' : type})[0]
+        
+        select_stmnt = 'select log_copy_time, start_time, end_time, total_rows, byte_offset from squid_log_record ' \
+        'where type = ' + type + ' order by log_copy_time desc limit 1'
+        
+        try:
+            self._cur_.execute(select_stmnt)
+            results = self._cur_.fetchone()
+            
+        except:
+            results = None
+            self._db_.rollback()
+            logging.error('Could not execute: ' + select_stmnt)
+        
+        return results
+    
+    """
+        The time up to which the mined request data is settled.  For each source (banner impressions or landing pages) 
+        the latest end_time of a loaded log is taken - batch and tail records of a source cover the same requests.  The 
+        earliest of these is returned, held back to the start of any log that is still being mined or failed to load.  
+        
+        Only the latest copy of each log (type and start_time) is considered, so a log is superseded by a later copy of 
+        it.  A log that is still not loaded _ABANDON_HOURS_ after it was copied is taken to be abandoned (e.g. the miner 
+        crashed) and no longer holds the time back - the hours of a log that failed to load are re-aggregated when it is 
+        mined again (see LongTermTrendsFactLoader.refresh_range).
+        
+        @param sources: (kwarg) list of sources to consider, e.g. ['banner'], defaults to all sources
+        @param abandon_hours: (kwarg) hours after which a log that is not loaded is ignored, defaults to _ABANDON_HOURS_
+        
+        @return: datetime object, None if no log has been loaded or on error
+    """
+    def get_settled_end_time(self, **kwargs):
+        
+        sources = None
+        if 'sources' in kwargs:
+            sources = kwargs['sources']
+        
+        abandon_hours = self._ABANDON_HOURS_
+        if 'abandon_hours' in kwargs:
+            abandon_hours = kwargs['abandon_hours']
+        
+        abandon_time = datetime.datetime.utcnow() - datetime.timedelta(hours=abandon_hours)
+        
+        select_stmnt = 'select type, log_copy_time, start_time, end_time, log_completion_pct from ' \
+        '(select type as temp_type, start_time as temp_start, max(log_copy_time) as max_copy_time from squid_log_record group by type, start_time) as temp join ' \
+        'squid_log_record on (max_copy_time = squid_log_record.log_copy_time and temp_type = type and temp_start = start_time)'
+        
+        try:
+            self._cur_.execute(select_stmnt)
+            results = self._cur_.fetchall()
+        except:
+            self._db_.rollback()
+            logging.error('Could not execute: ' + select_stmnt)
+            return None
+        
+        complete = dict()
+        pending = None
+        
+        for row in results:
+            
+            if not(row[0] in self._LOG_SOURCES_):
+                continue
+            
+            source = self._LOG_SOURCES_[row[0]]
+            if sources != None and not(source in sources):
+                continue
+            
+            try:
+                copy_time = self.get_time_obj(row[1])
+                start_time = self.get_time_obj(row[2])
+                end_time = self.get_time_obj(row[3])
+                completion = float(row[4])
+            except (TypeError, ValueError):
+                logging.error('Could not read the squid log record: %s' % str(row))
+                continue
+            
+            if completion >= self.LOADED_PCT:
+                if not(source in complete) or end_time > complete[source]:
+                    complete[source] = end_time
+            elif copy_time < abandon_time:
+                continue
+            elif pending == None or start_time < pending:
+                pending = start_time
+        
+        if len(complete) == 0:
+            return None
+        
+        settled_time = min(complete.values())
+        if pending != None and pending < settled_time:
+            settled_time = pending
+        
+        return settled_time
+    
+    """
+        Drivers other than MySQLdb may return squid_log_record times as strings
+    """
+    def get_time_obj(self, time_value):
+        
+        if isinstance(time_value, datetime.datetime):
+            return time_value
+        
+        time_value = str(time_value)
+        time_format = TP.getTimestampFormat(time_value)
+        if time_format < 0:
+            raise ValueError('Unrecognized time: %s' % time_value)
+        
+        return TP.timestamp_to_obj(time_value, time_format)
+    
     """
         This method handles mapping test row fields to col names
         
@@ -2354,6 +3667,8 @@ class SquidLogTableLoader(TableLoader):
                 return row[4]
             elif key == 'total_rows':
                 return row[5]
+            elif key == 'byte_offset':
+                return row[6]
         
         except Exception as inst:
             
@@ -2390,6 +3705,9 @@ class SquidLogTableLoader(TableLoader):
 """
 class CiviCRMLoader(TableLoader):
     
+    """ Seconds that the results of the reporting queries shared between views and caches are served from query_cache """
+    _QUERY_CACHE_TTL_ = 300
+    
     def __init__(self, **kwargs):
         
         """ Call constructor of parent """
@@ -2397,6 +3715,23 @@ class CiviCRMLoader(TableLoader):
     
     def __del__(self):
         self.close_db()
+    
+    """
+        Identifies the donation data loaded so far - the latest civicrm contribution and contribution tracking ids.  A 
+        contribution_id filled in on contribution tracking comes with a new contribution.
+        
+        RETURN: 
+                tuple of (contribution id, contribution tracking id), None on error
+    """
+    def get_donation_watermark(self):
+        
+        sql = 'select (select max(id) from civicrm.civicrm_contribution), (select max(id) from drupal.contribution_tracking)'
+        results = self.execute_SQL(sql)
+        
+        try:
+            return (results[0][0], results[0][1])
+        except (IndexError, TypeError):
+            return None
         
     def process_kwargs(self, kwargs_dict):
         
@@ -2460,8 +3795,8 @@ class CiviCRMLoader(TableLoader):
                 "group by 1,2 order by 1,2"
 
     
-        results_conversion = self.execute_SQL(sql_conversion)
-        results_counts = self.execute_SQL(sql_counts)
+        results_conversion = self.execute_SQL(sql_conversion, cache_ttl=self._QUERY_CACHE_TTL_)
+        results_counts = self.execute_SQL(sql_counts, cache_ttl=self._QUERY_CACHE_TTL_)
         
         hits_index = 2
         conversion_index = 3
@@ -2657,7 +3992,8 @@ class CiviCRMLoader(TableLoader):
         "join civicrm.civicrm_country on civicrm.civicrm_address.country_id = civicrm.civicrm_country.id " + \
         "where receive_date >= '%s' group by 1 order by 2 desc limit 50" % (start_time)
         
-        results = self.execute_SQL(sql)
+        """ The ranking reaches into the current window but changes slowly - it may be cached regardless """
+        results = self.execute_SQL(sql, cache_ttl=self._QUERY_CACHE_TTL_, cache_current=True)
  
         countries = list()
         for row in results:
@@ -2697,13 +4033,23 @@ class CiviCRMLoader(TableLoader):
     | user_agent   | varbinary(500) | YES  |     | NULL              |                             |
     +--------------+----------------+------+-----+-------------------+-----------------------------+
 
+    The tail miner accumulates counts into existing banner_impressions rows with upsert_multiple_rows.  This relies on a 
+    unique key over the aggregation columns (ADD_MINUTE_KEY).
+
 """
 class ImpressionTableLoader(TableLoader):
     
+    ADD_MINUTE_KEY = 'alter table banner_impressions add unique key idx_minute_aggregate (start_timestamp, utm_source, referrer, country, lang, on_minute);'
+    
+    _STAGING_TABLE_ = 'banner_impressions_staging'
+    _KEY_COLUMNS_ = ['start_timestamp', 'utm_source', 'referrer', 'country', 'lang', 'on_minute']
+    
     def __init__(self, **kwargs):
         
         """ Call constructor of parent """
         TableLoader.__init__(self, **kwargs)
+        
+        self._has_minute_key_ = None
     
     def __del__(self):
         self.close_db()
@@ -2760,6 +4106,35 @@ class ImpressionTableLoader(TableLoader):
         return start_timestamp, utm_source, referrer, country, lang, counts, on_minute, ip, user_agent, request_time
     
     
+    """
+        Builds the parenthesized value string for a single banner_impressions (or banner_impressions_raw) record
+        
+        INPUT:
+                kwargs_dict       - the same arguments accepted by insert_row
+                use_raw           - boolean, format for banner_impressions_raw
+                 
+        RETURN: 
+                value string, e.g. '(convert('...', datetime),"B11_Banner","enwiki","US","en","12",convert('...', datetime))'
+    """
+    def format_row_values(self, kwargs_dict, use_raw):
+        
+        start_timestamp, utm_source, referrer, country, lang, counts, on_minute, ip, user_agent, request_time = self.process_kwargs(kwargs_dict)
+        
+        if use_raw:
+            
+            request_time = "convert('" + request_time + "', datetime)"
+            val = '(' + utm_source + ',' + referrer + ',' + country + ',' + lang + ',' \
+                    + request_time + ',' + ip + ',' + user_agent + ')'            
+        else:
+            
+            start_timestamp = "convert('" + start_timestamp + "', datetime)"
+            on_minute = "convert('" + on_minute + "', datetime)"
+            val = '(' + start_timestamp + ',' + utm_source + ',' + referrer + ',' + country + ',' + lang + ',' \
+                                        + counts + ',' + on_minute + ')'
+        
+        return val
+    
+    
     def insert_row(self, **kwargs):
         
         if 'use_raw' in kwargs:
@@ -2775,21 +4150,7 @@ class ImpressionTableLoader(TableLoader):
             use_raw = False
             insert_stmnt = 'insert into banner_impressions values '
         
-        start_timestamp, utm_source, referrer, country, lang, counts, on_minute, ip, user_agent, request_time = self.process_kwargs(kwargs)
-        
-        if use_raw:
-            
-            request_time = "convert('" + request_time + "', datetime)"
-            val = '(' + utm_source + ',' + referrer + ',' + country + ',' + lang + ',' \
-                    + request_time + ',' + ip + ',' + user_agent + ');'            
-        else:
-            
-            start_timestamp = "convert('" + start_timestamp + "', datetime)"
-            on_minute = "convert('" + on_minute + "', datetime)"
-            val = '(' + start_timestamp + ',' + utm_source + ',' + referrer + ',' + country + ',' + lang + ',' \
-                                        + counts + ',' + on_minute + ');'
-                                    
-        insert_stmnt = insert_stmnt + val
+        insert_stmnt = insert_stmnt + self.format_row_values(kwargs, use_raw) + ';'
 
         try:
             self._cur_.execute(insert_stmnt)
@@ -2801,6 +4162,152 @@ class ImpressionTableLoader(TableLoader):
 
         return 0
     
+    """
+        Inserts many banner impression records using chunked multi-row insert statements rather than a statement per record
+        
+        INPUT:
+                rows              - list of dicts, each containing the keyword arguments accepted by insert_row
+                use_raw           - (kwarg) boolean, insert into banner_impressions_raw
+                batch_size        - (kwarg) maximum number of records per insert statement
+                 
+        RETURN: 
+                0 on success, -1 on failure 
+    """
+    def insert_multiple_rows(self, rows, **kwargs):
+        
+        use_raw = False
+        if 'use_raw' in kwargs:
+            if isinstance(kwargs['use_raw'], bool):
+                use_raw = kwargs['use_raw']
+        
+        if use_raw:
+            insert_stmnt = 'insert into banner_impressions_raw values '
+        else:
+            insert_stmnt = 'insert into banner_impressions values '
+        
+        values = list()
+        for row in rows:
+            values.append(self.format_row_values(row, use_raw))
+        
+        return self.execute_batched_insert(insert_stmnt, values, **kwargs)
+    
+    """
+        Adds banner impression counts to banner_impressions, incrementing the counts of records that already exist for the 
+        same (start_timestamp, utm_source, referrer, country, lang, on_minute) rather than inserting duplicates.  Requires 
+        the ADD_MINUTE_KEY unique key.
+        
+        INPUT:
+                rows              - list of dicts, each containing the keyword arguments accepted by insert_row
+                batch_size        - (kwarg) maximum number of records per insert statement
+                 
+        RETURN: 
+                0 on success, -1 on failure 
+    """
+    def upsert_multiple_rows(self, rows, **kwargs):
+        
+        if not(self.has_minute_key()):
+            return -1
+        
+        values = list()
+        for row in rows:
+            values.append(self.format_row_values(row, False))
+        
+        kwargs['on_duplicate'] = 'counts = counts + values(counts)'
+        
+        return self.execute_batched_insert('insert into banner_impressions values ', values, **kwargs)
+    
+    """
+        Does banner_impressions have the ADD_MINUTE_KEY unique key?  Without it 'on duplicate key update' never applies and 
+        upserted counts would be inserted a second time, so upserts are refused (and an error logged) until the key is added.  
+        The result is checked once per loader.
+    """
+    def has_minute_key(self):
+        
+        if not(self._lookup_minute_key()):
+            logging.error('banner_impressions has no idx_minute_aggregate unique key, refusing to load counts.  Add it with: ' + self.ADD_MINUTE_KEY)
+            return False
+        
+        return True
+    
+    def _lookup_minute_key(self):
+        
+        if self._has_minute_key_ == None:
+            
+            results = self.execute_SQL("show index from banner_impressions where Key_name = 'idx_minute_aggregate'")
+            
+            if results == -1:
+                return False
+            
+            self._has_minute_key_ = len(results) > 0
+        
+        return self._has_minute_key_
+    
+    """
+        The statements of upsert_multiple_rows, to be run in a transaction of the caller (see TableLoader.execute_transaction).  
+        The caller must check has_minute_key first.
+        
+        RETURN: 
+                list of insert statements
+    """
+    def format_upsert_multiple_rows(self, rows, **kwargs):
+        
+        values = list()
+        for row in rows:
+            values.append(self.format_row_values(row, False))
+        
+        kwargs['on_duplicate'] = 'counts = counts + values(counts)'
+        
+        return self.format_batched_insert('insert into banner_impressions values ', values, **kwargs)
+    
+    """
+        Replaces the banner impression counts of a log in one transaction.  The new counts are loaded into a temporary staging 
+        table (private to this connection) and then swapped in - existing records are updated in place, new records are 
+        inserted and records of the log that no longer occur are removed.  Concurrent readers see either the old or the new 
+        counts, and if the load fails the old counts are left untouched.  Without the ADD_MINUTE_KEY unique key the counts 
+        of the log are instead deleted and inserted again, also in one transaction.
+        
+        INPUT:
+                rows              - list of dicts, each containing the keyword arguments accepted by insert_row
+                start_timestamp   - the start timestamp of the log
+                batch_size        - (kwarg) maximum number of records per staging insert statement
+                 
+        RETURN: 
+                0 on success, -1 on failure 
+    """
+    def reload_rows(self, rows, start_timestamp, **kwargs):
+        
+        start_timestamp = "convert('" + self.process_kwargs({'start_timestamp_arg' : start_timestamp})[0] + "', datetime)"
+        
+        if not(self._lookup_minute_key()):
+            
+            logging.info('banner_impressions has no idx_minute_aggregate unique key, replacing the counts of the log by delete and insert.  ' + \
+                         'Add it with: ' + self.ADD_MINUTE_KEY)
+            
+            values = list()
+            for row in rows:
+                values.append(self.format_row_values(row, False))
+            
+            return self.execute_transaction(['delete from banner_impressions where start_timestamp = ' + start_timestamp] + \
+                                            self.format_batched_insert('insert into banner_impressions values ', values, **kwargs))
+        
+        if self.execute_transaction(['create temporary table if not exists ' + self._STAGING_TABLE_ + ' like banner_impressions', \
+                                     'delete from ' + self._STAGING_TABLE_]) < 0:
+            return -1
+        
+        values = list()
+        for row in rows:
+            values.append(self.format_row_values(row, False))
+        
+        if self.execute_batched_insert('insert into ' + self._STAGING_TABLE_ + ' values ', values, **kwargs) < 0:
+            return -1
+        
+        key_match = ' and '.join(['bi.' + col + ' <=> s.' + col for col in self._KEY_COLUMNS_])
+        
+        return self.execute_transaction(['insert into banner_impressions select * from ' + self._STAGING_TABLE_ + \
+                                         ' on duplicate key update counts = values(counts)', \
+                                         'delete bi from banner_impressions as bi left join ' + self._STAGING_TABLE_ + ' as s on (' + \
+                                         key_match + ') where bi.start_timestamp = ' + start_timestamp + ' and s.start_timestamp is null'])
+    
     
     def delete_row(self, start_timestamp):
         
@@ -2856,10 +4363,49 @@ class ImpressionTableLoader(TableLoader):
 """
 class LandingPageTableLoader(TableLoader):
     
+    _FLUSH_INTERVAL_ = 30
+    _STAGING_TABLE_ = 'landing_page_requests_staging'
+    
+    """ Seconds that the first and last view of a campaign are served from query_cache """
+    _EARLIEST_VIEW_CACHE_TTL_ = 3600
+    _LATEST_VIEW_CACHE_TTL_ = 60
+    
+    """
+        Constructor
+        
+        The buffered writer (buffer_row/flush_rows) is configured with the optional kwargs 'batch_size' (number of rows per 
+        insert statement) and 'flush_interval' (maximum number of seconds a row may wait in the buffer).  With the kwarg 
+        'staging' set to True the buffered writer loads a temporary staging table and the rows are only made visible by 
+        swap_staged_rows.  With 'auto_flush' set to False buffer_row never flushes, the caller writes the buffer with 
+        flush_rows or takes its statements with take_buffered_statements.
+    """
     def __init__(self, **kwargs):
         
         """ Call constructor of parent """
         TableLoader.__init__(self, **kwargs)
+        
+        self._row_buffer_ = list()
+        self._rows_written_ = 0
+        self._last_flush_ = time.time()
+        
+        self._batch_size_ = self._BATCH_SIZE_
+        self._flush_interval_ = self._FLUSH_INTERVAL_
+        self._auto_flush_ = True
+        self._insert_table_ = 'landing_page_requests'
+        
+        if 'batch_size' in kwargs:
+            if isinstance(kwargs['batch_size'], int) and kwargs['batch_size'] > 0:
+                self._batch_size_ = kwargs['batch_size']
+        if 'flush_interval' in kwargs:
+            if isinstance(kwargs['flush_interval'], (int, float)) and kwargs['flush_interval'] >= 0:
+                self._flush_interval_ = kwargs['flush_interval']
+        if 'auto_flush' in kwargs:
+            self._auto_flush_ = kwargs['auto_flush'] == True
+        if 'staging' in kwargs:
+            if kwargs['staging'] == True:
+                self._insert_table_ = self._STAGING_TABLE_
+                self.execute_transaction(['create temporary table if not exists ' + self._STAGING_TABLE_ + ' like landing_page_requests', \
+                                          'delete from ' + self._STAGING_TABLE_])
     
     def __del__(self):
         self.close_db()
@@ -2924,19 +4470,109 @@ class LandingPageTableLoader(TableLoader):
         return [start_timestamp, timestamp, utm_source, utm_campaign, utm_medium, landing_page, page_url, referrer_url, browser, lang, country, project, ip]
     
     
-    def insert_row(self, **kwargs):
+    """
+        Builds the parenthesized value string for a single landing_page_requests record
+    """
+    def format_row_values(self, kwargs_dict):
+        
+        start_timestamp, timestamp, utm_source, utm_campaign, utm_medium, landing_page, page_url, referrer_url, browser, lang, country, project, ip = self.process_kwargs(kwargs_dict)
+        
+        val = '(' + 'convert(' + start_timestamp + ', datetime)' + ',' + utm_source + ',' + utm_campaign + ',' + utm_medium + ',' + landing_page + \
+                    ',' + page_url + ',' + referrer_url + ',' + browser + ',' + lang + ',' + country + ','  \
+                    + project + ',' +  ip + ',' + 'convert(' + timestamp + ', datetime)' + ')'
+        
+        return val
+    
+    def insert_row(self, **kwargs):
+        
+        insert_stmnt = 'insert into landing_page_requests values ' + self.format_row_values(kwargs) + ';'
+        
+        return self.execute_SQL(insert_stmnt)
+    
+    """
+        Buffered writer - add a record to the write buffer.  The buffer is flushed once it holds a full batch or when the 
+        flush interval has elapsed since the last flush.  Accepts the same arguments as insert_row.
+        
+        RETURN: 
+                0 on success, -1 if a triggered flush fails
+    """
+    def buffer_row(self, **kwargs):
+        
+        self._row_buffer_.append(self.format_row_values(kwargs))
+        
+        if not(self._auto_flush_):
+            return 0
+        
+        if len(self._row_buffer_) >= self._batch_size_ or time.time() - self._last_flush_ >= self._flush_interval_:
+            return self.flush_rows()
+        
+        return 0
+    
+    """
+        Buffered writer - write all buffered records with multi-row inserts, committing once per chunk
+        
+        RETURN: 
+                0 on success, -1 on failure
+    """
+    def flush_rows(self):
+        
+        num_rows = len(self._row_buffer_)
+        self._last_flush_ = time.time()
+        
+        if num_rows == 0:
+            return 0
+        
+        return_val = self.execute_batched_insert('insert into ' + self._insert_table_ + ' values ', self._row_buffer_, batch_size=self._batch_size_)
+        self._row_buffer_ = list()
+        
+        if return_val == 0:
+            self._rows_written_ = self._rows_written_ + num_rows
+        
+        return return_val
+    
+    """
+        Buffered writer - empties the buffer and returns the insert statements that write it, to be run in a transaction of 
+        the caller (see TableLoader.execute_transaction).  The records are not counted by get_rows_written.
+        
+        RETURN: 
+                list of insert statements
+    """
+    def take_buffered_statements(self):
+        
+        statements = self.format_batched_insert('insert into ' + self._insert_table_ + ' values ', self._row_buffer_, batch_size=self._batch_size_)
+        
+        self._row_buffer_ = list()
+        self._last_flush_ = time.time()
+        
+        return statements
+    
+    """
+        Buffered writer - the number of records successfully flushed by this loader
+    """
+    def get_rows_written(self):
+        return self._rows_written_
+    
+    """
+        Staged writer - replaces the landing page requests of a log with the staged rows in one transaction.  Concurrent 
+        readers see either the old or the new requests, and if the swap fails the old requests are left untouched.  The 
+        staging table is emptied once the swap commits.
         
-        insert_stmnt = 'insert into landing_page_requests values '
+        RETURN: 
+                0 on success, -1 on failure
+    """
+    def swap_staged_rows(self, start_timestamp):
         
-        start_timestamp, timestamp, utm_source, utm_campaign, utm_medium, landing_page, page_url, referrer_url, browser, lang, country, project, ip = self.process_kwargs(kwargs)
+        if self._insert_table_ != self._STAGING_TABLE_:
+            logging.error('Rows are not staged - construct the LandingPageTableLoader with staging=True.')
+            return -1
         
-        val = '(' + 'convert(' + start_timestamp + ', datetime)' + ',' + utm_source + ',' + utm_campaign + ',' + utm_medium + ',' + landing_page + \
-                    ',' + page_url + ',' + referrer_url + ',' + browser + ',' + lang + ',' + country + ','  \
-                    + project + ',' +  ip + ',' + 'convert(' + timestamp + ', datetime)' + ');'
-                    
-        insert_stmnt = insert_stmnt + val
+        start_timestamp = self.process_kwargs({'start_timestamp_arg' : start_timestamp})[0]
         
-        return self.execute_SQL(insert_stmnt)
+        if self.execute_transaction(['delete from landing_page_requests where start_timestamp = ' + start_timestamp, \
+                                     'insert into landing_page_requests select * from ' + self._STAGING_TABLE_]) < 0:
+            return -1
+        
+        return self.execute_transaction(['delete from ' + self._STAGING_TABLE_])
         
     
     def delete_row(self, start_timestamp):
@@ -3035,7 +4671,7 @@ class LandingPageTableLoader(TableLoader):
         utm_campaign = MySQLdb._mysql.escape_string(str(utm_campaign))
         
         sql = "select min(request_time) from landing_page_requests where utm_campaign = '%s'" % utm_campaign
-        results = self.execute_SQL(sql)
+        results = self.execute_SQL(sql, cache_ttl=self._EARLIEST_VIEW_CACHE_TTL_)
         
         earliest_timestamp = results[0][0]
         earliest_timestamp = TP.timestamp_from_obj(earliest_timestamp, 1, 2)
@@ -3052,7 +4688,7 @@ class LandingPageTableLoader(TableLoader):
         utm_campaign = MySQLdb._mysql.escape_string(str(utm_campaign))
         
         sql = "select max(request_time) from landing_page_requests where utm_campaign = '%s'" % utm_campaign
-        results = self.execute_SQL(sql)
+        results = self.execute_SQL(sql, cache_ttl=self._LATEST_VIEW_CACHE_TTL_)
         
         latest_timestamp = results[0][0]
         latest_timestamp = latest_timestamp + datetime.timedelta(minutes=1) # Round up to the nearest minute
@@ -3098,6 +4734,397 @@ class LandingPageTableLoader(TableLoader):
             return True
         
         
+"""
+
+    CLASS :: MinutelyRollupTableLoader
+    
+    Maintains per minute rollups of banner_impressions and landing_page_requests.  The interval reporting queries 
+    (report_banner_metrics_minutely, report_LP_metrics_minutely, report_campaign_metrics_minutely and their one-step 
+    variants) sum these rollups into 1, 5, 15 or 60 minute intervals rather than grouping the raw requests.  The miners 
+    call refresh after each log (or poll of a tailed log) has been loaded, which re-aggregates only the minutes the log 
+    touched.  refresh may also be run over any range to backfill the rollups.
+    
+    banner_impressions_minutely:
+    
+    +-------------+------------------+------+-----+---------+-------+
+    | Field       | Type             | Null | Key | Default | Extra |
+    +-------------+------------------+------+-----+---------+-------+
+    | on_minute   | datetime         | NO   | PRI | NULL    |       |
+    | utm_source  | varbinary(128)   | NO   | PRI |         |       |
+    | country     | varbinary(128)   | NO   | PRI |         |       |
+    | impressions | int(10) unsigned | NO   |     | 0       |       |
+    +-------------+------------------+------+-----+---------+-------+
+    
+    landing_page_requests_minutely:
+    
+    +--------------+------------------+------+-----+---------+-------+
+    | Field        | Type             | Null | Key | Default | Extra |
+    +--------------+------------------+------+-----+---------+-------+
+    | on_minute    | datetime         | NO   | PRI | NULL    |       |
+    | utm_campaign | varbinary(128)   | NO   | PRI |         |       |
+    | utm_source   | varbinary(128)   | NO   | PRI |         |       |
+    | landing_page | varbinary(128)   | NO   | PRI |         |       |
+    | country      | varbinary(128)   | NO   | PRI |         |       |
+    | views        | int(10) unsigned | NO   |     | 0       |       |
+    +--------------+------------------+------+-----+---------+-------+
+    
+    METHODS:
+            refresh                      - re-aggregate both rollups over a range of minutes
+            refresh_impressions          - re-aggregate banner_impressions_minutely over a range of minutes
+            refresh_landing_pages        - re-aggregate landing_page_requests_minutely over a range of minutes
+    
+"""
+class MinutelyRollupTableLoader(TableLoader):
+    
+    CREATE_IMPRESSIONS_TABLE = "create table banner_impressions_minutely (on_minute datetime not null, utm_source varbinary(128) not null default '', " + \
+    "country varbinary(128) not null default '', impressions int(10) unsigned not null default 0, primary key (on_minute, utm_source, country));"
+    
+    CREATE_LP_TABLE = "create table landing_page_requests_minutely (on_minute datetime not null, utm_campaign varbinary(128) not null default '', " + \
+    "utm_source varbinary(128) not null default '', landing_page varbinary(128) not null default '', country varbinary(128) not null default '', " + \
+    "views int(10) unsigned not null default 0, primary key (on_minute, utm_campaign, utm_source, landing_page, country), " + \
+    "key idx_campaign_minute (utm_campaign, on_minute));"
+    
+    def __init__(self, **kwargs):
+        
+        """ Call constructor of parent """
+        TableLoader.__init__(self, **kwargs)
+    
+    def __del__(self):
+        self.close_db()
+    
+    """
+        Returns the escaped [first minute, minute after the last minute] of a range of 14-digit timestamps
+    """
+    def get_minute_bounds(self, start_time, end_time):
+        
+        start_time = MySQLdb._mysql.escape_string(str(start_time).strip())
+        end_time = MySQLdb._mysql.escape_string(str(end_time).strip())
+        
+        start_minute = start_time[:12] + '00'
+        end_minute = TP.timestamp_from_obj(TP.timestamp_to_obj(end_time[:12] + '00', 1) + datetime.timedelta(minutes=1), 1, 3)
+        
+        return start_minute, end_minute
+    
+    """
+        Replaces the impression rollups of every minute from start_time to end_time (inclusive) with the sums from 
+        banner_impressions in one transaction
+        
+        RETURN: 
+                0 on success, -1 if the transaction is rolled back
+    """
+    def refresh_impressions(self, start_time, end_time):
+        
+        start_minute, end_minute = self.get_minute_bounds(start_time, end_time)
+        
+        delete_stmnt = "delete from banner_impressions_minutely where on_minute >= '%s' and on_minute < '%s'" % (start_minute, end_minute)
+        insert_stmnt = "insert into banner_impressions_minutely (on_minute, utm_source, country, impressions) " + \
+        "select on_minute, ifnull(utm_source, ''), ifnull(country, ''), sum(counts) from banner_impressions " + \
+        "where on_minute >= '%s' and on_minute < '%s' group by 1,2,3" % (start_minute, end_minute)
+        
+        return self.execute_transaction([delete_stmnt, insert_stmnt])
+    
+    """
+        Replaces the landing page rollups of every minute from start_time to end_time (inclusive) with the counts from 
+        landing_page_requests in one transaction
+        
+        RETURN: 
+                0 on success, -1 if the transaction is rolled back
+    """
+    def refresh_landing_pages(self, start_time, end_time):
+        
+        start_minute, end_minute = self.get_minute_bounds(start_time, end_time)
+        
+        delete_stmnt = "delete from landing_page_requests_minutely where on_minute >= '%s' and on_minute < '%s'" % (start_minute, end_minute)
+        insert_stmnt = "insert into landing_page_requests_minutely (on_minute, utm_campaign, utm_source, landing_page, country, views) " + \
+        "select date_format(request_time, '%Y-%m-%d %H:%i:00'), ifnull(utm_campaign, ''), ifnull(utm_source, ''), ifnull(landing_page, ''), " + \
+        "ifnull(country, ''), count(*) from landing_page_requests " + \
+        "where request_time >= '" + start_minute + "' and request_time < '" + end_minute + "' group by 1,2,3,4,5"
+        
+        return self.execute_transaction([delete_stmnt, insert_stmnt])
+    
+    """
+        Re-aggregate both rollups from start_time to end_time (inclusive)
+    """
+    def refresh(self, start_time, end_time):
+        
+        if self.refresh_impressions(start_time, end_time) < 0:
+            return -1
+        
+        return self.refresh_landing_pages(start_time, end_time)
+    
+        
+"""
+
+    CLASS :: LongTermTrendsFactLoader
+    
+    Maintains the hourly fact tables read by LongTermTrendsLoader.run_query.  Each fact table holds one row per hour and 
+    grouping (country and language, currency or payment method):
+    
+        ltt_hourly_impressions      - hr, country, language, impressions         (banner_impressions)
+        ltt_hourly_views            - hr, country, language, views               (landing_page_requests)
+        ltt_hourly_donations        - hr, country, language, donations, amount   (civicrm contributions with tracking)
+        ltt_hourly_currency         - hr, currency, donations, amount            (civicrm contributions)
+        ltt_hourly_payments         - hr, payment_method, donations, amount, attempts   (drupal contribution tracking)
+    
+    The hour up to which each table is complete is kept in ltt_fact_watermark.  refresh re-aggregates only the hours from 
+    the watermark onwards and then moves the watermark forward, never past the start of the current hour less the 
+    table's _SETTLE_HOURS_ - those hours are aggregated again by the next refresh.  Donations are received and matched to 
+    their contribution tracking rows (contribution_id) well after the request, so the donation and payment facts settle 
+    over days rather than an hour.  The watermark of the impression and view facts also waits for the log miners: it 
+    stays before the hour of SquidLogTableLoader.get_settled_end_time, so a log copied or mined late is still aggregated.  
+    A table without a watermark is backfilled over backfill_hours.
+    
+    Hours behind the watermark are only re-aggregated by refresh_range - the miners call it for the hours a re-mined log 
+    replaced and scripts/run_ltt_fact_backfill.py runs it over any range.
+    
+    METHODS:
+            get_watermark          - the hour from which a fact table will next be refreshed
+            get_mined_watermark    - the hour up to which the mined requests of a fact table are complete
+            refresh_fact           - re-aggregate one fact table from a given hour
+            refresh                - re-aggregate every fact table from its watermark
+            refresh_range          - re-aggregate the fact tables over a range of hours
+    
+"""
+class LongTermTrendsFactLoader(TableLoader):
+    
+    CREATE_WATERMARK_TABLE = "create table ltt_fact_watermark (fact_table varbinary(64) not null, watermark datetime not null, primary key (fact_table));"
+    
+    CREATE_IMPRESSIONS_TABLE = "create table ltt_hourly_impressions (hr datetime not null, country varbinary(128) not null default '', " + \
+    "language varbinary(20) not null default '', impressions bigint unsigned not null default 0, primary key (hr, country, language));"
+    
+    CREATE_VIEWS_TABLE = "create table ltt_hourly_views (hr datetime not null, country varbinary(128) not null default '', " + \
+    "language varbinary(20) not null default '', views bigint unsigned not null default 0, primary key (hr, country, language));"
+    
+    CREATE_DONATIONS_TABLE = "create table ltt_hourly_donations (hr datetime not null, country varbinary(128) not null default '', " + \
+    "language varbinary(20) not null default '', donations int unsigned not null default 0, amount decimal(20,2) not null default 0, " + \
+    "primary key (hr, country, language));"
+    
+    CREATE_CURRENCY_TABLE = "create table ltt_hourly_currency (hr datetime not null, currency varbinary(3) not null default '', " + \
+    "donations int unsigned not null default 0, amount decimal(20,2) not null default 0, primary key (hr, currency));"
+    
+    CREATE_PAYMENTS_TABLE = "create table ltt_hourly_payments (hr datetime not null, payment_method varbinary(128) not null default '', " + \
+    "donations int unsigned not null default 0, amount decimal(20,2) not null default 0, attempts int unsigned not null default 0, " + \
+    "primary key (hr, payment_method));"
+    
+    """ 
+        The db key of the fact tables and their watermarks - the miners refreshing re-mined hours, the caching refresh and 
+        the long term trends reports (LongTermTrendsLoader) must all use it 
+    """
+    FACT_DB = 'storage3'
+    
+    """ Hours before the current one that every refresh aggregates again """
+    _SETTLE_HOURS_ = {'ltt_hourly_impressions' : 1, 'ltt_hourly_views' : 1, 'ltt_hourly_currency' : 24, 'ltt_hourly_donations' : 72, 
+                      'ltt_hourly_payments' : 72}
+    _BACKFILL_HOURS_ = 24 * 30
+    
+    """ The mined requests (SquidLogTableLoader._LOG_SOURCES_) that the squid fact tables are aggregated from """
+    _MINED_SOURCES_ = {'ltt_hourly_impressions' : ['banner'], 'ltt_hourly_views' : ['lp']}
+    
+    """ The time column of the raw data of each fact table """
+    _FACT_TIME_COL_ = {'ltt_hourly_impressions' : 'on_minute', 'ltt_hourly_views' : 'request_time', 'ltt_hourly_donations' : 'receive_date', 
+                       'ltt_hourly_currency' : 'receive_date', 'ltt_hourly_payments' : 'ts'}
+    
+    """ Aggregation of each fact table from the raw data - '%s' is the condition on _FACT_TIME_COL_ """
+    _FACT_SQL_ = {
+        'ltt_hourly_impressions' : "insert into ltt_hourly_impressions (hr, country, language, impressions) " + \
+            "select date_format(on_minute, '%%Y-%%m-%%d %%H:00:00'), ifnull(country, ''), ifnull(lang, ''), sum(counts) " + \
+            "from banner_impressions where %s group by 1,2,3",
+        
+        'ltt_hourly_views' : "insert into ltt_hourly_views (hr, country, language, views) " + \
+            "select date_format(request_time, '%%Y-%%m-%%d %%H:00:00'), ifnull(country, ''), ifnull(lang, ''), count(*) " + \
+            "from landing_page_requests where %s group by 1,2,3",
+        
+        'ltt_hourly_donations' : "insert into ltt_hourly_donations (hr, country, language, donations, amount) " + \
+            "select date_format(receive_date, '%%Y-%%m-%%d %%H:00:00'), ifnull(iso_code, ''), ifnull(language, ''), count(*), ifnull(sum(total_amount), 0) " + \
+            "from civicrm.civicrm_contribution join civicrm.civicrm_address on civicrm.civicrm_contribution.contact_id = civicrm.civicrm_address.contact_id " + \
+            "join civicrm.civicrm_country on civicrm.civicrm_address.country_id = civicrm.civicrm_country.id " + \
+            "join drupal.contribution_tracking on civicrm.civicrm_contribution.id = drupal.contribution_tracking.contribution_id " + \
+            "where %s group by 1,2,3",
+        
+        'ltt_hourly_currency' : "insert into ltt_hourly_currency (hr, currency, donations, amount) " + \
+            "select date_format(receive_date, '%%Y-%%m-%%d %%H:00:00'), ifnull(substring(source,1,3), ''), count(*), ifnull(sum(total_amount), 0) " + \
+            "from civicrm.civicrm_contribution where %s group by 1,2",
+        
+        'ltt_hourly_payments' : "insert into ltt_hourly_payments (hr, payment_method, donations, amount, attempts) " + \
+            "select date_format(ts, '%%Y-%%m-%%d %%H:00:00'), ifnull(substring_index(utm_source, '.', -1), ''), " + \
+            "sum(not isnull(drupal.contribution_tracking.contribution_id)), ifnull(sum(total_amount), 0), count(*) " + \
+            "from drupal.contribution_tracking left join civicrm.civicrm_contribution on civicrm.civicrm_contribution.id = drupal.contribution_tracking.contribution_id " + \
+            "where %s group by 1,2"
+    }
+    
+    def __init__(self, **kwargs):
+        
+        """ The fact tables are refreshed and reported on one host """
+        if not('db' in kwargs):
+            kwargs['db'] = self.FACT_DB
+        
+        """ Call constructor of parent """
+        TableLoader.__init__(self, **kwargs)
+    
+    def __del__(self):
+        self.close_db()
+    
+    """
+        Returns the watermark of a fact table as a 14-digit timestamp, None if the table has not been filled
+    """
+    def get_watermark(self, fact_table):
+        
+        fact_table = MySQLdb._mysql.escape_string(str(fact_table))
+        results = self.execute_SQL("select watermark from ltt_fact_watermark where fact_table = '%s'" % fact_table)
+        
+        try:
+            return TP.timestamp_from_obj(results[0][0], 1, 3)
+        except (IndexError, TypeError, AttributeError):
+            return None
+    
+    """
+        Returns the start of the hour of the settled end time of the log miners (SquidLogTableLoader.get_settled_end_time) 
+        for the sources of a fact table - hours before it hold every mined request.  squid_log_record is read on the host 
+        the facts are aggregated on, where a log is only marked loaded after its requests.
+        
+        RETURN: 
+                14-digit timestamp, None if no log of the sources has been fully mined
+    """
+    def get_mined_watermark(self, fact_table):
+        
+        sltl = SquidLogTableLoader(db=self._db_key_)
+        
+        try:
+            settled_time = sltl.get_settled_end_time(sources=self._MINED_SOURCES_[fact_table])
+        finally:
+            sltl.close_db()
+        
+        if settled_time == None:
+            return None
+        
+        return TP.timestamp_from_obj(settled_time.replace(minute=0, second=0, microsecond=0), 1, 3)
+    
+    """
+        Replaces the rows of a fact table from start_hour onwards (up to end_hour, exclusive, if given) with a fresh 
+        aggregation of the raw data and sets the watermark to new_watermark, in one transaction.  The watermark is left 
+        as it is when new_watermark is None.
+        
+        INPUT:
+                end_hour        - (kwarg) the hour after the last hour to re-aggregate
+        
+        RETURN: 
+                0 on success, -1 if the transaction is rolled back
+    """
+    def refresh_fact(self, fact_table, start_hour, new_watermark, **kwargs):
+        
+        start_hour = MySQLdb._mysql.escape_string(str(start_hour))
+        time_col = self._FACT_TIME_COL_[fact_table]
+        
+        delete_stmnt = "delete from %s where hr >= '%s'" % (fact_table, start_hour)
+        time_condition = "%s >= '%s'" % (time_col, start_hour)
+        
+        if 'end_hour' in kwargs:
+            end_hour = MySQLdb._mysql.escape_string(str(kwargs['end_hour']))
+            delete_stmnt = delete_stmnt + " and hr < '%s'" % end_hour
+            time_condition = time_condition + " and %s < '%s'" % (time_col, end_hour)
+        
+        statements = [delete_stmnt, self._FACT_SQL_[fact_table] % time_condition]
+        
+        if new_watermark != None:
+            new_watermark = MySQLdb._mysql.escape_string(str(new_watermark))
+            statements.append("insert into ltt_fact_watermark (fact_table, watermark) values ('%s', '%s') on duplicate key update watermark = values(watermark)" % \
+                              (fact_table, new_watermark))
+        
+        return self.execute_transaction(statements)
+    
+    """
+        Re-aggregate every fact table from its watermark (or over backfill_hours when it has none)
+        
+        INPUT:
+                backfill_hours      - (kwarg) hours aggregated for a fact table without a watermark
+                settle_hours        - (kwarg) hours before the current one that are re-aggregated by the next refresh, 
+                                      overrides _SETTLE_HOURS_ for every fact table
+        
+        RETURN: 
+                0 if every fact table was refreshed, -1 otherwise
+    """
+    def refresh(self, **kwargs):
+        
+        backfill_hours = self._BACKFILL_HOURS_
+        if 'backfill_hours' in kwargs:
+            if isinstance(kwargs['backfill_hours'], int) and kwargs['backfill_hours'] > 0:
+                backfill_hours = kwargs['backfill_hours']
+        
+        settle_hours = dict(self._SETTLE_HOURS_)
+        if 'settle_hours' in kwargs:
+            if isinstance(kwargs['settle_hours'], int) and kwargs['settle_hours'] >= 0:
+                for fact_table in settle_hours:
+                    settle_hours[fact_table] = kwargs['settle_hours']
+        
+        current_hour = datetime.datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+        backfill_start = TP.timestamp_from_obj(current_hour - datetime.timedelta(hours=backfill_hours), 1, 3)
+        
+        status = 0
+        
+        for fact_table in sorted(self._FACT_SQL_.keys()):
+            
+            start_hour = self.get_watermark(fact_table)
+            if start_hour == None:
+                start_hour = backfill_start
+            
+            new_watermark = TP.timestamp_from_obj(current_hour - datetime.timedelta(hours=settle_hours[fact_table]), 1, 3)
+            
+            """ The squid facts are not complete past the requests that have been mined - hold the watermark if none have """
+            if fact_table in self._MINED_SOURCES_:
+                mined_watermark = self.get_mined_watermark(fact_table)
+                if mined_watermark == None:
+                    new_watermark = start_hour
+                elif mined_watermark < new_watermark:
+                    new_watermark = mined_watermark
+            
+            """ Never move a watermark backwards """
+            if start_hour > new_watermark:
+                watermark = start_hour
+            else:
+                watermark = new_watermark
+            
+            logging.info('Refreshing %s from %s ...' % (fact_table, start_hour))
+            
+            if self.refresh_fact(fact_table, start_hour, watermark) < 0:
+                logging.error('Could not refresh %s, its watermark remains at %s.' % (fact_table, start_hour))
+                status = -1
+        
+        return status
+    
+    """
+        Re-aggregate every hour from start_time to end_time (inclusive) of the fact tables, e.g. after a log is re-mined 
+        or to backfill.  The watermarks are not moved.
+        
+        INPUT:
+                start_time          - 14-digit timestamp
+                end_time            - 14-digit timestamp
+                fact_tables         - (kwarg) list of the fact tables to refresh, defaults to all of them
+        
+        RETURN: 
+                0 if every fact table was refreshed, -1 otherwise
+    """
+    def refresh_range(self, start_time, end_time, **kwargs):
+        
+        fact_tables = sorted(self._FACT_SQL_.keys())
+        if 'fact_tables' in kwargs:
+            fact_tables = kwargs['fact_tables']
+        
+        start_hour = str(start_time).strip()[:10] + '0000'
+        end_hour = TP.timestamp_from_obj(TP.timestamp_to_obj(str(end_time).strip()[:10] + '0000', 1) + datetime.timedelta(hours=1), 1, 3)
+        
+        status = 0
+        
+        for fact_table in fact_tables:
+            
+            logging.info('Refreshing %s from %s to %s ...' % (fact_table, start_hour, end_hour))
+            
+            if self.refresh_fact(fact_table, start_hour, None, end_hour=end_hour) < 0:
+                logging.error('Could not refresh %s from %s to %s.' % (fact_table, start_hour, end_hour))
+                status = -1
+        
+        return status
+    
+        
 """
 
     CLASS :: IPCountryTableLoader
@@ -3118,6 +5145,14 @@ class LandingPageTableLoader(TableLoader):
 """
 class IPCountryTableLoader(TableLoader):
     
+    _IP_CACHE_SIZE_ = 10000
+    
+    """ The interval index is shared by all instances in the process - it is loaded on first use and by refresh_index """
+    _ip_from_ = None
+    _ip_to_ = None
+    _ip_country_ = None
+    _ip_cache_ = Hlp.LRUCache(_IP_CACHE_SIZE_)
+    
     def __init__(self, **kwargs):
         
         """ Call constructor of parent """
@@ -3125,43 +5160,127 @@ class IPCountryTableLoader(TableLoader):
     
     def __del__(self):
         self.close_db()
-
-
-    """ Given an IP localizes the country """
-    def localize_IP(self, ip_string):
+    
+    
+    """
+        Loads the ip_country table into sorted NumPy arrays of range boundaries so that lookups are resolved in memory by 
+        binary search.  Also clears the recent IP cache.
+        
+        RETURN: 
+                the number of ranges indexed, -1 on failure
+    """
+    def refresh_index(self):
+        
+        sql_stmnt = 'select ip_from, ip_to, country_ISO_1 from ip_country'
+        results = self.execute_SQL(sql_stmnt)
+        
+        if results == -1:
+            logging.error('Could not load the IP localization index.')
+            return -1
+        
+        ranges = list()
+        for row in results:
+            try:
+                ranges.append((int(row[0]), int(row[1]), str(row[2])))
+            except (TypeError, ValueError):
+                continue
+        
+        ranges.sort()
+        
+        IPCountryTableLoader._ip_from_ = np.array([r[0] for r in ranges], dtype=np.int64)
+        IPCountryTableLoader._ip_to_ = np.array([r[1] for r in ranges], dtype=np.int64)
+        IPCountryTableLoader._ip_country_ = np.array([r[2] for r in ranges], dtype=object)
+        IPCountryTableLoader._ip_cache_.clear()
+        
+        logging.info('Indexed %s IP ranges for localization.' % str(len(ranges)))
+        
+        return len(ranges)
+    
+    """
+        Converts a dotted quad IP string to its integer value
+        
+        RETURN: 
+                ip number, None if the string is not a valid IPv4 address
+    """
+    def get_IP_number(self, ip_string):
         
-        """ Compute IP number """
         try:
             ip_fields = ip_string.split('.')
             w = int(ip_fields[0])
             x = int(ip_fields[1])
             y = int(ip_fields[2])
             z = int(ip_fields[3])
-            
-            ip_num = 16777216 * w + 65536 * x + 256 * y + z;
-            
-            sql_stmnt = 'select country_ISO_1 from ip_country where ' + str(ip_num) + ' >= ip_from and ' + str(ip_num) + ' <= ip_to'
         
-        except:
-            
+        except (AttributeError, IndexError, ValueError):
+            return None
+        
+        return 16777216 * w + 65536 * x + 256 * y + z
+    
+    
+    """ Given an IP localizes the country """
+    def localize_IP(self, ip_string):
+        
+        country = self._ip_cache_.get(ip_string)
+        if country != None:
+            return country
+        
+        ip_num = self.get_IP_number(ip_string)
+        
+        if ip_num == None:
             logging.error('Country could not be localized from IP address string (formatting).')
             return 'None'
         
-        try:
-            self._cur_.execute(sql_stmnt)
-            row = self._cur_.fetchone()
-        
-        except:    
-            self._db_.rollback()
-            logging.error('Could not execute: ' + sql_stmnt)
+        if self._ip_from_ is None:
+            self.refresh_index()
         
-        try:
-            country = row[0]
-        except:
-            country = ''
+        country = self._lookup_IP_numbers(np.array([ip_num], dtype=np.int64))[0]
+        self._ip_cache_.put(ip_string, country)
         
         return country
     
+    """
+        Vectorized localization of a batch of IP addresses
+        
+        @param ip_list: list of dotted quad IP strings
+        
+        @return: list of country codes aligned with ip_list ('None' for malformed addresses, '' where no range matches)
+    """
+    def localize_IPs(self, ip_list):
+        
+        if self._ip_from_ is None:
+            self.refresh_index()
+        
+        ip_nums = list()
+        valid = list()
+        
+        for ip_string in ip_list:
+            ip_num = self.get_IP_number(ip_string)
+            valid.append(ip_num != None)
+            ip_nums.append(ip_num if ip_num != None else -1)
+        
+        countries = self._lookup_IP_numbers(np.array(ip_nums, dtype=np.int64))
+        
+        for index in range(len(countries)):
+            if not(valid[index]):
+                countries[index] = 'None'
+        
+        return countries
+    
+    """
+        Binary search of the range index - the candidate range for each number is the last one starting at or below it
+    """
+    def _lookup_IP_numbers(self, ip_nums):
+        
+        if self._ip_from_ is None or len(self._ip_from_) == 0:
+            return [''] * len(ip_nums)
+        
+        indices = np.searchsorted(self._ip_from_, ip_nums, side='right') - 1
+        in_range = (indices >= 0)
+        indices[~in_range] = 0
+        in_range &= (ip_nums <= self._ip_to_[indices])
+        
+        return np.where(in_range, self._ip_country_[indices], '').tolist()
+    
     
     """ Load  data into the IP localization table to associate IPs with countries """
     def load_IP_localization_table(self):
@@ -3203,6 +5322,11 @@ class IPCountryTableLoader(TableLoader):
                 except:
                     self._db_.rollback()
                     logging.error('Could not insert: ' + sql_stmnt)        
+        
+        self._db_.commit()
+        
+        """ Rebuild the in-memory index from the reloaded table """
+        self.refresh_index()
 
 
 """
@@ -3590,14 +5714,17 @@ class PageCategoryTableLoader(TableLoader):
     """
     def get_normalized_category_counts(self, page_id_list):
         
-        norm_results = NormalizedCategoryScoresTableLoader().get_all_rows()        
+        ncstl = NormalizedCategoryScoresTableLoader()
+        norm_results = ncstl.get_all_rows()        
         norm_cats = dict()
         
         for row in norm_results:
-            category = NormalizedCategoryScoresTableLoader().get_record_field(row, 'category')
-            portion = NormalizedCategoryScoresTableLoader().get_record_field(row, 'portion')
+            category = ncstl.get_record_field(row, 'category')
+            portion = ncstl.get_record_field(row, 'portion')
             norm_cats[category] = portion
         
+        ncstl.close_db()
+        
         category_counts = self.get_article_vector_counts(page_id_list)
         cat_count_total = 0.0
         
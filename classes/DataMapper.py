@@ -14,7 +14,7 @@ __date__ = "April 25th, 2011"
 
 
 """ Import python base modules """
-import sys, urlparse as up, httpagentparser, commands, cgi, re, gzip, os, datetime, logging, random, numpy as np
+import sys, re, os, stat, datetime, time, logging, random, collections, multiprocessing, numpy as np
 
 """ Import Analytics modules """
 import classes.DataLoader as DL
@@ -22,6 +22,8 @@ import classes.Helper as Hlp
 import config.settings as projSet
 import classes.TimestampProcessor as TP
 import classes.FundraiserDataHandler as FDH
+import classes.FileHandler as FH
+import classes.SquidLineParser as SLP
 
 """ CONFIGURE THE LOGGER """
 LOGGING_STREAM = sys.stderr
@@ -323,21 +325,16 @@ class DataMapper(object):
         
         
     """
-        Opens the logfile and counts the total number of lines
+        Opens the logfile for streaming.  The reader decompresses in a single pass and reports progress from the file 
+        offset (see FileHandler.SquidLogReader) so the file is not pre-scanned to count lines.
         
         @param logFileName: the full name of the logfile.  The local squid log folder is stored in web_reporting/settings.py
         
+        @return: a FileHandler.SquidLogReader
     """    
     def open_logfile(self, logFileName):        
         
-        if (re.search('\.gz', logFileName)):
-            logFile = gzip.open(projSet.__squid_log_local_home__ + logFileName, 'r')
-            total_lines_in_file = float(commands.getstatusoutput('zgrep -c "" ' + projSet.__squid_log_local_home__ + logFileName)[1])
-        else:
-            logFile = open(projSet.__squid_log_local_home__ + logFileName, 'r')
-            total_lines_in_file = float(commands.getstatusoutput('grep -c "" ' + projSet.__squid_log_local_home__ + logFileName)[1])
-
-        return logFile, total_lines_in_file
+        return FH.SquidLogReader(projSet.__squid_log_local_home__ + logFileName)
     
     
 """
@@ -350,6 +347,7 @@ class DataMapper(object):
         
         mine_squid_impression_requests        - mining banner impressions from squid logs
         mine_squid_landing_page_requests      - mining landing page views from squid logs
+        tail_log                              - incrementally mining a growing squid log
 
 """
 class FundraiserDataMapper(DataMapper):
@@ -360,19 +358,42 @@ class FundraiserDataMapper(DataMapper):
     _BANNER_FIELDS_ =  ' (start_timestamp, utm_source, referrer, country, lang, counts, on_minute) '
     _LP_FIELDS_ = ' (start_timestamp, utm_source, utm_campaign, utm_medium, landing_page, page_url, referrer_url, browser, lang, country, project, ip, request_time) '
     
+    _INSERT_BATCH_SIZE_ = 1000
+    _FLUSH_INTERVAL_ = 30
+    
+    """ Upper bound on concurrent mining processes - each worker holds its own set of DataLoader connections """
+    _MAX_MINER_WORKERS_ = 8
+    
+    """ Tail mining - seconds to wait at the end of the log and the bytes read per poll """
+    _TAIL_POLL_INTERVAL_ = 10
+    _TAIL_READ_SIZE_ = 1048576
+    _TAIL_MAX_POLL_BYTES_ = 16777216
+    
     def __init__(self):
         
         """ Initialize dataloaders and connections """
-        self._DL_impressions_ = DL.ImpressionTableLoader()
-        self._DL_LPrequests_ = DL.LandingPageTableLoader()
         self._DL_traffic_samples_ = DL.TrafficSamplesTableLoader()
         
+        self._parser_ = SLP.SquidLineParser()
+        self._ua_classifier_ = SLP.UserAgentClassifier()
+        
     
     """
         Determines if new logs may be waiting - if so they are copied and mined
+        
+        If 'day' is specified without 'hour' every hour of that day is copied (backfill).  Specifying 'workers' > 1 mines 
+        the copied logs in a pool of processes rather than sequentially.
     """
     def process_logs(self, **kwargs):
         
+        workers = 1
+        if 'workers' in kwargs:
+            try:
+                workers = int(kwargs['workers'])
+            except (TypeError, ValueError):
+                logging.error('Invalid number of workers: %s, mining sequentially.' % str(kwargs['workers']))
+            del kwargs['workers']
+        
         time_of_last_log = self.get_time_of_last_log()
         curr_time = datetime.datetime.now()
         
@@ -395,12 +416,26 @@ class FundraiserDataMapper(DataMapper):
             copied_banner_logs = self.copy_logs('banner',year=str(curr_time.year), month=str(curr_time.month), day=str(curr_time.day), hour=str(curr_time.hour), minute=minute_str)
             copied_lp_logs = self.copy_logs('lp',year=str(curr_time.year), month=str(curr_time.month), day=str(curr_time.day), hour=str(curr_time.hour), minute=minute_str)
         
+        elif 'day' in kwargs and not('hour' in kwargs):
+            
+            """ Backfill - copy the logs for each hour of the day """
+            copied_banner_logs = list()
+            copied_lp_logs = list()
+            
+            for hour in range(24):
+                copied_banner_logs.extend(self.copy_logs('banner', hour=str(hour), **kwargs))
+                copied_lp_logs.extend(self.copy_logs('lp', hour=str(hour), **kwargs))
+        
         else:
             
             copied_banner_logs = self.copy_logs('banner', **kwargs)
             copied_lp_logs = self.copy_logs('lp', **kwargs)
             # For Test -- copied_lp_logs = self.copy_logs('lp', year='2011', month='11', day='14', hour='03', minute='15')      
-            
+        
+        if workers > 1:
+            self.mine_logs_in_pool(copied_banner_logs, copied_lp_logs, workers)
+            return
+        
         """ Mine the latest logs """ 
         for banner_imp_file in copied_banner_logs:
             try:
@@ -420,35 +455,96 @@ class FundraiserDataMapper(DataMapper):
                 logging.error(inst)
                 logging.error('Could not mine contents of %s, it appears that it does not exist. ' % lp_view_file)
     
-     
+    
     """
-        Remove banner impression or landing page squid records from tables before loading 
+        Fans the logs out to a pool of mining processes.  Each worker process creates its own FundraiserDataMapper (and so its 
+        own DataLoader connections) and is replaced after every log so that connections are released as each file completes.  
+        A failure while mining one log is logged and does not affect the others.  
+        
+        Every log is recorded under the time its local copy was made (see get_log_copy_time) so that each has its own 
+        progress record in squid_log_record.  Should that time already be taken - by another log of the batch or an existing 
+        record - the next free second is used.
+        
+        @param banner_logs: list of banner impression log filenames
+        @param lp_logs: list of landing page log filenames
+        @param workers: number of concurrent mining processes (capped at _MAX_MINER_WORKERS_)
+        
+        @return: list of filenames that could not be mined
     """
-    def _clear_squid_records(self, start, request_type):
+    def mine_logs_in_pool(self, banner_logs, lp_logs, workers):
+        
+        workers = max(min(workers, self._MAX_MINER_WORKERS_, multiprocessing.cpu_count()), 1)
         
-        """ Ensure that the range is correct; otherwise abort - critical that outside records are not deleted """
-        timestamp = TP.timestamp_convert_format(start,1,2)
+        logs = [[log_name, self._BANNER_REQUEST_] for log_name in banner_logs] + [[log_name, self._LP_REQUEST_] for log_name in lp_logs]
+        
+        jobs = list()
+        copy_times = list()
+        sltl = DL.SquidLogTableLoader()
         
         try:
-            if request_type == self._BANNER_REQUEST_:
-                self._DL_impressions_.delete_row(timestamp)
-            elif request_type == self._LP_REQUEST_:
-                self._DL_LPrequests_.delete_row(timestamp)
-            
-            logging.info("Executed delete for start time " + timestamp)
+            for log_name, request_type in logs:
+                
+                copy_time_obj = TP.timestamp_to_obj(self.get_log_copy_time(log_name), 1)
+                log_copy_time = TP.timestamp_from_obj(copy_time_obj, 1, 3)
+                
+                while log_copy_time in copy_times or sltl.get_table_row(log_copy_time) != None:
+                    copy_time_obj = copy_time_obj + datetime.timedelta(seconds=1)
+                    log_copy_time = TP.timestamp_from_obj(copy_time_obj, 1, 3)
+                
+                copy_times.append(log_copy_time)
+                jobs.append([log_name, request_type, log_copy_time])
+        finally:
+            sltl.close_db()
         
-        except Exception as inst:
-            
-            logging.error("Could not execute delete for start time " + timestamp) 
+        if len(jobs) == 0:
+            return list()
+        
+        logging.info('Mining %s logs with %s worker processes.' % (str(len(jobs)), str(workers)))
+        
+        pool = multiprocessing.Pool(processes=workers, maxtasksperchild=1)
+        failed_logs = list()
+        completed = 0
+        
+        try:
+            for log_name, success, message in pool.imap_unordered(mine_log_worker, jobs):
+                
+                completed = completed + 1
+                
+                if success:
+                    logging.info('Mined %s (%s of %s logs complete).' % (log_name, str(completed), str(len(jobs))))
+                else:
+                    failed_logs.append(log_name)
+                    logging.error('Could not mine %s (%s of %s logs complete): %s' % (log_name, str(completed), str(len(jobs)), message))
             
-            logging.error(type(inst))     # the exception instance
-            logging.error(inst.args)     # arguments stored in .args
-            logging.error(inst)           # __str__ allows args to printed directly
+            pool.close()
             
-            """ Die if the records cannot be removed """
-            sys.exit()
-
+        except KeyboardInterrupt:
+            pool.terminate()
+            raise
+        
+        finally:
+            pool.join()
+        
+        logging.info('Pooled mining complete: %s logs mined, %s failed.' % (str(len(jobs) - len(failed_logs)), str(len(failed_logs))))
         
+        return failed_logs
+    
+     
+    """
+        The time (UTC) at which a log was copied - the modification time of the local copy, the current time if it cannot 
+        be read.
+        
+        @return: 14-digit timestamp
+    """
+    def get_log_copy_time(self, logFileName):
+        
+        try:
+            copy_time_obj = datetime.datetime.utcfromtimestamp(os.path.getmtime(projSet.__squid_log_local_home__ + logFileName))
+        except OSError:
+            copy_time_obj = datetime.datetime.utcnow()
+        
+        return TP.timestamp_from_obj(copy_time_obj, 1, 3)
+    
     """
         Given the name of a log file extract the squid requests corresponding to banner impressions.
         
@@ -458,7 +554,7 @@ class FundraiserDataMapper(DataMapper):
         @type logFileName: string
         
     """
-    def mine_squid_impression_requests(self, logFileName):
+    def mine_squid_impression_requests(self, logFileName, **kwargs):
 
         logging.info('Begin mining of banner impressions in %s' % logFileName)
         
@@ -468,23 +564,24 @@ class FundraiserDataMapper(DataMapper):
         """ Retrieve the log timestamp from the filename """
         time_stamps = self.get_timestamps_with_interval(logFileName, self._log_copy_interval_)
         
-        """ retrieve the start time of the log """
-        start = self.get_first_timestamp_from_log(logFileName)
+        """ Initialization - open the file and retrieve the start time of the log from its first request """
+        logFile = self.open_logfile(logFileName)
+        start = logFile.get_first_timestamp()
+        
+        if start == None:
+            logging.error('No timestamped requests found in %s' % logFileName)
+            logFile.close()
+            return
 
         end = time_stamps[1]
-        curr_time = TP.timestamp_from_obj(datetime.datetime.now(),1,3)
-                                
-        """ Initialization - open the file """
-        logFile, total_lines_in_file = self.open_logfile(logFileName)        
-        queryIndex = 4;
+        curr_time = TP.timestamp_from_obj(datetime.datetime.utcnow(),1,3)
+        if 'log_copy_time' in kwargs:
+            curr_time = kwargs['log_copy_time']
     
-        counts = Hlp.AutoVivification()
-        # insertStmt = 'INSERT INTO ' + self._impression_table_name_ + self._BANNER_FIELDS_ + ' values '
+        """ Impression counts keyed on (banner, country, project, language, minute) """
+        counts = collections.Counter()
 
         
-        """ Clear the old records """
-        self._clear_squid_records(start, self._BANNER_REQUEST_)
-        
         """ Add a row to the SquidLogTable """
         sltl.insert_row(type='banner_impression',log_copy_time=curr_time,start_time=start,end_time=end,log_completion_pct='0.0',total_rows='0')
         
@@ -505,124 +602,55 @@ class FundraiserDataMapper(DataMapper):
         
         line = logFile.readline()
         while (line != ''):
-    
-            lineArgs = line.split()
             
-            """ 
-                Parse the Timestamp:
-                
-                Sample timestamp:
-                    timestamp = "2011-06-01T23:00:07.612"
-            """
+            request_key = self._parser_.parse_impression_line(line)
+            line = logFile.readline()
             
-            try:
-                time_stamp = lineArgs[2]
-                time_bits = time_stamp.split('T')
-                date_fields = time_bits[0].split('-')
-                time_fields = time_bits[1].split(':')                
-                time_stamp = date_fields[0] + date_fields[1] + date_fields[2] + time_fields[0] + time_fields[1] + '00'
-                
-            except (ValueError, IndexError):
-                line = logFile.readline()
-                total_lines_in_file = total_lines_in_file - 1
+            if request_key == None:
                 continue
-                # pass
- 
     
-            """ 
-                Parse the URL:
-                
-                Sample url:
-                    url = "http://meta.wikimedia.org/w/index.php?title=Special:BannerLoader&banner=B20110601_JWJN001_BR&userlang=pt&db=ptwiki&sitename=Wikip%C3%A9dia&country=BR"
-            """
-    
-            try:
-                url = lineArgs[8]
-            except IndexError:
-                url = 'Unavailable'
-    
-            parsedUrl = up.urlparse(url)
-            query = parsedUrl[queryIndex]
-            queryBits = cgi.parse_qs(query)
-    
-            """ Extract - project, banner, language, & country data from the url """
-            project = ''
-            if ('db' in queryBits.keys()):
-                project = queryBits['db'][0]
-    
-            if (project == '' and 'sitename' in queryBits.keys()):
-                sitename = queryBits['sitename'][0];
-                if sitename:
-                    project = sitename
-                else:
-                    project = 'NONE'
-    
-            if ('banner' in queryBits.keys()):
-                banner = queryBits['banner'][0]
-            else:
-                banner = 'NONE'
-    
-            if ('userlang' in queryBits.keys()):
-                lang = queryBits['userlang'][0]
-            else:
-                lang = 'NONE'
-    
-            if ('country' in queryBits.keys()):
-                country = queryBits['country'][0]
-            else:
-                country = 'NONE'
-    
-            """ Group banner impression counts based on (banner, country, project, language) """
-            try:
-                counts[banner][country][project][lang][time_stamp] = counts[banner][country][project][lang][time_stamp] + 1                
-            except TypeError:
-                counts[banner][country][project][lang][time_stamp] = 1
-
+            """ Group banner impression counts based on (banner, country, project, language, minute) """
+            counts[request_key] += 1
 
-            line = logFile.readline()
             line_count = line_count + 1
             
             """ Log Miner Logging - Update the squid_log_record table """
-            if line_count % 10000 == 0 or line_count == total_lines_in_file:
-                completion = float(line_count / total_lines_in_file) * 100.0
+            if line_count % 10000 == 0:
+                completion = min(logFile.get_completion_pct(), sltl.LOADED_PCT - 1)
                 sltl.update_table_row(type='banner_impression',log_copy_time=curr_time,start_time=start,end_time=end,log_completion_pct=completion.__str__(),total_rows=line_count.__str__())
 
         """ ====== FILE COMPLETE ====== """
         logFile.close()
         
         """ 
-            Break out impression data by minute.  This conditional detects when a request with a previously unseen minute in the timestamp appears.
-         
-            Run through the counts dictionary and insert a row into the banner impressions table for each entry 
+            Break out impression data by minute - each counter entry becomes a row in the banner impressions table 
         """
-    
-        bannerKeys = counts.keys()
-        for banner_ind in range(len(bannerKeys)):
-            banner = bannerKeys[banner_ind]
-            countryCounts = counts[banner]
-            countryKeys = countryCounts.keys()
-    
-            for country_ind in range(len(countryKeys)):
-                country = countryKeys[country_ind]
-                projectCounts = countryCounts[country]
-                projectKeys = projectCounts.keys()
-    
-                for project_ind in range(len(projectKeys)):
-                    project = projectKeys[project_ind]
-                    langCounts = projectCounts[project]
-                    langKeys = langCounts.keys()
-    
-                    for lang_ind in range(len(langKeys)):
-                        lang = langKeys[lang_ind]
-                        timestampCounts = langCounts[lang]
-                        timestampKeys = timestampCounts.keys()
-                        
-                        for timestamp_ind in range(len(timestampKeys)):
-                            timestamp = timestampKeys[timestamp_ind]
-                            count = timestampCounts[timestamp]
-                                                    
-                            itl.insert_row(utm_source_arg=banner, referrer_arg=project, country_arg=country, lang_arg=lang, counts_arg=str(count), on_minute_arg=timestamp, start_timestamp_arg=start)
-                            
+        rows = list()
+        
+        for (banner, country, project, lang, timestamp), count in counts.iteritems():
+            rows.append({'utm_source_arg' : banner, 'referrer_arg' : project, 'country_arg' : country, 'lang_arg' : lang, \
+                         'counts_arg' : str(count), 'on_minute_arg' : timestamp, 'start_timestamp_arg' : start})
+        
+        """ Stage the aggregates in bulk and swap them in - a re-mined log replaces its old counts in one transaction """
+        if itl.reload_rows(rows, start, batch_size=self._INSERT_BATCH_SIZE_) < 0:
+            logging.error('Could not load banner impression aggregates for %s' % logFileName)
+            
+            """ Mark the log as failed so that its hours are not taken as settled """
+            sltl.update_table_row(type='banner_impression',log_copy_time=curr_time,start_time=start,end_time=end,log_completion_pct=str(sltl.FAILED_PCT),total_rows=line_count.__str__())
+        else:
+            logging.info('Loaded %s banner impression aggregates from %s' % (str(len(rows)), logFileName))
+            
+            """ The log is only marked complete once its aggregates are loaded """
+            sltl.update_table_row(type='banner_impression',log_copy_time=curr_time,start_time=start,end_time=end,log_completion_pct=str(sltl.LOADED_PCT),total_rows=line_count.__str__())
+            
+            """ Re-aggregate the rollups of every minute the log covers """
+            minutes = [request_key[4] for request_key in counts] + [start, end]
+            if DL.MinutelyRollupTableLoader().refresh_impressions(min(minutes), max(minutes)) < 0:
+                logging.error('Could not refresh the banner impression rollups for %s' % logFileName)
+            
+            """ A re-mined log replaces counts that the long term trends facts may already hold """
+            if DL.LongTermTrendsFactLoader().refresh_range(min(minutes), max(minutes), fact_tables=['ltt_hourly_impressions']) < 0:
+                logging.error('Could not refresh the long term trends impressions for %s' % logFileName)
         
 
 
@@ -636,44 +664,45 @@ class FundraiserDataMapper(DataMapper):
         @type logFileName: string
 
     """
-    def mine_squid_landing_page_requests(self,  logFileName):
+    def mine_squid_landing_page_requests(self,  logFileName, **kwargs):
 
         logging.info('Begin mining of landing page requests in %s' % logFileName)
         
         """ Create the dataloaders and initialize """
         sltl = DL.SquidLogTableLoader()
-        lptl = DL.LandingPageTableLoader()
+        lptl = DL.LandingPageTableLoader(batch_size=self._INSERT_BATCH_SIZE_, flush_interval=self._FLUSH_INTERVAL_, staging=True)
         ipctl = DL.IPCountryTableLoader()
         
+        mining_start = time.time()
+        
         """ Retrieve the log timestamp from the filename """
         time_stamps = self.get_timestamps_with_interval(logFileName, self._log_copy_interval_)
         
         end = time_stamps[1]
         curr_time = TP.timestamp_from_obj(datetime.datetime.utcnow(),1,3)
+        if 'log_copy_time' in kwargs:
+            curr_time = kwargs['log_copy_time']
         
-        """ retrieve the start time of the log """
-        start = self.get_first_timestamp_from_log(logFileName)
+        """ Initialization - open the file and retrieve the start time of the log from its first request """
+        logFile = self.open_logfile(logFileName)
+        start = logFile.get_first_timestamp()
         
-        """ Initialization - open the file """
-        logFile, total_lines_in_file = self.open_logfile(logFileName)
-    
-        # Initialization
-        hostIndex = 1;
-        queryIndex = 4;
-        pathIndex = 2;
+        if start == None:
+            logging.error('No timestamped requests found in %s' % logFileName)
+            logFile.close()
+            return
     
-        """ Clear the old records """
-        self._clear_squid_records(start, self._LP_REQUEST_)
-        
         """ Add a row to the SquidLogTable """
         sltl.insert_row(type='lp_view',log_copy_time=curr_time,start_time=start,end_time=end,log_completion_pct='0.0',total_rows='0')
 
         line_count = 0
         requests_loaded = 0
+        load_failed = False
+        first_request = None
+        last_request = None
         
-        """ Extract the mining patterns from the DB """
-        mptl = DL.MiningPatternsTableLoader()
-        lp_patterns = mptl.get_pattern_lists()[1]
+        """ Compile the landing page mining patterns from the DB - the matcher picks up pattern changes while mining """
+        lp_matcher = SLP.LandingPageMatcher(pattern_loader=DL.MiningPatternsTableLoader())
 
 
         """
@@ -691,263 +720,480 @@ class FundraiserDataMapper(DataMapper):
         line = logFile.readline()
         while (line != ''):
             
-            lineArgs = line.split()
-    
-            """ Get the IP Address of the donor """
-            ip_add = lineArgs[4];
-    
-    
-            #  SELECT CAST('20070529 00:00:00' AS datetime)
-
-            """ 
-                Parse the Timestamp:
+            request_fields = self.parse_landing_page_request(line, lp_matcher, ipctl)
+            line = logFile.readline()
+            line_count = line_count + 1 
+            
+            """ Insert record into the landing_page_requests table """
+            if request_fields != None:
                 
-                Sample timestamp:
-                    timestamp = "2011-06-01T23:00:07.612"
-            """
-
-    
-            date_and_time = lineArgs[2];
-    
-            date_string = date_and_time.split('-')
-            time_string = date_and_time.split(':')
-    
-            # if the date is not logged ignoere the record
-            try:
-                year = date_string[0]
-                month = date_string[1]
-                day = date_string[2][:2]
-                hour = time_string[0][-2:]
-                min = time_string[1]
-                sec = time_string[2][:2]
-            except:
-                line = logFile.readline()
-                total_lines_in_file = total_lines_in_file - 1
-                continue
-    
-            timestamp_string = year + '-' + month + '-' + day + " " + hour + ":" + min + ":" + sec                
-    
-            """ 
-                Process referrer URL
-                =================== 
+                request_fields['start_timestamp_arg'] = start
+                if lptl.buffer_row(**request_fields) < 0:
+                    load_failed = True
                 
-                Sample referrer:
-                    referrer_url = http://en.wikipedia.org/wiki/File:Murphy_High_School.jpg
-            """
+                requests_loaded = requests_loaded + 1
                 
+                if first_request == None or request_fields['timestamp_arg'] < first_request:
+                    first_request = request_fields['timestamp_arg']
+                if last_request == None or request_fields['timestamp_arg'] > last_request:
+                    last_request = request_fields['timestamp_arg']
+    
+            """ Log Miner Logging - Update the squid_log_record table """
+            if (line_count % 1000) == 0:
+                completion = min(logFile.get_completion_pct(), sltl.LOADED_PCT - 1)
+                sltl.update_table_row(type='lp_view',log_copy_time=curr_time,start_time=start,end_time=end,log_completion_pct=completion.__str__(),total_rows=line_count.__str__())
+        
+        """ ====== FILE COMPLETE ====== """
+        logFile.close()
+        
+        """ Write out any buffered requests, swap the staged requests in and report the load rate """
+        if lptl.flush_rows() < 0 or load_failed:
+            logging.error('Could not stage all landing page requests from %s, existing requests were kept.' % logFileName)
+            load_failed = True
+        elif lptl.swap_staged_rows(start) < 0:
+            logging.error('Could not swap in the landing page requests from %s, existing requests were kept.' % logFileName)
+            load_failed = True
+        
+        """ The log is only marked complete once its requests are swapped in, a failed load is marked so that its hours are not taken as settled """
+        if load_failed:
+            sltl.update_table_row(type='lp_view',log_copy_time=curr_time,start_time=start,end_time=end,log_completion_pct=str(sltl.FAILED_PCT),total_rows=line_count.__str__())
+        else:
+            sltl.update_table_row(type='lp_view',log_copy_time=curr_time,start_time=start,end_time=end,log_completion_pct=str(sltl.LOADED_PCT),total_rows=line_count.__str__())
+            
+            """ Re-aggregate the rollups of every minute the log covers """
+            minutes = [start, end]
+            if first_request != None:
+                minutes.extend([TP.timestamp_convert_format(first_request,2,1), TP.timestamp_convert_format(last_request,2,1)])
+            
+            if DL.MinutelyRollupTableLoader().refresh_landing_pages(min(minutes), max(minutes)) < 0:
+                logging.error('Could not refresh the landing page rollups for %s' % logFileName)
+            
+            """ A re-mined log replaces requests that the long term trends facts may already hold """
+            if DL.LongTermTrendsFactLoader().refresh_range(min(minutes), max(minutes), fact_tables=['ltt_hourly_views']) < 0:
+                logging.error('Could not refresh the long term trends views for %s' % logFileName)
+        
+        elapsed = time.time() - mining_start
+        rows_written = lptl.get_rows_written()
+        
+        if elapsed > 0:
+            logging.info('Loaded %s of %s landing page requests from %s in %.2f seconds (%.1f rows/sec)' % \
+                         (str(rows_written), str(requests_loaded), logFileName, elapsed, rows_written / elapsed))
+        
+        ua_stats = self._ua_classifier_.get_stats()
+        logging.info('User agent cache: %s hits, %s misses, %s entries.' % (str(ua_stats['hits']), str(ua_stats['misses']), str(ua_stats['size'])))
+        
+        #self._close_db()
+        
+
+    """
+        Parses a landing page request line and determines whether it should be loaded
+        
+        @param line: squid log line
+        @type line: string
+        
+        @param lp_matcher: SquidLineParser.LandingPageMatcher compiled from the mining_patterns table
+        @param ipctl: IPCountryTableLoader used to localize requests whose country is ambiguous
+        
+        @return: dict of LandingPageTableLoader.insert_row arguments (without the start timestamp), None if the request is 
+            not a valid landing page view
+    """
+    def parse_landing_page_request(self, line, lp_matcher, ipctl):
+        
+        parser = self._parser_
+        line_args = parser.split_line(line)
+        
+        """ Get the IP Address of the donor """
+        ip_add = parser.get_field(line_args, parser.IP_INDEX, None)
+        
+        """ 
+            Parse the Timestamp:
+            
+            Sample timestamp:
+                timestamp = "2011-06-01T23:00:07.612"
+        """
+        timestamp_string = parser.get_mysql_timestamp(parser.get_field(line_args, parser.TIMESTAMP_INDEX, ''))
+        
+        # if the date is not logged ignore the record
+        if timestamp_string == None or ip_add == None:
+            return None
+        
+        """ 
+            Process referrer URL
+            =================== 
+            
+            Sample referrer:
+                referrer_url = http://en.wikipedia.org/wiki/File:Murphy_High_School.jpg
+        """
+        referrer_url = parser.get_field(line_args, parser.REFERRER_INDEX, 'Unavailable')
+        hostname = parser.split_url(referrer_url)[0].split('.')
+        
+        """ If the hostname of the form '<lang>.<project>.org' """
+        if ( len( hostname[0] ) <= 2 ) :
+            project = hostname[0]                  # wikimediafoundation.org
+            source_lang = hostname[0]
+        else:
             try:
-                referrer_url = lineArgs[11]
+                """ species.wikimedia vs en.wikinews """
+                project = hostname[0] if ( hostname[1] == 'wikimedia' ) else hostname[1]    
+                """ pl.wikipedia vs commons.wikimedia """
+                source_lang = hostname[0] if ( len(hostname[1]) < 5 ) else 'en'             
             except IndexError:
-                referrer_url  = 'Unavailable'
+                project = 'wikipedia'   # default project to 'wikipedia'
+                source_lang = 'en'      # default lang to english
+        
+        """
+            Process User agent string
+            ========================
+            
+            sample user agent string:
+                user_agent_string = Mozilla/4.0%20(compatible;%20MSIE%208.0;%20Windows%20NT%206.1;%20WOW64;%20Trident/4.0;%20FunWebProducts;%20GTB6.6;%20SLCC2;%20.NET%20CLR%202.0.50727;%20.NET%20CLR%203.5.30729;%20.NET%20CLR%203.0.30729;%20Media%20Center%20PC%206.0;%20HPDTDF;%20.NET4.0C)
+            
+        """
+        user_agent_string = parser.get_field(line_args, parser.USER_AGENT_INDEX, '')
+        browser = self._ua_classifier_.classify(user_agent_string)
+        
+        """
+             Process landing URL
+             ===================
+             
+             sample landing urls:
+             
+                 landing_url = "http://wikimediafoundation.org/w/index.php?title=WMFJA085/en/US&utm_source=donate&utm_medium=sidebar&utm_campaign=20101204SB002&country_code=US&referrer=http%3A%2F%2Fen.wikipedia.org%2Fwiki%2FFile%3AMurphy_High_School.jpg"
+                 landing_url = "http://wikimediafoundation.org/wiki/WMFJA1/ru"
+                 landing_url = *donate.wikimedia.org/wiki/Special:FundraiserLandingPage?uselang=en&country=US&template=Lp-layout-default&appeal=Appeal-default&form-countryspecific=Form-countryspecific-control&utm_medium=sitenotice&utm_source=B11_Donate_Jimmy_Control&utm_campaign=C11_1107
+        """
+        landing_url = parser.get_field(line_args, parser.URL_INDEX, 'Unavailable')
+        
+        landing_host, landing_path, landing_query = parser.split_url(landing_url)
+        query_fields = parser.parse_query(landing_query, parser.LP_QUERY_KEYS)
+        path_pieces = landing_path.split('/')
+        
+        include_request, url_match = lp_matcher.evaluate(landing_url, landing_host, query_fields, path_pieces)
+        
+        if not(include_request):
+            return None
+        
+        """ Extract the language from the query string 
                 
-            parsed_referrer_url = up.urlparse(referrer_url)
-    
-            if (parsed_referrer_url[hostIndex] == None):
-                project = 'NONE';
-                source_lang = 'NONE';
+            the language has already been read from the url path but if it
+            exists in  the query string this setting should take precedence
+        """
+        if 'language' in query_fields:
+            source_lang = query_fields['language']
+        
+        # http://wikimediafoundation.org/wiki/
+        if url_match == lp_matcher.URL_MATCH_WIKI: 
+            
+            """ Address cases where the query string does not contain the landing page - ...wikimediafoundation.org/wiki/... """
+            landing_page = path_pieces[2];
+            
+            # URLs of the form ...?county_code=<iso_code>
+            if 'country' in query_fields:
+                country = query_fields['country']
+            
+            # URLs of the form ...<path>/ <lp_name>/<lang>/<iso_code>
             else:
-                hostname = parsed_referrer_url[hostIndex].split('.')
+                try:
+                    if len(path_pieces) == 5:
+                        country = path_pieces[4] 
+                    else:
+                        country = path_pieces[3]
+                        
+                except IndexError:
+                    
+                    logging.info('Could not parse country from landing path: %s', landing_url)
+                    return None
+
+        # http://wikimediafoundation.org/w/index.php? 
+        elif url_match == lp_matcher.URL_MATCH_INDEX:
+            
+            try:
+                
+                """ URLs of the form ...?title=<lp_name> """
+                lp_country = query_fields['title'].split('/')
+                landing_page = lp_country[0]
                 
-                """ If the hostname of the form '<lang>.<project>.org' """
-                if ( len( hostname[0] ) <= 2 ) :
-                    # referrer_path = parsed_referrer_url[pathIndex].split('/')
-                    project = hostname[0]                  # wikimediafoundation.org
-                    source_lang = hostname[0]
+                """ URLs of the form ...?county_code=<iso_code> """
+                if 'country' in query_fields:
+                    country = query_fields['country']
+                    
+                    """ URLs of the form ...?title=<lp_name>/<lang>/<iso_code> """
+                elif len(lp_country) == 3:
+                    country = lp_country[2]
                 else:
-                    try:
-                        """ species.wikimedia vs en.wikinews """
-                        project = hostname[0] if ( hostname[1] == 'wikimedia' ) else hostname[1]    
-                        """ pl.wikipedia vs commons.wikimedia """
-                        source_lang = hostname[0] if ( len(hostname[1]) < 5 ) else 'en'             
-                    except:
-                        project = 'wikipedia'   """ default project to 'wikipedia' """
-                        source_lang = 'en'      """ default lang to english """
-            
-            """
-                Process User agent string
-                ========================
+                    country = lp_country[1]                                                
                 
-                sample user agent string:
-                    user_agent_string = Mozilla/4.0%20(compatible;%20MSIE%208.0;%20Windows%20NT%206.1;%20WOW64;%20Trident/4.0;%20FunWebProducts;%20GTB6.6;%20SLCC2;%20.NET%20CLR%202.0.50727;%20.NET%20CLR%203.5.30729;%20.NET%20CLR%203.0.30729;%20Media%20Center%20PC%206.0;%20HPDTDF;%20.NET4.0C)
+            except (KeyError, IndexError):
                 
-            """
-            
-            try:
-                user_agent_string = lineArgs[13]
-            except IndexError:
-                user_agent_string = ''
+                logging.info('Could not parse landing page request from query string: %s', landing_url)
+                return None
+
+        # donate.wikimedia.org/wiki/Special:FundraiserLandingPage?
+        elif url_match == lp_matcher.URL_MATCH_DONATE:
             
             try:
-                user_agent_fields = httpagentparser.detect(user_agent_string)
-                browser = 'NONE'
-        
-                # Check to make sure fields exist
-                if len(user_agent_fields['browser']) != 0:
-                    if len(user_agent_fields['browser']['name']) != 0:
-                        browser = user_agent_fields['browser']['name']
-            except:
+                # e.g. uselang=en&country=US&template=Lp-layout-default&appeal=Appeal-default&form-countryspecific=Form-countryspecific-control&utm_medium=sitenotice&utm_source=B11_Donate_Jimmy_Control&utm_campaign=C11_1107
                 
-                logging.error('Could not process user agent string.')
-                browser = 'NONE'
+                source_lang = query_fields['uselang']
+                country = query_fields['country']
                 
+                landing_page = query_fields['template'].split('-')[2] + '~' + query_fields['appeal-template'].split('-')[2] + '~' + query_fields['appeal'].split('-')[1] + \
+                '~' + query_fields['form-template'].split('-')[2] + '~' + query_fields['form-countryspecific'].split('-')[2] 
                 
-            """
-                 Process landing URL
-                 ===================
-                 
-                 sample landing urls:
-                 
-                     landing_url = "http://wikimediafoundation.org/w/index.php?title=WMFJA085/en/US&utm_source=donate&utm_medium=sidebar&utm_campaign=20101204SB002&country_code=US&referrer=http%3A%2F%2Fen.wikipedia.org%2Fwiki%2FFile%3AMurphy_High_School.jpg"
-                     landing_url = "http://wikimediafoundation.org/wiki/WMFJA1/ru"
-                     landing_url = *donate.wikimedia.org/wiki/Special:FundraiserLandingPage?uselang=en&country=US&template=Lp-layout-default&appeal=Appeal-default&form-countryspecific=Form-countryspecific-control&utm_medium=sitenotice&utm_source=B11_Donate_Jimmy_Control&utm_campaign=C11_1107
-            """
+            except (KeyError, IndexError):
+                return None
+        
+        else:
+            return None
+        
+        """ If country is confused with the language use the ip """
+        if country == country.lower():
+            country = ipctl.localize_IP(ip_add) 
+                        
+        """ Ensure fields providing request ID exist """
+        try:
+            utm_source = query_fields['utm_source']
+            utm_campaign = query_fields['utm_campaign']
+            utm_medium = query_fields['utm_medium']
+        
+        except KeyError:
+            return None
+        
+        return {'utm_source_arg' : utm_source, 'utm_campaign_arg' : utm_campaign, 'utm_medium_arg' : utm_medium, 'landing_page_arg' : landing_page, \
+                'page_url_arg' : landing_url, 'referrer_url_arg' : referrer_url, 'browser_arg' : browser, 'lang_arg' : source_lang, \
+                'country_arg' : country, 'project_arg' : project, 'ip_arg' : ip_add, 'timestamp_arg' : timestamp_string}
+    
+    
+    """
+        Follows a growing udp2log file (or named pipe) and loads only the requests appended since the previous poll.  Banner 
+        impressions are aggregated per poll and added to the minute counts already in banner_impressions 
+        (ImpressionTableLoader.upsert_multiple_rows); landing page requests are appended to landing_page_requests.  Only 
+        complete lines are processed, a partially written line is held until the remainder arrives.  The minutely rollups 
+        (MinutelyRollupTableLoader) of the minutes touched by each poll are refreshed once its requests are loaded.
+        
+        After each poll the byte offset of the last complete line is checkpointed in squid_log_record under the type 
+        'banner_tail' or 'lp_tail', with end_time set to the latest minute loaded.  On restart mining resumes from the 
+        checkpoint when it belongs to the same file (the same first request timestamp and the file is not shorter than the 
+        offset), otherwise the file is read from the beginning.  Pipes cannot be rewound and are always read from their current 
+        position.  The requests of a poll and its checkpoint are written in one transaction (on the squid_log_record loader's 
+        connection) so an interrupted poll is loaded again in full on restart and never counted twice.  A poll that cannot be 
+        buffered or loaded stops the miner at the last checkpoint.
+        
+        @param log_path: the full path of the log file or named pipe
+        @type log_path: string
+        
+        @param request_type: _BANNER_REQUEST_ or _LP_REQUEST_
+        
+        kwargs:
+            poll_interval     - seconds to wait for new data once the end of the file is reached
+            max_polls         - stop after this many polls, by default the log is followed indefinitely
+    """
+    def tail_log(self, log_path, request_type, **kwargs):
+        
+        poll_interval = self._TAIL_POLL_INTERVAL_
+        if 'poll_interval' in kwargs:
+            if isinstance(kwargs['poll_interval'], (int, float)) and kwargs['poll_interval'] >= 0:
+                poll_interval = kwargs['poll_interval']
+        
+        max_polls = None
+        if 'max_polls' in kwargs:
+            if isinstance(kwargs['max_polls'], int) and kwargs['max_polls'] > 0:
+                max_polls = kwargs['max_polls']
+        
+        sltl = DL.SquidLogTableLoader()
+        mrtl = DL.MinutelyRollupTableLoader()
+        
+        if request_type == self._BANNER_REQUEST_:
+            record_type = 'banner_tail'
+            itl = DL.ImpressionTableLoader()
+        else:
+            record_type = 'lp_tail'
+            lptl = DL.LandingPageTableLoader(batch_size=self._INSERT_BATCH_SIZE_, auto_flush=False)
+            ipctl = DL.IPCountryTableLoader()
+            lp_matcher = SLP.LandingPageMatcher(pattern_loader=DL.MiningPatternsTableLoader())
+        
+        """ The checkpoints and banner upserts depend on schema changes that may not have been applied """
+        if not(sltl.has_byte_offset()) or (request_type == self._BANNER_REQUEST_ and not(itl.has_minute_key())):
+            logging.error('Cannot tail %s until the schema changes in sql/create_tables_faulkner.sql.txt are applied.' % log_path)
+            return 0
+        
+        is_pipe = stat.S_ISFIFO(os.stat(log_path).st_mode)
+        log_fd = os.open(log_path, os.O_RDONLY)
+        
+        start = None
+        latest = None
+        offset = 0
+        line_count = 0
+        record_exists = False
+        log_copy_time = TP.timestamp_from_obj(datetime.datetime.utcnow(),1,3)
+        
+        """ Resume from the checkpoint if it was written for this file """
+        if not is_pipe:
             
-            try:
-                landing_url = lineArgs[8]
-            except IndexError:
-                landing_url = 'Unavailable'
-                
-            hostIndex = 1
-            queryIndex = 4
-            pathIndex = 2
+            logFile = FH.SquidLogReader(log_path)
+            start = logFile.get_first_timestamp()
+            logFile.close()
             
-            parsed_landing_url = up.urlparse(landing_url)
-            query_fields = cgi.parse_qs(parsed_landing_url[queryIndex]) # Get the banner name and lang
-            path_pieces = parsed_landing_url[pathIndex].split('/')
-
-            include_request, url_match = self.evaluate_landing_url(landing_url, parsed_landing_url, query_fields, path_pieces, lp_patterns)
+            checkpoint = sltl.get_tail_checkpoint(record_type)
             
-            if include_request:
+            if start != None and checkpoint != None and checkpoint[4] != None:
+                if TP.timestamp_from_obj(checkpoint[1],1,3) == start and int(checkpoint[4]) <= os.path.getsize(log_path):
+                    
+                    log_copy_time = TP.timestamp_from_obj(checkpoint[0],1,3)
+                    latest = TP.timestamp_from_obj(checkpoint[2],1,3)
+                    line_count = int(checkpoint[3])
+                    offset = int(checkpoint[4])
+                    record_exists = True
+                    
+                    os.lseek(log_fd, offset, os.SEEK_SET)
+                    logging.info('Resuming %s from byte %s (%s lines loaded).' % (log_path, str(offset), str(line_count)))
+        
+        if not record_exists:
+            logging.info('Begin tail mining of %s' % log_path)
+        
+        leftover = ''
+        polls = 0
+        
+        try:
+            while max_polls == None or polls < max_polls:
                 
-                """ Extract the language from the query string 
-                        
-                    the language has already been read from the url path but if it
-                    exists in  the query string this setting should take precedence
-                """
-                try:                    
-                    source_lang = query_fields['language'][0]                            
-                except:
-                    pass
+                polls = polls + 1
+                
+                """ Read what has been appended - a pipe read returns as soon as any data is available """
+                chunks = list()
+                bytes_read = 0
+                chunk = os.read(log_fd, self._TAIL_READ_SIZE_)
                 
-                """ Address cases where the query string contains the landing page - ...wikimediafoundation.org/w/index.php?... """
-                # http://wikimediafoundation.org/wiki/
-                if url_match == 1: 
+                while chunk != '':
+                    chunks.append(chunk)
+                    bytes_read = bytes_read + len(chunk)
                     
-                    """ Address cases where the query string does not contain the landing page - ...wikimediafoundation.org/wiki/... """
-                    parsed_landing_url = up.urlparse(landing_url)
-                    query_fields = cgi.parse_qs(parsed_landing_url[queryIndex]) # Get the banner name and lang
+                    if is_pipe or bytes_read >= self._TAIL_MAX_POLL_BYTES_:
+                        break
                     
-                    landing_path = parsed_landing_url[pathIndex].split('/')
-                    landing_page = landing_path[2];
+                    chunk = os.read(log_fd, self._TAIL_READ_SIZE_)
+                
+                if bytes_read == 0:
+                    if is_pipe:
+                        logging.info('Writer closed %s, tail mining complete.' % log_path)
+                        break
                     
-                    # URLs of the form ...?county_code=<iso_code>
-                    try:
-                        country = query_fields['country'][0]
+                    time.sleep(poll_interval)
+                    continue
+                
+                """ Split off complete lines - the trailing partial line is carried into the next poll """
+                data = leftover + ''.join(chunks)
+                end_index = data.rfind('\n') + 1
+                leftover = data[end_index:]
+                
+                if end_index == 0:
+                    continue
+                
+                lines = data[:end_index].split('\n')[:-1]
+                counts = collections.Counter()
+                poll_first = None
+                poll_last = None
+                buffer_failed = False
+                
+                for line in lines:
                     
-                    # URLs of the form ...<path>/ <lp_name>/<lang>/<iso_code>
-                    except:
-                        try:
-                            if len(landing_path) == 5:
-                                country = landing_path[4] 
-                                # source_lang = landing_path[3]                             
-                            else:
-                                country = landing_path[3]
-                                
-                        except:
-                            
-                            logging.info('Could not parse country from landing path: %s', landing_url)
-                            line = logFile.readline()
-                            total_lines_in_file = total_lines_in_file - 1
-                            continue
-
-                # http://wikimediafoundation.org/w/index.php? 
-                elif url_match == 2:
+                    if start == None:
+                        start = self._parser_.get_minute_timestamp(self._parser_.get_field(line.split(), SLP.SquidLineParser.TIMESTAMP_INDEX, ''))
                     
-                    try:
+                    if request_type == self._BANNER_REQUEST_:
                         
-                        """ URLs of the form ...?title=<lp_name> """
-                        lp_country = query_fields['title'][0].split('/')
-                        landing_page = lp_country[0]
-                        
-                        """ URLs of the form ...?county_code=<iso_code> """
-                        try:
-                            country = query_fields['country'][0]
-                        except:
-                            """ URLs of the form ...?title=<lp_name>/<lang>/<iso_code> """
-                            if len(lp_country) == 3:
-                                country = lp_country[2]
-                            else:
-                                country = lp_country[1]                                                
-                        
-                    except:
+                        request_key = self._parser_.parse_impression_line(line)
+                        if request_key == None:
+                            continue
                         
-                        logging.info('Could not parse landing page request from query string: %s', landing_url)
-                        line = logFile.readline()
-                        total_lines_in_file = total_lines_in_file - 1
-                        continue
-
-                # donate.wikimedia.org/wiki/Special:FundraiserLandingPage?
-                elif url_match == 3:
+                        counts[request_key] += 1
+                        request_minute = request_key[4]
                     
-                    try:
-                        # e.g. uselang=en&country=US&template=Lp-layout-default&appeal=Appeal-default&form-countryspecific=Form-countryspecific-control&utm_medium=sitenotice&utm_source=B11_Donate_Jimmy_Control&utm_campaign=C11_1107
-                        
-                        source_lang = query_fields['uselang'][0]
-                        country = query_fields['country'][0]
-                        
-                        landing_page = query_fields['template'][0].split('-')[2] + '~' + query_fields['appeal-template'][0].split('-')[2] + '~' + query_fields['appeal'][0].split('-')[1] + \
-                        '~' + query_fields['form-template'][0].split('-')[2] + '~' + query_fields['form-countryspecific'][0].split('-')[2] 
+                    else:
                         
-                        utm_source = query_fields['utm_source'][0]
-                        utm_campaign = query_fields['utm_campaign'][0] + '_' + country
-                        utm_medium = query_fields['utm_medium'][0]
-                        
-                    except Exception as inst:
+                        request_fields = self.parse_landing_page_request(line, lp_matcher, ipctl)
+                        if request_fields == None or start == None:
+                            continue
                         
-                        # logging.info(inst)     # __str__ allows args to printed directly
-                        # logging.info('Could not parse landing page request from query string: %s', landing_url)
-                        line = logFile.readline()
-                        total_lines_in_file = total_lines_in_file - 1
-                        continue
- 
+                        request_fields['start_timestamp_arg'] = start
+                        if lptl.buffer_row(**request_fields) < 0:
+                            buffer_failed = True
+                            break
                         
-                """ If country is confused with the language use the ip """
-                if country == country.lower():
+                        request_minute = TP.timestamp_convert_format(request_fields['timestamp_arg'],2,1)[:12] + '00'
                     
-                    # logging.info('Using geo-locator to set ip-address: %s', landing_url)
-                    country = ipctl.localize_IP(ip_add) 
-                                
-                """ Ensure fields providing request ID exist """
-                try:
-                    utm_source = query_fields['utm_source'][0]
-                    utm_campaign = query_fields['utm_campaign'][0]
-                    utm_medium = query_fields['utm_medium'][0];
-    
-                except KeyError:
+                    if poll_first == None or request_minute < poll_first:
+                        poll_first = request_minute
+                    if poll_last == None or request_minute > poll_last:
+                        poll_last = request_minute
+                
+                if buffer_failed:
+                    logging.error('Could not buffer landing page requests from %s, stopping at byte %s.' % (log_path, str(offset)))
+                    break
+                
+                """ The statements loading the new requests """
+                if request_type == self._BANNER_REQUEST_:
                     
-                    line = logFile.readline()
-                    total_lines_in_file = total_lines_in_file - 1
-                    continue
-
+                    rows = list()
+                    for (banner, country, project, lang, timestamp), count in counts.iteritems():
+                        rows.append({'utm_source_arg' : banner, 'referrer_arg' : project, 'country_arg' : country, 'lang_arg' : lang, \
+                                     'counts_arg' : str(count), 'on_minute_arg' : timestamp, 'start_timestamp_arg' : start})
+                    
+                    statements = itl.format_upsert_multiple_rows(rows, batch_size=self._INSERT_BATCH_SIZE_)
                 
-                """ Insert record into the landing_page_requests table """
+                else:
+                    statements = lptl.take_buffered_statements()
                 
-                lptl.insert_row(utm_source_arg=utm_source, utm_campaign_arg=utm_campaign, utm_medium_arg=utm_medium, landing_page_arg=landing_page, page_url_arg=landing_url, \
-                    referrer_url_arg=referrer_url, browser_arg=browser, lang_arg=source_lang, country_arg=country, project_arg=project, ip_arg=ip_add, start_timestamp_arg=start, timestamp_arg=timestamp_string)
+                poll_latest = latest
+                if poll_first != None and (poll_latest == None or poll_last > poll_latest):
+                    poll_latest = poll_last
                 
-                requests_loaded = requests_loaded + 1
+                poll_offset = offset + end_index
+                poll_line_count = line_count + len(lines)
                 
-            line = logFile.readline()
-            line_count = line_count + 1 
-    
-            """ Log Miner Logging - Update the squid_log_record table """
-            if (line_count % 1000) == 0 or line_count == total_lines_in_file:
-                completion = float(line_count / total_lines_in_file) * 100.0
-                sltl.update_table_row(type='lp_view',log_copy_time=curr_time,start_time=start,end_time=end,log_completion_pct=completion.__str__(),total_rows=line_count.__str__())
-
-        #self._close_db()
+                """ 
+                    Load the requests and checkpoint in one transaction - a poll is either loaded and checkpointed or not 
+                    loaded at all, so a restart never loads a poll twice
+                """
+                if start != None and poll_latest != None:
+                    
+                    if record_exists:
+                        statements.append(sltl.format_update_table_row(type=record_type,log_copy_time=log_copy_time,start_time=start,end_time=poll_latest, \
+                                                                       log_completion_pct='100.0',total_rows=poll_line_count.__str__(),byte_offset=poll_offset.__str__()))
+                    else:
+                        statements.append(sltl.format_insert_row(type=record_type,log_copy_time=log_copy_time,start_time=start,end_time=poll_latest, \
+                                                                 log_completion_pct='100.0',total_rows=poll_line_count.__str__(),byte_offset=poll_offset.__str__()))
+                
+                if statements and sltl.execute_transaction(statements) < 0:
+                    logging.error('Could not load the requests from %s, stopping at byte %s.' % (log_path, str(offset)))
+                    break
+                
+                if start != None and poll_latest != None:
+                    record_exists = True
+                
+                offset = poll_offset
+                line_count = poll_line_count
+                latest = poll_latest
+                
+                """ Re-aggregate the rollups of the minutes touched by this poll """
+                if poll_first != None:
+                    
+                    if request_type == self._BANNER_REQUEST_:
+                        rollup_status = mrtl.refresh_impressions(poll_first, poll_last)
+                    else:
+                        rollup_status = mrtl.refresh_landing_pages(poll_first, poll_last)
+                    
+                    if rollup_status < 0:
+                        logging.error('Could not refresh the rollups from %s to %s.' % (poll_first, poll_last))
+                
+                logging.debug('Loaded %s lines from %s, checkpoint at byte %s.' % (str(len(lines)), log_path, str(offset)))
         
-
+        finally:
+            os.close(log_fd)
+        
+        return offset
+    
+    
     """
         Looks into the logfile and pull the timestamp of the first request
         
@@ -957,111 +1203,12 @@ class FundraiserDataMapper(DataMapper):
     """
     def get_first_timestamp_from_log(self, logFileName):
         
-        logFile = self.open_logfile(logFileName)[0]
-        
-        """ Scan through the log file """
-        line = logFile.readline()
-        while (line != ''):
-            lineArgs = line.split()
-            
-            """ Try to extract Timestamp data """
-            try:
-                
-                time_stamp = lineArgs[2]
-                time_bits = time_stamp.split('T')
-                date_fields = time_bits[0].split('-')
-                time_fields = time_bits[1].split(':')
-            
-            except (ValueError, IndexError):
-                
-                line = logFile.readline()
-                continue
-                
-            """ Break the loop once we have a timestamp """
-            first_time_stamp = date_fields[0] + date_fields[1] + date_fields[2] + time_fields[0] + time_fields[1]  + '00'
-            break
-                
+        logFile = self.open_logfile(logFileName)
+        first_time_stamp = logFile.get_first_timestamp()
         logFile.close()
         
         return first_time_stamp
 
-    """
-        Parses the landing url and determines if its valid
-        
-        @param landing_url: full landing page url
-        @type landing_url: string
-        
-        @param parsed_landing_url: landing_url parsed into components
-        @type parsed_landing_url: dictionary
-        
-        @param query_fields: query string field values
-        @type query_fields: dictionary
-        
-        @param path_pieces: url path components
-        @type path_pieces: list
-        
-    """
-    def evaluate_landing_url(self, landing_url, parsed_landing_url, query_fields, path_pieces, lp_patterns):
-        
-        hostIndex = 1
-        #queryIndex = 4
-        #pathIndex = 2
-                
-        """ 
-            Filter the landing URLs
-        
-             wikimediafoundation.org/wiki/WMF/
-             wikimediafoundation.org/w/index.php?title=WMF/ 
-             donate.wikimedia.org/wiki/Special:FundraiserLandingPage?uselang=en&country=US&template=Lp-layout-default&appeal=Appeal-default&form-countryspecific=Form-countryspecific-control&utm_medium=sitenotice&utm_source=B11_Donate_Jimmy_Control&utm_campaign=C11_1107
-            
-            Evaluate conditions which determine acceptance of request based on the landing url 
-        """
-        try: 
-            
-            accept_request = False
-                
-            """ Conditions 1 through 3 are mutually exclusive """
-            condition_1 = parsed_landing_url[hostIndex] == 'wikimediafoundation.org' and path_pieces[1] == 'wiki'
-            condition_2 = (parsed_landing_url[hostIndex] == 'wikimediafoundation.org' and path_pieces[1] == 'w' and re.search('index.php', path_pieces[2]))            
-            condition_3 = parsed_landing_url[hostIndex] == 'donate.wikimedia.org' and path_pieces[1] == 'wiki' and re.search('Special:FundraiserLandingPage', path_pieces[2])            
-            # condition_3 = (re.search('donate.wikimedia.org.*wiki.*Special:FundraiserLandingPage', landing_url) != None)
-            condition_4 = (re.search('Special:LandingCheck',landing_url) == None) # The request must not be a "Special:LandingCheck"     
-             
-            accept_url = (condition_1 or condition_2 or condition_3) and condition_4
-                        
-            """ If the URL has been accepted process the LP names - evaluate against the patterns stored in the db """
-            if accept_url:
-                lp_name_flag = False
-                url_match = -1
-                
-                if condition_1:       
-                    url_match = 1                            
-                    for pattern in lp_patterns:
-                        lp_name_flag = re.search(pattern, path_pieces[2]) or lp_name_flag
-               
-                elif condition_2:
-                    try:
-                        for pattern in lp_patterns:
-                            lp_name_flag = re.search(pattern, query_fields['title'][0] ) or lp_name_flag
-                        url_match = 2
-                    except KeyError:                
-                        lp_name_flag = False
-            
-                elif condition_3:
-                    
-                    lp_name_flag = True
-                    url_match = 3
-                
-                accept_request = lp_name_flag
-
-            """ Return the (1) whether to include the request or not, (2) the format type of the request """
-            return [accept_request, url_match]
-
-        except: 
-            
-            return [False, False]
-
-    
     """
         Populates the traffic_samples table with random article samples from impression data over a given month
         The goal is to produce a random sample of page visits for a given month
@@ -1124,7 +1271,7 @@ class FundraiserDataMapper(DataMapper):
                 
                 """ Select 10K random requests - Process log samples - extract referrer urls """
 
-                logFile = self.open_logfile(filename)[0]
+                logFile = self.open_logfile(filename)
                 total_samples = 10000
                 line = logFile.readline()
                                                 
@@ -1171,15 +1318,29 @@ class FundraiserDataMapper(DataMapper):
                 tstl.insert_multiple_rows(ref_ids, referrers, request_times)
                 
     
-    def mine_squid_impression_requests_raw(self, logFileName):
+    """
+        Loads every banner impression request in the log into banner_impressions_raw
+        
+        @param logFileName: the full name of the logfile.  The local squid log folder is stored in web_reporting/settings.py
+        @type logFileName: string
+        
+        @param classify_user_agents: (kwarg) store the browser name resolved by the user agent classifier rather than the 
+            raw user agent string
+        @type classify_user_agents: boolean
+    """
+    def mine_squid_impression_requests_raw(self, logFileName, **kwargs):
+        
+        classify_user_agents = False
+        if 'classify_user_agents' in kwargs:
+            if isinstance(kwargs['classify_user_agents'], bool):
+                classify_user_agents = kwargs['classify_user_agents']
         
         logging.info('Begin mining of raw banner impressions in %s' % logFileName)
         
         itl = DL.ImpressionTableLoader()
                                         
         """ Initialization - open the file """
-        logFile, total_lines_in_file = self.open_logfile(logFileName)                
-        queryIndex = 4;
+        logFile = self.open_logfile(logFileName)
     
         
         """
@@ -1206,7 +1367,6 @@ class FundraiserDataMapper(DataMapper):
                 
             except (ValueError, IndexError):
                 line = logFile.readline()
-                total_lines_in_file = total_lines_in_file - 1
                 continue
                 # pass
  
@@ -1218,6 +1378,9 @@ class FundraiserDataMapper(DataMapper):
                 ip = lineArgs[4]
                 referrer_url = lineArgs[11]
                 user_agent = lineArgs[13]
+                
+                if classify_user_agents:
+                    user_agent = self._ua_classifier_.classify(user_agent)
             
             except:
                 line = logFile.readline()
@@ -1228,36 +1391,12 @@ class FundraiserDataMapper(DataMapper):
             """ 
                 Parse the URL:
             """    
-            parsedUrl = up.urlparse(url)
-            query = parsedUrl[queryIndex]
-            queryBits = cgi.parse_qs(query)
+            query_fields = self._parser_.parse_query(self._parser_.split_url(url)[2], self._parser_.BANNER_QUERY_KEYS)
     
-            """ Extract - project, banner, language, & country data from the url """
-            project = ''
-            if ('db' in queryBits.keys()):
-                project = queryBits['db'][0]
-    
-            if (project == '' and 'sitename' in queryBits.keys()):
-                sitename = queryBits['sitename'][0];
-                if sitename:
-                    project = sitename
-                else:
-                    project = 'NONE'
-    
-            if ('banner' in queryBits.keys()):
-                banner = queryBits['banner'][0]
-            else:
-                banner = 'NONE'
-    
-            if ('userlang' in queryBits.keys()):
-                lang = queryBits['userlang'][0]
-            else:
-                lang = 'NONE'
-    
-            if ('country' in queryBits.keys()):
-                country = queryBits['country'][0]
-            else:
-                country = 'NONE'
+            """ Extract - banner, language, & country data from the url """
+            banner = query_fields.get('banner', 'NONE')
+            lang = query_fields.get('userlang', 'NONE')
+            country = query_fields.get('country', 'NONE')
     
             itl.insert_row(use_raw=True, utm_source_arg=banner, referrer_arg=referrer_url, country_arg=country, lang_arg=lang, request_time=time_stamp, ip=ip, user_agent=user_agent)
 
@@ -1267,4 +1406,36 @@ class FundraiserDataMapper(DataMapper):
 
         """ ====== FILE COMPLETE ====== """
         logFile.close()
-                
\ No newline at end of file
+                
+
+
+
+"""
+    Pool worker for FundraiserDataMapper.mine_logs_in_pool.  Defined at module level so that it can be pickled.
+    
+    Runs in the worker process - the data mapper, and hence every DataLoader connection, is created here rather than 
+    inherited from the parent.  All errors are trapped (including the SystemExit raised when stale records cannot be 
+    cleared) so that one bad log does not bring down the pool.
+    
+    @param job: list of [log filename, request type, log copy time]
+    
+    @return: list of [log filename, success flag, error message]
+"""
+def mine_log_worker(job):
+    
+    log_name, request_type, log_copy_time = job
+    
+    try:
+        fdm = FundraiserDataMapper()
+        
+        if request_type == FundraiserDataMapper._BANNER_REQUEST_:
+            fdm.mine_squid_impression_requests(log_name, log_copy_time=log_copy_time)
+        else:
+            fdm.mine_squid_landing_page_requests(log_name, log_copy_time=log_copy_time)
+        
+        fdm.delete_log_by_filename(log_name)
+        
+    except (Exception, SystemExit) as inst:
+        return [log_name, False, str(type(inst)) + ' ' + str(inst)]
+    
+    return [log_name, True, '']
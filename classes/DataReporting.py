@@ -622,8 +622,16 @@ class IntervalReporting(DataReporting):
         """ Get the artifacts from label dictionary """
         artifact_keys_var = label_dict.keys()
         
-        """ Execute the query that generates interval reporting data """
-        return_val = self._data_loader_.run_query(start_time, end_time, interval, metric_name, campaign, **kwargs)
+        """ Execute the query that generates interval reporting data - the columnar query returns series already on the interval grid """
+        columnar = False
+        if 'columnar' in kwargs:
+            columnar = kwargs['columnar'] == True
+            del kwargs['columnar']
+        
+        if columnar:
+            return_val = self._data_loader_.run_query_series(start_time, end_time, interval, metric_name, campaign, **kwargs)
+        else:
+            return_val = self._data_loader_.run_query(start_time, end_time, interval, metric_name, campaign, **kwargs)
         self._counts_ = return_val[0]
         self._times_ = return_val[1]
         
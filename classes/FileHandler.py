@@ -10,7 +10,7 @@ __author__ = "Ryan Faulkner"
 __revision__ = "$Rev$"
 __date__ = "April 16th, 2011"
 
-import commands, gzip, re, os, logging
+import gzip, re, os, logging
 
 """ CONFIGURE THE LOGGER """
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s %(levelname)-8s %(message)s', datefmt='%b-%d %H:%M:%S')
@@ -32,6 +32,118 @@ class FileHandler(object):
         return
 
 
+"""
+
+    CLASS :: SquidLogReader
+    
+    Streams the lines of a squid log (gzipped or plain) in a single pass.  Progress is measured from the offset in the 
+    file on disk - for gzipped logs this is the compressed-byte offset - so no line pre-count is needed.  The timestamp 
+    of the first request is found by reading ahead and buffering lines so that the read-ahead is not lost.
+    
+    METHODS:
+        
+        readline                - return the next line, '' at the end of the file
+        get_first_timestamp     - timestamp of the first request in the log, formatted as 'YYYYMMDDHHMM00'
+        get_completion_pct      - percentage of the file on disk that has been consumed
+        get_lines_read          - number of lines returned so far
+        close                   - close the underlying file objects
+        
+"""
+class SquidLogReader(object):
+    
+    def __init__(self, filename):
+        
+        self._filename_ = filename
+        self._raw_file_ = open(filename, 'rb')
+        self._file_size_ = os.path.getsize(filename)
+        
+        if re.search('\.gz', filename):
+            self._log_file_ = gzip.GzipFile(fileobj=self._raw_file_, mode='rb')
+        else:
+            self._log_file_ = self._raw_file_
+        
+        self._buffered_lines_ = list()
+        self._first_timestamp_ = None
+        self._lines_read_ = 0
+    
+    def __iter__(self):
+        
+        line = self.readline()
+        while (line != ''):
+            yield line
+            line = self.readline()
+    
+    def readline(self):
+        
+        if self._buffered_lines_:
+            line = self._buffered_lines_.pop(0)
+        else:
+            line = self._log_file_.readline()
+        
+        if line != '':
+            self._lines_read_ = self._lines_read_ + 1
+        
+        return line
+    
+    """
+        Reads ahead to the first line with a parsable timestamp.  Lines read are held and returned by subsequent calls to 
+        readline.
+        
+        Sample timestamp field:  "2011-06-01T23:00:07.612" ==> "20110601230000"
+        
+        @return: the timestamp string or None if the log contains no timestamped requests
+    """
+    def get_first_timestamp(self):
+        
+        if self._first_timestamp_ != None:
+            return self._first_timestamp_
+        
+        for line in self._buffered_lines_:
+            self._first_timestamp_ = self._parse_timestamp(line)
+            if self._first_timestamp_ != None:
+                return self._first_timestamp_
+        
+        line = self._log_file_.readline()
+        while (line != ''):
+            
+            self._buffered_lines_.append(line)
+            self._first_timestamp_ = self._parse_timestamp(line)
+            
+            if self._first_timestamp_ != None:
+                break
+            
+            line = self._log_file_.readline()
+        
+        return self._first_timestamp_
+    
+    def _parse_timestamp(self, line):
+        
+        try:
+            time_bits = line.split()[2].split('T')
+            date_fields = time_bits[0].split('-')
+            time_fields = time_bits[1].split(':')
+            
+            return date_fields[0] + date_fields[1] + date_fields[2] + time_fields[0] + time_fields[1]  + '00'
+            
+        except (ValueError, IndexError):
+            return None
+    
+    def get_completion_pct(self):
+        
+        if self._file_size_ == 0:
+            return 100.0
+        
+        return min(float(self._raw_file_.tell()) / self._file_size_ * 100.0, 100.0)
+    
+    def get_lines_read(self):
+        return self._lines_read_
+    
+    def close(self):
+        
+        self._log_file_.close()
+        self._raw_file_.close()
+
+
 """
 
     CLASS :: ConfigFileHandler
@@ -48,7 +160,6 @@ class LogFileHandler(object):
     
     def __init__(self):
         
-        self._total_lines_in_file_ = -1 
         self._log_file_ = None
         
         self._line_delimeter_ = ' '
@@ -117,12 +228,7 @@ class LogFileHandler(object):
         filematch = re.match(r"([0-9a-zA-Z_.-]+)", filename)
         if filematch:
             filename = filematch.group(0)
-            if re.search('\.gz', filename):
-                self._log_file_ = gzip.open(self._log_dir_ + filename, 'r')
-                self._total_lines_in_file_ = float(commands.getstatusoutput('zgrep -c "" ' + self._log_dir_ + filename)[1])
-            else:
-                self._log_file_ = open(self._log_dir_ + filename, 'r')
-                self._total_lines_in_file_ = float(commands.getstatusoutput('grep -c "" ' + self._log_dir_ + filename)[1])
+            self._log_file_ = SquidLogReader(self._log_dir_ + filename)
 
         
     """
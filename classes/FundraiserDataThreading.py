@@ -22,13 +22,15 @@ class MinerThread ( object ):
         
     def __init__(self, log_name):
         
-        self._fdm_ = DM.FundraiserDataMapper()
+        self._fdm_ = None
         self._log_name_ = log_name
-        self._process_ = Process(target=self.call_mine_log())
+        self._process_ = Process(target=self.call_mine_log)
         
     def run( self ):
         self._process_.start()
-        # self._process_.join()
+    
+    def join( self ):
+        self._process_.join()
     
     
     def call_copy_log(self, type, **kwargs):
@@ -37,6 +39,8 @@ class MinerThread ( object ):
     
     def call_mine_log(self):
         
+        """ Runs in the child process - create the data mapper here so that its connections are not shared with the parent """
+        self._fdm_ = DM.FundraiserDataMapper()
         dm = DM.DataMapper()
         
         """ Determine whether logs are for banner impressions or landing pages """
@@ -13,7 +13,7 @@ __revision__ = "$Rev$"
 __date__ = "May 3rd, 2011"
 
 
-import logging, sys
+import logging, sys, collections, numpy as np
 
 
 import config.settings as projSet
@@ -33,6 +33,95 @@ class AutoVivification(dict):
             value = self[item] = type(self)()
             return value
 
+"""
+
+    CLASS :: LRUCache
+    
+    Bounded memo that evicts the least recently used entry once max_size entries are held.  Entries may also be given a 
+    weight (e.g. an estimate of their size in bytes) in which case least recently used entries are evicted until the 
+    total weight is within max_weight.  Keeps hit and miss counts so that callers can report cache effectiveness.
+    
+    METHODS:
+        
+        get         - retrieve the value for a key (None if absent), records a hit or a miss
+        put         - store a value, evicting least recently used entries if the cache is full
+        remove      - remove the entry for a key if present
+        clear       - remove all entries
+        get_stats   - return a dict of size, max_size, weight, max_weight, evictions, hits, misses and hit_rate
+        
+"""
+class LRUCache(object):
+    
+    def __init__(self, max_size, max_weight=None):
+        
+        self._max_size_ = max(int(max_size), 1)
+        self._max_weight_ = max_weight
+        self._entries_ = collections.OrderedDict()
+        self._weights_ = dict()
+        self._weight_ = 0
+        self._evictions_ = 0
+        self._hits_ = 0
+        self._misses_ = 0
+    
+    def __len__(self):
+        return len(self._entries_)
+    
+    def __contains__(self, key):
+        return key in self._entries_
+    
+    def get(self, key):
+        
+        try:
+            value = self._entries_.pop(key)
+        except KeyError:
+            self._misses_ = self._misses_ + 1
+            return None
+        
+        """ Re-insert to mark as most recently used """
+        self._entries_[key] = value
+        self._hits_ = self._hits_ + 1
+        
+        return value
+    
+    def put(self, key, value, weight=0):
+        
+        self.remove(key)
+        
+        """ Entries heavier than the cache itself are not stored """
+        if self._max_weight_ != None and weight > self._max_weight_:
+            return
+        
+        while len(self._entries_) >= self._max_size_ or \
+                (self._max_weight_ != None and len(self._entries_) > 0 and self._weight_ + weight > self._max_weight_):
+            
+            evicted_key, evicted_value = self._entries_.popitem(last=False)
+            self._weight_ = self._weight_ - self._weights_.pop(evicted_key)
+            self._evictions_ = self._evictions_ + 1
+        
+        self._entries_[key] = value
+        self._weights_[key] = weight
+        self._weight_ = self._weight_ + weight
+    
+    def remove(self, key):
+        
+        if key in self._entries_:
+            del self._entries_[key]
+            self._weight_ = self._weight_ - self._weights_.pop(key)
+    
+    def clear(self):
+        
+        self._entries_.clear()
+        self._weights_.clear()
+        self._weight_ = 0
+    
+    def get_stats(self):
+        
+        lookups = self._hits_ + self._misses_
+        hit_rate = float(self._hits_) / lookups if lookups else 0.0
+        
+        return {'size' : len(self._entries_), 'max_size' : self._max_size_, 'weight' : self._weight_, 'max_weight' : self._max_weight_, \
+                'evictions' : self._evictions_, 'hits' : self._hits_, 'misses' : self._misses_, 'hit_rate' : hit_rate}
+
 """
     Given a Filename create file object, read file, and convert to a string
 """
@@ -79,3 +168,122 @@ def combine_data_lists(dict_list):
         
     return combined_dict
 
+
+"""
+
+    Helper method that packs the output of combine_data_lists for caching.  The [time, count] pairs of every series are 
+    concatenated into a single float64 array of shape (num_points, 2) with the start offset of each series kept in an 
+    int64 array, rather than pickled as nested lists.  Metrics whose data is not a list of series (the empty data used 
+    when no series matched) are kept as a float64 array of their own.  The remaining template keys are small and are 
+    kept as they are.
+    
+    @param combined_dict: a dict produced by combine_data_lists from get_data_lists results
+    
+    @return: a dict with the packed series under 'points', 'offsets', 'num_series' and 'raw_data' and all other keys of 
+        combined_dict other than 'data'
+    
+"""
+def pack_data_lists(combined_dict):
+    
+    packed_dict = dict()
+    for key in combined_dict:
+        if key != 'data':
+            packed_dict[key] = combined_dict[key]
+    
+    series_arrays = list()
+    num_series = list()
+    raw_data = list()
+    
+    for metric_data in combined_dict['data']:
+        
+        """ A list of series is a list of lists of [time, count] pairs """
+        is_series = len(metric_data) > 0 and all([isinstance(series, list) and (len(series) == 0 or isinstance(series[0], (list, tuple))) \
+                                                  for series in metric_data])
+        
+        if is_series:
+            for series in metric_data:
+                series_arrays.append(np.array(series, dtype=np.float64).reshape(-1, 2))
+            num_series.append(len(metric_data))
+            raw_data.append(None)
+        else:
+            num_series.append(0)
+            raw_data.append(np.array(metric_data, dtype=np.float64))
+    
+    offsets = np.zeros(len(series_arrays) + 1, dtype=np.int64)
+    if series_arrays:
+        offsets[1:] = np.cumsum([len(series) for series in series_arrays])
+        points = np.concatenate(series_arrays)
+    else:
+        points = np.zeros((0, 2), dtype=np.float64)
+    
+    packed_dict['points'] = points
+    packed_dict['offsets'] = offsets
+    packed_dict['num_series'] = num_series
+    packed_dict['raw_data'] = raw_data
+    
+    return packed_dict
+
+
+"""
+    Format a float64 array of one or two dimensions as a javascript array literal
+"""
+def _format_js_array(values):
+    
+    if values.size == 0:
+        return '[]'
+    
+    strings = values.astype(str)
+    
+    if values.ndim == 1:
+        return '[' + ','.join(strings) + ']'
+    
+    rows = strings[:, 0]
+    for column in range(1, values.shape[1]):
+        rows = np.char.add(np.char.add(rows, ','), strings[:, column])
+    
+    return '[[' + '],['.join(rows) + ']]'
+
+
+"""
+
+    Helper method that produces the template data of pack_data_lists output.  'data' is rendered directly from the packed 
+    arrays as a javascript array literal, with the same nesting as the lists produced by combine_data_lists.  Data that 
+    was not packed is returned as it is.
+    
+    @param packed_dict: a dict produced by pack_data_lists
+    
+    @return: a dict of template parameters
+    
+"""
+def unpack_data_lists(packed_dict):
+    
+    if not('points' in packed_dict):
+        return dict(packed_dict)
+    
+    template_dict = dict()
+    for key in packed_dict:
+        if not(key in ['points', 'offsets', 'num_series', 'raw_data']):
+            template_dict[key] = packed_dict[key]
+    
+    points = packed_dict['points']
+    offsets = packed_dict['offsets']
+    
+    metric_strings = list()
+    series_index = 0
+    
+    for metric_index in range(len(packed_dict['num_series'])):
+        
+        if packed_dict['raw_data'][metric_index] is not None:
+            metric_strings.append(_format_js_array(packed_dict['raw_data'][metric_index]))
+            continue
+        
+        series_strings = list()
+        for i in range(packed_dict['num_series'][metric_index]):
+            series_strings.append(_format_js_array(points[offsets[series_index]:offsets[series_index + 1]]))
+            series_index = series_index + 1
+        
+        metric_strings.append('[' + ','.join(series_strings) + ']')
+    
+    template_dict['data'] = '[' + ','.join(metric_strings) + ']'
+    
+    return template_dict
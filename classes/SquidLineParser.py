@@ -0,0 +1,429 @@
+"""
+
+This module provides fast field extraction for squid log request lines.  The miners only use a handful of fields from
+each request (timestamp, IP, request url, referrer, user agent) and a handful of query parameters from the request url.
+Rather than building full urlparse / cgi.parse_qs structures for every line, only the needed pieces are sliced out.
+
+Sample request:
+
+    sq63.wikimedia.org 757675855 2011-06-01T23:00:07.612 0 187.57.227.121 TCP_MEM_HIT/200 1790 GET \
+    http://meta.wikimedia.org/w/index.php?title=Special:BannerLoader&banner=B20110601_JWJN001_BR&userlang=pt&db=ptwiki&sitename=Wikip%C3%A9dia&country=BR NONE/- text/javascript http://pt.wikipedia.org/wiki/Modo_e_tempo_verbal \
+    - Mozilla/5.0%20(Windows%20NT%206.1)%20AppleWebKit/534.24%20(KHTML,%20like%20Gecko)%20Chrome/11.0.696.71%20Safari/534.24
+
+METHODS:
+
+    split_line                - split a request line into its space delimited fields
+    get_field                 - return a field by index or a default if the line is short
+    get_minute_timestamp      - convert the squid timestamp to 'YYYYMMDDHHMM00'
+    get_mysql_timestamp       - convert the squid timestamp to 'YYYY-MM-DD HH:MM:SS'
+    split_url                 - split a url into host, path and query string
+    parse_query               - extract only the requested parameters from a query string
+    parse_impression_line     - extract the banner impression aggregation key from a request line
+
+CLASSES:
+
+    SquidLineParser           - targeted field extraction for request lines
+    UserAgentClassifier       - memoized user agent to browser name classification
+    LandingPageMatcher        - compiled landing page url acceptance
+
+"""
+
+
+""" Import python base modules """
+import sys, re, time, urllib, logging, httpagentparser
+
+""" Import Analytics modules """
+import classes.Helper as Hlp
+
+""" CONFIGURE THE LOGGER """
+LOGGING_STREAM = sys.stderr
+logging.basicConfig(level=logging.DEBUG, stream=LOGGING_STREAM, format='%(asctime)s %(levelname)-8s %(message)s', datefmt='%b-%d %H:%M:%S')
+
+
+"""
+
+    CLASS :: SquidLineParser
+
+    Targeted parser for squid request lines.  Timestamps are converted by slicing fixed positions and query strings are
+    scanned once, keeping only the requested keys.  Query values follow the cgi.parse_qs conventions used previously
+    by the miners: pairs are separated by '&' or ';', blank values are dropped, the first occurrence of a key wins and
+    values are unquoted ('+' as space).
+
+    MEMBERS:
+            @var BANNER_QUERY_KEYS: query parameters used in mining banner impressions
+            @var LP_QUERY_KEYS: query parameters used in mining landing page requests
+
+"""
+class SquidLineParser(object):
+
+    """ Indices of the space delimited squid log fields """
+    TIMESTAMP_INDEX = 2
+    IP_INDEX = 4
+    URL_INDEX = 8
+    REFERRER_INDEX = 11
+    USER_AGENT_INDEX = 13
+
+    BANNER_QUERY_KEYS = frozenset(['banner', 'userlang', 'country', 'db', 'sitename'])
+    LP_QUERY_KEYS = frozenset(['language', 'uselang', 'country', 'title', 'template', 'appeal-template', 'appeal', 'form-template', \
+                               'form-countryspecific', 'utm_source', 'utm_campaign', 'utm_medium'])
+
+    _QUERY_SEPARATOR_ = re.compile('[&;]')
+
+    def split_line(self, line):
+        return line.split()
+
+    """
+        Return the field at index from a split line, default if the line does not have enough fields
+    """
+    def get_field(self, line_args, index, default):
+
+        try:
+            return line_args[index]
+        except IndexError:
+            return default
+
+    """
+        Convert a squid timestamp to a 14 digit minute resolution timestamp
+
+        e.g. "2011-06-01T23:00:07.612" ==> "20110601230000"
+
+        @return: the timestamp string, None if the field is not a squid timestamp
+    """
+    def get_minute_timestamp(self, time_field):
+
+        if len(time_field) < 16 or time_field[10] != 'T' or time_field[4] != '-' or time_field[13] != ':':
+            return None
+
+        return time_field[0:4] + time_field[5:7] + time_field[8:10] + time_field[11:13] + time_field[14:16] + '00'
+
+    """
+        Convert a squid timestamp to a MySQL datetime string
+
+        e.g. "2011-06-01T23:00:07.612" ==> "2011-06-01 23:00:07"
+
+        @return: the timestamp string, None if the field is not a squid timestamp
+    """
+    def get_mysql_timestamp(self, time_field):
+
+        if len(time_field) < 19 or time_field[10] != 'T' or time_field[4] != '-' or time_field[13] != ':':
+            return None
+
+        return time_field[0:10] + ' ' + time_field[11:19]
+
+    """
+        Split a url into host, path and query string.  As with urlparse the host is only set when the url contains a
+        scheme followed by '//', and any fragment is discarded.
+
+        e.g. "http://wikimediafoundation.org/w/index.php?title=WMFJA085/en/US&utm_source=donate" ==>
+                ['wikimediafoundation.org', '/w/index.php', 'title=WMFJA085/en/US&utm_source=donate']
+
+        @return: list of [host, path, query]
+    """
+    def split_url(self, url):
+
+        fragment_index = url.find('#')
+        if fragment_index != -1:
+            url = url[:fragment_index]
+
+        query = ''
+        query_index = url.find('?')
+        if query_index != -1:
+            query = url[query_index + 1:]
+            url = url[:query_index]
+
+        host = ''
+        scheme_index = url.find('://')
+        if scheme_index != -1:
+            url = url[scheme_index + 3:]
+            path_index = url.find('/')
+            if path_index == -1:
+                host = url
+                url = ''
+            else:
+                host = url[:path_index]
+                url = url[path_index:]
+
+        return [host, url, query]
+
+    """
+        Extract the values of the requested keys from a query string.  Keys and values are decoded as cgi.parse_qs does,
+        the first non-empty value of a key is kept.
+
+        @param query: the query string (without the leading '?')
+        @param keys: set of parameter names to keep
+
+        @return: dict of parameter name to value for the requested keys present in the query
+    """
+    def parse_query(self, query, keys):
+
+        fields = dict()
+
+        for pair in self._QUERY_SEPARATOR_.split(query):
+
+            equals_index = pair.find('=')
+            if equals_index == -1:
+                continue
+
+            key = pair[:equals_index]
+            if '%' in key or '+' in key:
+                key = urllib.unquote(key.replace('+', ' '))
+
+            if key not in keys or key in fields:
+                continue
+
+            value = pair[equals_index + 1:]
+            if value == '':
+                continue
+
+            if '%' in value or '+' in value:
+                value = urllib.unquote(value.replace('+', ' '))
+
+            fields[key] = value
+
+        return fields
+
+    """
+        Parses a banner impression request line.  Only the timestamp and the banner, userlang, country, db and sitename
+        parameters of the request url are extracted.
+
+        @param line: squid log line
+        @type line: string
+
+        @return: tuple of (banner, country, project, lang, minute timestamp), None if the line carries no timestamp
+    """
+    def parse_impression_line(self, line):
+
+        line_args = line.split()
+
+        time_stamp = self.get_minute_timestamp(self.get_field(line_args, self.TIMESTAMP_INDEX, ''))
+        if time_stamp == None:
+            return None
+
+        url = self.get_field(line_args, self.URL_INDEX, 'Unavailable')
+        query_fields = self.parse_query(self.split_url(url)[2], self.BANNER_QUERY_KEYS)
+
+        """ Extract - project, banner, language, & country data from the url """
+        project = query_fields.get('db', '')
+        if project == '':
+            project = query_fields.get('sitename', '')
+
+        banner = query_fields.get('banner', 'NONE')
+        lang = query_fields.get('userlang', 'NONE')
+        country = query_fields.get('country', 'NONE')
+
+        return (banner, country, project, lang, time_stamp)
+
+
+"""
+
+    CLASS :: UserAgentClassifier
+
+    Resolves raw user agent strings to browser names with httpagentparser.  Campaign traffic contains relatively few
+    distinct user agents so results are memoized in a bounded LRU keyed on the raw string.
+
+    METHODS:
+
+        classify        - return the browser name for a user agent string ('NONE' if it cannot be determined)
+        get_stats       - return the cache size, hit and miss counts
+
+"""
+class UserAgentClassifier(object):
+
+    _CACHE_SIZE_ = 20000
+
+    def __init__(self, **kwargs):
+
+        cache_size = self._CACHE_SIZE_
+        if 'cache_size' in kwargs:
+            cache_size = kwargs['cache_size']
+
+        self._cache_ = Hlp.LRUCache(cache_size)
+
+    def classify(self, user_agent_string):
+
+        browser = self._cache_.get(user_agent_string)
+        if browser != None:
+            return browser
+
+        browser = 'NONE'
+
+        try:
+            user_agent_fields = httpagentparser.detect(user_agent_string)
+
+            # Check to make sure fields exist
+            if len(user_agent_fields['browser']) != 0:
+                if len(user_agent_fields['browser']['name']) != 0:
+                    browser = user_agent_fields['browser']['name']
+        except:
+            logging.error('Could not process user agent string.')
+
+        self._cache_.put(user_agent_string, browser)
+
+        return browser
+
+    def get_stats(self):
+        return self._cache_.get_stats()
+
+
+"""
+
+    CLASS :: LandingPageMatcher
+
+    Determines whether a landing url is a landing page view to be mined.  The accepted url shapes are:
+
+        1. wikimediafoundation.org/wiki/<lp_name>...
+        2. wikimediafoundation.org/w/index.php?title=<lp_name>...
+        3. donate.wikimedia.org/wiki/Special:FundraiserLandingPage?...
+
+    and Special:LandingCheck requests are always rejected.  For shapes 1 and 2 the landing page name must match one of
+    the 'lp' patterns in the mining_patterns table.  The patterns are compiled into a single alternation so that a
+    name is tested in one regex search.
+
+    When constructed with a pattern loader (a DataLoader.MiningPatternsTableLoader) the pattern list is re-read at
+    most every refresh interval and the alternation is recompiled if the patterns have changed, so patterns added or
+    removed through the LML views are picked up by running miners.
+
+    METHODS:
+
+        compile         - build the alternation from a list of patterns
+        refresh         - re-read the patterns from the loader and recompile if they have changed
+        evaluate        - classify a landing url
+
+"""
+class LandingPageMatcher(object):
+
+    URL_MATCH_WIKI = 1
+    URL_MATCH_INDEX = 2
+    URL_MATCH_DONATE = 3
+
+    _REFRESH_INTERVAL_ = 60
+
+    _INDEX_PAGE_ = re.compile('index.php')
+
+    """
+        @param lp_patterns: (kwarg) list of landing page name patterns
+        @param pattern_loader: (kwarg) object whose get_pattern_lists() returns the banner and landing page pattern lists
+        @param refresh_interval: (kwarg) minimum number of seconds between pattern reloads
+    """
+    def __init__(self, **kwargs):
+
+        self._pattern_loader_ = None
+        self._refresh_interval_ = self._REFRESH_INTERVAL_
+        self._last_refresh_ = time.time()
+        self._lp_patterns_ = list()
+        self._lp_regex_ = None
+
+        if 'refresh_interval' in kwargs:
+            self._refresh_interval_ = kwargs['refresh_interval']
+
+        if 'lp_patterns' in kwargs:
+            self.compile(kwargs['lp_patterns'])
+
+        if 'pattern_loader' in kwargs:
+            self._pattern_loader_ = kwargs['pattern_loader']
+            self.refresh(force=True)
+
+    """
+        Compile the patterns into a single alternation.  Patterns that are not valid regular expressions are logged and
+        skipped.
+    """
+    def compile(self, lp_patterns):
+
+        valid_patterns = list()
+
+        for pattern in lp_patterns:
+            try:
+                re.compile(pattern)
+                valid_patterns.append('(?:' + pattern + ')')
+            except re.error:
+                logging.error('Skipping invalid landing page mining pattern: %s' % pattern)
+
+        self._lp_patterns_ = list(lp_patterns)
+
+        if valid_patterns:
+            self._lp_regex_ = re.compile('|'.join(valid_patterns))
+        else:
+            self._lp_regex_ = None
+
+    """
+        Re-read the patterns from the loader and recompile if the list has changed
+
+        @param force: (kwarg) reload regardless of the refresh interval
+
+        @return: True if the patterns were recompiled
+    """
+    def refresh(self, **kwargs):
+
+        force = False
+        if 'force' in kwargs:
+            force = kwargs['force']
+
+        if self._pattern_loader_ == None:
+            return False
+
+        if not(force) and time.time() - self._last_refresh_ < self._refresh_interval_:
+            return False
+
+        self._last_refresh_ = time.time()
+
+        try:
+            lp_patterns = self._pattern_loader_.get_pattern_lists()[1]
+        except Exception as inst:
+            logging.error('Could not reload landing page mining patterns: %s' % str(inst))
+            return False
+
+        if lp_patterns == self._lp_patterns_ and not(force):
+            return False
+
+        self.compile(lp_patterns)
+        logging.info('Compiled %s landing page mining patterns.' % str(len(lp_patterns)))
+
+        return True
+
+    """
+        Classify a landing url
+
+        @param landing_url: full landing page url
+        @param landing_host: host of the landing url
+        @param query_fields: query string field values, as returned by SquidLineParser.parse_query
+        @param path_pieces: url path components
+
+        @return: list of [include the request, url shape matched (URL_MATCH_*), False if no shape matched]
+    """
+    def evaluate(self, landing_url, landing_host, query_fields, path_pieces):
+
+        self.refresh()
+
+        try:
+
+            if 'Special:LandingCheck' in landing_url:
+                return [False, False]
+
+            if landing_host == 'wikimediafoundation.org':
+
+                if path_pieces[1] == 'wiki':
+                    return [self._match_name(path_pieces[2]), self.URL_MATCH_WIKI]
+
+                elif path_pieces[1] == 'w' and self._INDEX_PAGE_.search(path_pieces[2]):
+
+                    if 'title' in query_fields:
+                        return [self._match_name(query_fields['title']), self.URL_MATCH_INDEX]
+                    else:
+                        return [False, -1]
+
+            elif landing_host == 'donate.wikimedia.org':
+
+                if path_pieces[1] == 'wiki' and 'Special:FundraiserLandingPage' in path_pieces[2]:
+                    return [True, self.URL_MATCH_DONATE]
+
+        except IndexError:
+            pass
+
+        return [False, False]
+
+    def _match_name(self, lp_name):
+
+        if self._lp_regex_ == None:
+            return False
+
+        return self._lp_regex_.search(lp_name) != None
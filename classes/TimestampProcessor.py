@@ -30,6 +30,14 @@ METHODS:
     timestamp_to_obj              - Convert timestamp to a datetime object of a given format 
     normalize_intervals           - Inserts missing interval points into the time and metric lists
     timestamp_convert_format      - Converts from one timestamp format to another timestamp format 
+    timestamp_list_to_datetime64  - Convert a list of 14-digit timestamps to a numpy datetime64 array in one vectorized step
+    timestamps_to_datetime64      - Convert a list of timestamps of any supported type to a numpy datetime64 array
+    align_to_grid                 - Reindexes many time series onto a common start/end/interval grid with zero-fill
+
+CLASSES:
+
+    TimestampCodec                - memoized scalar and vectorized list conversions among timestamp forms, shared 
+                                    instance: codec
 
 """
 
@@ -38,7 +46,7 @@ __revision__ = "$Rev$"
 __date__ = "April 8th, 2011"
 
 
-import datetime, calendar as cal, math, re, logging, sys
+import datetime, calendar as cal, math, re, logging, sys, numpy as np
 import classes.Helper as mh
 
 """ CONFIGURE THE LOGGER """
@@ -52,6 +60,10 @@ TS_FORMAT_FORMAT1 = 2
 """  Time unit indices"""
 HOUR = 1
 DAY =  0
+MINUTE = 2
+
+""" Length of each time unit in minutes """
+UNIT_MINUTES = {DAY : 60 * 24, HOUR : 60, MINUTE : 1}
 
 
 """
@@ -112,31 +124,17 @@ def normalize_timestamps(time_lists, count_back, time_unit):
     else:
         start_date_obj = find_earliest_date_in_list(time_lists)
     
-    start_month = start_date_obj.month
-    start_day = start_date_obj.day
-    start_hr  = start_date_obj.hour
-    start_mte = start_date_obj.minute
-    
-    length_of_month = cal.mdays[start_month]
-    
     # Normalize dates
     time_norm = mh.AutoVivification()
     for key in time_lists.keys():
         for date_obj in time_lists[key]:
             
-            month = date_obj.month
-            day = date_obj.day
-            hr = date_obj.hour
-            mte = date_obj.minute
-            
             if time_unit == 0:                
                 elem = (date_obj - start_date_obj).days + (date_obj - start_date_obj).seconds / (60 * 60 * 24)     # Time difference in days
             elif time_unit == 1:                
                 elem = (date_obj - start_date_obj).days * 24 + (date_obj - start_date_obj).seconds / (60 * 60)          # Time difference in hours
-            elif time_unit == 2:
-                elem = (day - start_day) * 24 * 60 + (hr - start_hr) * 60 + (mte - start_mte)
-            elif time_unit == 3:
-                elem = (month - start_month) * 24 * 60 * length_of_month + (day - start_day) * 24 * 60 + (hr - start_hr) * 60 + (mte - start_mte)
+            elif time_unit == 2 or time_unit == 3:
+                elem = (date_obj - start_date_obj).days * 24 * 60 + (date_obj - start_date_obj).seconds / 60         # Time difference in minutes
             try: 
                 time_norm[key].append(elem)
             except:
@@ -291,56 +289,7 @@ def gen_date_strings(time_ref, hours_back, format, resolution):
 
 """
 def timestamp_from_obj(time_obj, format, resolution):
-    
-    if time_obj.month < 10:
-        month = '0' + str(time_obj.month)
-    else:
-        month = str(time_obj.month)
-
-    if time_obj.day < 10:
-        day = '0' + str(time_obj.day)
-    else:
-        day = str(time_obj.day)
-
-    if time_obj.hour < 10:
-        hour = '0' + str(time_obj.hour)
-    else:
-        hour = str(time_obj.hour)
-        
-    if time_obj.minute < 10:
-        minute = '0' + str(time_obj.minute)
-    else:
-        minute = str(time_obj.minute)
-        
-    if time_obj.second < 10:
-        second = '0' + str(time_obj.second)
-    else:
-        second = str(time_obj.second)
-        
-    # Cast the start and end time strings in the proper format
-    if format == 1:
-        
-        if resolution == 0:
-            timestamp = str(time_obj.year) + month + day + '000000'
-        elif resolution == 1:
-            timestamp = str(time_obj.year) + month + day + hour + '0000'
-        elif resolution == 2:
-            timestamp = str(time_obj.year) + month + day + hour + minute + '00'
-        elif resolution == 3:
-            timestamp = str(time_obj.year) + month + day + hour + minute + second
-    
-    elif format == 2:
-        
-        if resolution == 0:
-            timestamp = str(time_obj.year) + '-' +  month + '-' +  day + ' ' +  '00:00:00'
-        elif resolution == 1:
-            timestamp = str(time_obj.year) + '-' +  month + '-' +  day + ' ' +  hour + ':00:00'
-        elif resolution == 2:
-            timestamp = str(time_obj.year) + '-' +  month + '-' +  day + ' ' +  hour + ':' + minute + ':00'
-        elif resolution == 3:
-            timestamp = str(time_obj.year) + '-' +  month + '-' +  day + ' ' +  hour + ':' + minute + ':' + second
-            
-    return timestamp
+    return codec.from_obj(time_obj, format, resolution)
 
 
 """
@@ -362,16 +311,7 @@ def timestamp_from_obj(time_obj, format, resolution):
      
 """
 def timestamp_to_obj(timestamp, format):
-    
-    if format == 1:
-        time_obj = datetime.datetime(int(timestamp[0:4]), int(timestamp[4:6]), int(timestamp[6:8]), \
-                                    int(timestamp[8:10]), int(timestamp[10:12]), int(timestamp[12:14]))
-        
-    elif format == 2:
-        time_obj = datetime.datetime(int(timestamp[0:4]), int(timestamp[5:7]), int(timestamp[8:10]), \
-                                    int(timestamp[11:13]), int(timestamp[14:16]), int(timestamp[17:19]))
-
-    return time_obj
+    return codec.to_obj(timestamp, format)
 
 """
     Convert a list timestamps to a list  datetime objects of a given format
@@ -389,13 +329,43 @@ def timestamp_list_to_obj(timestamps):
     
     for ts in timestamps:
         if isinstance(ts, str):            
-            format = getTimestampFormat(ts)        
-            obj_list.append(timestamp_to_obj(ts, format))
+            obj_list.append(codec.to_obj(ts))
         else:
             obj_list.append(ts)
             
     return obj_list
 
+"""
+    Convert a list of 14-digit (format 1) timestamps to a numpy datetime64 array of minute resolution.  The digits of all 
+    timestamps are decoded at once rather than building a datetime object per timestamp.  Seconds are truncated.
+
+    @param timestamps: list or array of format 1 timestamp strings, e.g. ['20080101000606', ...]
+    
+    @return: numpy array of dtype datetime64[m]
+"""
+def timestamp_list_to_datetime64(timestamps):
+    return codec.to_datetime64(timestamps, 1, 'm')
+
+"""
+    Convert timestamps to a numpy datetime64 array of minute resolution.  Lists of 14-digit timestamps are decoded with 
+    timestamp_list_to_datetime64, other strings and datetime objects go through timestamp_list_to_obj.
+
+    @param timestamps: list of timestamp strings or datetime objects, or a datetime64 array
+    
+    @return: numpy array of dtype datetime64[m]
+"""
+def timestamps_to_datetime64(timestamps):
+    
+    if isinstance(timestamps, np.ndarray) and np.issubdtype(timestamps.dtype, np.datetime64):
+        return timestamps.astype('datetime64[m]')
+    
+    timestamps = list(timestamps)
+    
+    if len(timestamps) > 0 and isinstance(timestamps[0], basestring) and codec.get_format(timestamps[0]) in (1, 2):
+        return codec.to_datetime64(timestamps, None, 'm')
+    
+    return np.array(timestamp_list_to_obj(timestamps), dtype='datetime64[m]')
+
 """ Same as method above for dictionaries containing timestamp lists """
 def timestamp_dict_to_obj(timestamps_dict):
     
@@ -507,6 +477,80 @@ def normalize_intervals(times, metrics, interval):
 
     return [new_times, new_metrics]
 
+"""
+
+    Reindexes many time series onto a common grid in one vectorized step.  The timestamps of every series are flattened 
+    into a single datetime64 array, bucketed on the grid of ``interval`` minutes and the metrics scattered into a zero 
+    filled (series x grid) array - this replaces normalize_timestamps + normalize_intervals on each series.  Timestamps 
+    between grid points fall in the bucket of the preceding point, those outside of the grid are dropped and where a 
+    series has several values in one bucket the last is kept.
+    
+    INPUT:
+    
+        time_lists      - dict of timestamp lists (format 1 or 2 strings, datetime objects or datetime64 arrays)
+        metric_lists    - dict of metric lists with the same keys and lengths as time_lists
+        interval        - the grid interval in minutes
+        start           - (kwarg) first grid point as a timestamp or datetime object, defaults to the earliest timestamp
+        end             - (kwarg) last grid point as a timestamp or datetime object, defaults to the latest timestamp
+        time_unit       - (kwarg) the unit of the returned relative times - DAY, HOUR or MINUTE (default)
+    
+    RETURN:
+    
+        times           - dict of float64 arrays, the grid points relative to start in units of time_unit
+        metrics         - dict of float64 arrays, the metrics reindexed on the grid
+    
+"""
+def align_to_grid(time_lists, metric_lists, interval, **kwargs):
+    
+    time_unit = MINUTE
+    if 'time_unit' in kwargs:
+        time_unit = kwargs['time_unit']
+    
+    keys = time_lists.keys()
+    series_times = [timestamps_to_datetime64(time_lists[key]) for key in keys]
+    
+    if len(keys) > 0:
+        flat_times = np.concatenate(series_times)
+        flat_metrics = np.concatenate([np.asarray(metric_lists[key], dtype=np.float64) for key in keys])
+        key_index = np.repeat(np.arange(len(keys)), [len(ts) for ts in series_times])
+    else:
+        flat_times = np.array([], dtype='datetime64[m]')
+    
+    if 'start' in kwargs:
+        start = timestamps_to_datetime64([kwargs['start']])[0]
+    elif flat_times.size > 0:
+        start = flat_times.min()
+    else:
+        return [dict(), dict()]
+    
+    if 'end' in kwargs:
+        end = timestamps_to_datetime64([kwargs['end']])[0]
+    elif flat_times.size > 0:
+        end = flat_times.max()
+    else:
+        end = start
+    
+    step = np.timedelta64(int(interval), 'm')
+    num_points = max(int((end - start) // step) + 1, 1)
+    
+    grid_times = np.arange(num_points) * (float(interval) / UNIT_MINUTES[time_unit])
+    grid_metrics = np.zeros((len(keys), num_points))
+    
+    if flat_times.size > 0:
+        grid_index = ((flat_times - start) // step).astype(np.int64)
+        in_range = (grid_index >= 0) & (grid_index < num_points)
+        
+        grid_metrics[key_index[in_range], grid_index[in_range]] = flat_metrics[in_range]
+    
+    times = dict()
+    metrics = dict()
+    
+    for index in range(len(keys)):
+        times[keys[index]] = grid_times.copy()
+        metrics[keys[index]] = grid_metrics[index]
+    
+    return [times, metrics]
+
 """
 
     Converts from one timestamp format to another timestamp format
@@ -517,7 +561,7 @@ def normalize_intervals(times, metrics, interval):
     INPUT:
     
         ts           - timestamp string
-        format_from  - input format
+        format_from  - input format, the format is detected if ts is not of this format
         format_to    - output format
     
     RETURN:
@@ -527,22 +571,7 @@ def normalize_intervals(times, metrics, interval):
 
 """
 def timestamp_convert_format(ts, format_from, format_to, **kwargs):
-    
-    format_from = getTimestampFormat(ts)
-    
-    if format_from == 1:        
-        if format_to == 1:
-            new_timestamp = ts
-        elif format_to == 2:
-            new_timestamp = ts[0:4] + '-' + ts[4:6] + '-' + ts[6:8] + ' ' + ts[8:10] + ':' + ts[10:12] + ':' + ts[12:14]
-            
-    elif format_from == 2:
-        if format_to == 1:
-            new_timestamp = ts[0:4] + ts[5:7] + ts[8:10] + ts[11:13] + ts[14:16] + ts[17:19]
-        elif format_to == 2:
-            new_timestamp = ts
-             
-    return new_timestamp
+    return codec.convert(ts, format_from, format_to)
 
 """
 
@@ -705,4 +734,263 @@ def create_timestamp_list(start, num_samples, interval_minutes):
         
     return ts_list
         
-    
\ No newline at end of file
+    
+
+"""
+
+    CLASS :: TimestampCodec
+    
+    Converts timestamps between the flat 14-digit form (format 1), the MySQL datetime form (format 2), datetime objects 
+    and numpy datetime64 arrays.  Log lines and query rows repeat the same minute many times so scalar conversions are 
+    memoized on the minute prefix of the timestamp and only the seconds are sliced on each call.  Lists are converted 
+    with the format detected once from the first element and arrays are converted in vectorized steps.
+    
+    The caches are plain dicts that are emptied once they reach cache_size entries - the number of distinct minutes 
+    seen by a miner or report is small so eviction is rare.
+    
+    METHODS:
+    
+        get_format            - detect the format of a timestamp string
+        convert               - convert a timestamp string between formats 1 and 2
+        convert_list          - convert a list of timestamp strings between formats 1 and 2
+        to_obj                - convert a timestamp string to a datetime object
+        to_obj_list           - convert a list of timestamp strings to datetime objects
+        from_obj              - convert a datetime object to a timestamp string of a given format and resolution
+        to_datetime64         - convert a list or array of timestamp strings to a numpy datetime64 array
+        from_datetime64       - convert a numpy datetime64 array to a list of timestamp strings
+        get_stats             - cache misses and sizes
+    
+"""
+class TimestampCodec(object):
+    
+    _CACHE_SIZE_ = 100000
+    
+    """ Cache key for datetime object conversions """
+    _OBJ_ = 0
+    
+    """ Per format: string length, length of the minute prefix, position of the seconds and positions of the 14 digits """
+    _LENGTH_ = {1 : 14, 2 : 19}
+    _MINUTE_LEN_ = {1 : 12, 2 : 16}
+    _SECOND_POS_ = {1 : 12, 2 : 17}
+    _DIGIT_POS_ = {1 : range(14), 2 : [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18]}
+    
+    def __init__(self, **kwargs):
+        
+        self._cache_size_ = self._CACHE_SIZE_
+        if 'cache_size' in kwargs:
+            self._cache_size_ = max(int(kwargs['cache_size']), 1)
+        
+        self._caches_ = {self._OBJ_ : dict(), 1 : dict(), 2 : dict()}
+        self._misses_ = 0
+    
+    """
+        Detect the format of a timestamp string - fixed positions are checked before falling back to getTimestampFormat
+        
+        @return: 1, 2 or -1 if the format is unknown
+    """
+    def get_format(self, ts):
+        
+        if self._is_format(ts, 1):
+            return 1
+        elif self._is_format(ts, 2):
+            return 2
+        
+        return getTimestampFormat(ts)
+    
+    def _is_format(self, ts, format):
+        
+        if format == 1:
+            return len(ts) == 14 and ts.isdigit()
+        elif format == 2:
+            return len(ts) >= 19 and ts[4] == '-' and ts[7] == '-' and ts[10] == ' ' and ts[13] == ':' and ts[16] == ':'
+        
+        return False
+    
+    """
+        Resolve the format of a timestamp - a stated format is used if the timestamp has that form otherwise it is detected
+    """
+    def _resolve_format(self, ts, format):
+        
+        if not(self._is_format(ts, format)):
+            format = self.get_format(ts)
+        
+        if not(format in self._LENGTH_):
+            raise ValueError('TimestampCodec -- Unrecognized timestamp format: %s' % str(ts))
+        
+        return format
+    
+    """ Add a conversion to a cache, emptying the cache first if it is full """
+    def _store(self, cache, key, value):
+        
+        if len(cache) >= self._cache_size_:
+            cache.clear()
+        
+        cache[key] = value
+        self._misses_ = self._misses_ + 1
+    
+    """ Convert the minute prefix of a timestamp, format 2 prefixes include the trailing ':' before the seconds """
+    def _convert_minute(self, prefix, format_from, format_to):
+        
+        if format_from == 1:
+            fields = (prefix[0:4], prefix[4:6], prefix[6:8], prefix[8:10], prefix[10:12])
+        else:
+            fields = (prefix[0:4], prefix[5:7], prefix[8:10], prefix[11:13], prefix[14:16])
+        
+        if format_to == self._OBJ_:
+            return datetime.datetime(int(fields[0]), int(fields[1]), int(fields[2]), int(fields[3]), int(fields[4]))
+        elif format_to == 1:
+            return ''.join(fields)
+        else:
+            return '%s-%s-%s %s:%s:' % fields
+    
+    def _convert_known(self, ts, format_from, format_to):
+        
+        if format_from == format_to:
+            return ts
+        
+        cache = self._caches_[format_to]
+        prefix = ts[:self._MINUTE_LEN_[format_from]]
+        
+        try:
+            minute = cache[prefix]
+        except KeyError:
+            minute = self._convert_minute(prefix, format_from, format_to)
+            self._store(cache, prefix, minute)
+        
+        second_pos = self._SECOND_POS_[format_from]
+        return minute + ts[second_pos:second_pos + 2]
+    
+    def _to_obj_known(self, ts, format):
+        
+        cache = self._caches_[self._OBJ_]
+        prefix = ts[:self._MINUTE_LEN_[format]]
+        
+        try:
+            minute_obj = cache[prefix]
+        except KeyError:
+            minute_obj = self._convert_minute(prefix, format, self._OBJ_)
+            self._store(cache, prefix, minute_obj)
+        
+        second_pos = self._SECOND_POS_[format]
+        seconds = int(ts[second_pos:second_pos + 2])
+        
+        if seconds:
+            return minute_obj.replace(second=seconds)
+        
+        return minute_obj
+    
+    """
+        Convert a timestamp string between formats 1 and 2.  format_from is used when the timestamp has that form, 
+        otherwise the format is detected.
+    """
+    def convert(self, ts, format_from, format_to):
+        return self._convert_known(ts, self._resolve_format(ts, format_from), format_to)
+    
+    """ Convert a list of timestamp strings of the same format between formats 1 and 2 """
+    def convert_list(self, timestamps, format_from, format_to):
+        
+        if len(timestamps) == 0:
+            return list()
+        
+        format_from = self._resolve_format(timestamps[0], format_from)
+        return [self._convert_known(ts, format_from, format_to) for ts in timestamps]
+    
+    """ Convert a timestamp string to a datetime object, the format is detected if it is not given """
+    def to_obj(self, ts, format=None):
+        
+        if format == None:
+            format = self._resolve_format(ts, format)
+        
+        return self._to_obj_known(ts, format)
+    
+    """ Convert a list of timestamp strings of the same format to datetime objects """
+    def to_obj_list(self, timestamps, format=None):
+        
+        if len(timestamps) == 0:
+            return list()
+        
+        if format == None:
+            format = self._resolve_format(timestamps[0], format)
+        
+        return [self._to_obj_known(ts, format) for ts in timestamps]
+    
+    """
+        Convert a datetime object to a timestamp string.  Fields below the resolution are zeroed (see timestamp_from_obj).
+    """
+    def from_obj(self, time_obj, format, resolution):
+        
+        fields = [time_obj.year, time_obj.month, time_obj.day, time_obj.hour, time_obj.minute, time_obj.second]
+        fields = tuple(fields[:3 + resolution] + [0] * (3 - resolution))
+        
+        if format == 1:
+            return '%04d%02d%02d%02d%02d%02d' % fields
+        elif format == 2:
+            return '%04d-%02d-%02d %02d:%02d:%02d' % fields
+        
+        raise ValueError('TimestampCodec -- Unrecognized timestamp format: %s' % str(format))
+    
+    """
+        Convert timestamp strings of the same format to a numpy datetime64 array in one vectorized step - the digits of 
+        every timestamp are decoded at once.
+        
+        @param timestamps: list or array of format 1 or 2 timestamp strings, or a datetime64 array
+        @param format: the format of the timestamps, detected from the first timestamp if not given
+        @param unit: the datetime64 unit of the result, fields below the unit are truncated
+    """
+    def to_datetime64(self, timestamps, format=None, unit='s'):
+        
+        dtype = 'datetime64[' + unit + ']'
+        
+        if isinstance(timestamps, np.ndarray) and np.issubdtype(timestamps.dtype, np.datetime64):
+            return timestamps.astype(dtype)
+        
+        if len(timestamps) == 0:
+            return np.array([], dtype=dtype)
+        
+        if format == None:
+            format = self._resolve_format(str(timestamps[0]), format)
+        
+        width = self._LENGTH_[format]
+        chars = np.frombuffer(np.asarray(timestamps, dtype='S%d' % width).tobytes(), dtype=np.uint8).reshape(-1, width)
+        digits = chars[:, self._DIGIT_POS_[format]].astype(np.int64) - ord('0')
+        
+        years = digits[:,0] * 1000 + digits[:,1] * 100 + digits[:,2] * 10 + digits[:,3]
+        months = digits[:,4] * 10 + digits[:,5]
+        days = digits[:,6] * 10 + digits[:,7]
+        seconds = (digits[:,8] * 10 + digits[:,9]) * 3600 + (digits[:,10] * 10 + digits[:,11]) * 60 + digits[:,12] * 10 + digits[:,13]
+        
+        dates = (years - 1970).astype('datetime64[Y]').astype('datetime64[M]') + (months - 1)
+        dates = dates.astype('datetime64[D]') + (days - 1)
+        
+        return (dates.astype('datetime64[s]') + seconds).astype(dtype)
+    
+    """
+        Convert a numpy datetime64 array (or list of datetime objects) to a list of timestamp strings of the given format
+    """
+    def from_datetime64(self, times, format):
+        
+        times = np.asarray(times, dtype='datetime64[s]')
+        
+        if times.size == 0:
+            return list()
+        
+        chars = np.frombuffer(np.datetime_as_string(times.ravel()).astype('S19').tobytes(), dtype=np.uint8).reshape(-1, 19)
+        
+        if format == 1:
+            chars = chars[:, self._DIGIT_POS_[2]]
+        elif format == 2:
+            chars = chars.copy()
+            chars[:, 10] = ord(' ')
+        else:
+            raise ValueError('TimestampCodec -- Unrecognized timestamp format: %s' % str(format))
+        
+        return np.ascontiguousarray(chars).view('S%d' % chars.shape[1]).ravel().tolist()
+    
+    def get_stats(self):
+        
+        return {'misses' : self._misses_, 'obj_cache_size' : len(self._caches_[self._OBJ_]), \
+                'flat_cache_size' : len(self._caches_[1]), 'mysql_cache_size' : len(self._caches_[2])}
+
+
+""" Shared codec used by the module level conversion methods """
+codec = TimestampCodec()
@@ -0,0 +1,85 @@
+"""
+
+    Cache daemon - runs the live results, long term trends and fundraiser totals caching jobs (formerly the cron launched 
+    run_cache_live_results.py, run_cache_ltt.py and run_cache_fundraiser_totals.py) from one long lived process at 
+    configurable cadences.  Runs of the live results and long term trends jobs are skipped while neither the log miner 
+    watermark in squid_log_record nor the latest donation has moved.
+    
+    e.g. python run_cache_daemon.py -l 15 -t 60 -f 30
+
+"""
+
+
+""" Import python base modules """
+import sys, argparse, logging, signal
+import settings as projSet
+sys.path.append(projSet.__project_home__)
+
+""" Import Analytics modules """
+import classes.SystemMonitor as SM
+import classes.DataCaching as DC
+import classes.DataLoader as DL
+import data.web_reporting_view_keys as view_keys
+
+
+"""
+    Execution body of main
+"""
+def main(args):
+    
+    """ Configure the logger """
+    LOGGING_STREAM = sys.stderr
+    logging.basicConfig(level=logging.DEBUG, stream=LOGGING_STREAM, format='%(asctime)s %(levelname)-8s %(message)s', datefmt='%b-%d %H:%M:%S')
+    
+    user = projSet.__system_user__
+    cmd_pattern = 'run_cache_daemon'
+    
+    sm = SM.SystemMonitor()
+    
+    if not(sm.check_for_process_in_PIDfile(user, cmd_pattern)):
+        logging.info('Process for "run_cache_daemon" is already running.')
+        return 1
+    
+    try:
+        scheduler = DC.CachingScheduler()
+        
+        scheduler.add_job('live_results', DC.LiveResults_DataCaching, view_keys.LIVE_RESULTS_DICT_KEY, args.live_results * 60)
+        scheduler.add_job('long_term_trends', DC.LTT_DataCaching, view_keys.LTT_DICT_KEY, args.ltt * 60)
+        
+        """ Fundraiser totals are counted by day up to now - they are refreshed whether or not new donations have arrived """
+        scheduler.add_job('fundraiser_totals', DC.Fundraiser_Totals_DataCaching, view_keys.FR_TOT_DICT_KEY, args.fundraiser_totals * 60, watch_watermark=False)
+        
+        signal.signal(signal.SIGTERM, lambda signum, frame: scheduler.stop())
+        signal.signal(signal.SIGINT, lambda signum, frame: scheduler.stop())
+        
+        scheduler.run(once=args.once)
+        
+        logging.info('Cache daemon stopping: %s' % str(scheduler.get_stats()))
+    
+    finally:
+        sm.remove_process_from_PIDfile(user, cmd_pattern)
+        DL.connection_pool.close_all()
+    
+    return 0
+
+
+"""
+    Call main, exit when execution is complete
+
+    Argument parsing (argparse) and pass to main
+
+"""
+if __name__ == "__main__":
+    
+    parser = argparse.ArgumentParser(
+        description='Runs the live results, long term trends and fundraiser totals caching jobs on a schedule.'
+    )
+    
+    parser.add_argument('-l', '--live_results', metavar="<input>", type=int, help='Minutes between live results runs.', default=15)
+    parser.add_argument('-t', '--ltt', metavar="<input>", type=int, help='Minutes between long term trends runs.', default=60)
+    parser.add_argument('-f', '--fundraiser_totals', metavar="<input>", type=int, help='Minutes between fundraiser totals runs.', default=30)
+    parser.add_argument('--once', action='store_true', help='Run each job once and exit.', default=False)
+    
+    args = parser.parse_args()
+    
+    sys.exit(main(args))
@@ -51,16 +51,21 @@ def main(args):
        
     fdm = DM.FundraiserDataMapper()
     
-    """ Only process command line args if they are ALL specified """
+    """ Only process command line args if they are ALL specified - omitting the hour backfills the whole day """
     if isinstance(args.year, str) and isinstance(args.month, str) and isinstance(args.day, str) and isinstance(args.hour, str):
         
         logging.info('Processing command line args ....')
-        fdm.process_logs(year=args.year, month=args.month, day=args.day, hour=args.hour)
+        fdm.process_logs(year=args.year, month=args.month, day=args.day, hour=args.hour, workers=args.workers)
+    
+    elif isinstance(args.year, str) and isinstance(args.month, str) and isinstance(args.day, str):
+        
+        logging.info('Processing command line args - backfilling all hours of the day ....')
+        fdm.process_logs(year=args.year, month=args.month, day=args.day, workers=args.workers)
     
     else:
 
         logging.info('No args command line args provided. Proceeding ...')
-        fdm.process_logs()
+        fdm.process_logs(workers=args.workers)
         
     logging.info('Log polling complete.')
     
@@ -85,6 +90,7 @@ if __name__ == "__main__":
     parser.add_argument('-m', '--month', metavar="<input>", type=time_field, help='The month of the log to be mined.', default=sys.stdin)
     parser.add_argument('-d', '--day', metavar="<input>", type=time_field, help='The day of the log to be mined.', default=sys.stdin)
     parser.add_argument('-u', '--hour', metavar="<input>", type=time_field, help='The hour of the log to be mined.', default=sys.stdin)
+    parser.add_argument('-w', '--workers', metavar="<input>", type=int, help='The number of processes over which to mine logs.', default=1)
     
     args = parser.parse_args()
 
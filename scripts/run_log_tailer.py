@@ -0,0 +1,66 @@
+"""
+
+    Wrapper script to follow a growing udp2log file and mine requests as they are appended
+
+"""
+
+
+""" Import python base modules """
+import sys, argparse, logging
+import settings as projSet
+sys.path.append(projSet.__project_home__)
+
+""" Import Analytics modules """
+import classes.DataMapper as DM
+
+
+
+"""
+    Execution body of main
+"""
+def main(args):
+
+    """ Configure the logger """
+
+    LOGGING_STREAM = sys.stderr
+    logging.basicConfig(level=logging.DEBUG, stream=LOGGING_STREAM, format='%(asctime)s %(levelname)-8s %(message)s', datefmt='%b-%d %H:%M:%S')
+
+    fdm = DM.FundraiserDataMapper()
+
+    if args.type == 'banner':
+        request_type = fdm._BANNER_REQUEST_
+    else:
+        request_type = fdm._LP_REQUEST_
+
+    logging.info('Following %s for %s requests ....' % (args.log_path, args.type))
+
+    if args.polls > 0:
+        fdm.tail_log(args.log_path, request_type, poll_interval=args.interval, max_polls=args.polls)
+    else:
+        fdm.tail_log(args.log_path, request_type, poll_interval=args.interval)
+
+    logging.info('Log tailing complete.')
+
+    return 0
+
+
+"""
+    Call main, exit when execution is complete
+
+    Argument parsing (argparse) and pass to main
+
+"""
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description='Follows a udp2log file or named pipe and loads banner impressions or landing page requests as they arrive.'
+    )
+
+    parser.add_argument('log_path', metavar="<log_path>", help='The full path of the log file or named pipe to follow.')
+    parser.add_argument('-t', '--type', metavar="<input>", choices=['banner', 'lp'], help='The request type contained in the log, banner or lp.', default='banner')
+    parser.add_argument('-i', '--interval', metavar="<input>", type=int, help='Seconds to wait for new requests at the end of the log.', default=DM.FundraiserDataMapper._TAIL_POLL_INTERVAL_)
+    parser.add_argument('-p', '--polls', metavar="<input>", type=int, help='Stop after this many polls, by default the log is followed indefinitely.', default=0)
+
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,88 @@
+"""
+
+    Wrapper script to re-aggregate the long term trends hourly fact tables over a range of time, e.g. after logs have 
+    been re-mined or donations corrected.  The range is refreshed a day at a time so that each transaction stays small.  
+    The fact watermarks are not moved.
+
+    e.g. python run_ltt_fact_backfill.py 20111201000000 20111215000000
+         python run_ltt_fact_backfill.py -f ltt_hourly_impressions -f ltt_hourly_views 20111201000000 20111215000000
+
+"""
+
+
+""" Import python base modules """
+import sys, argparse, logging, datetime
+import settings as projSet
+sys.path.append(projSet.__project_home__)
+
+""" Import Analytics modules """
+import classes.DataLoader as DL
+import classes.TimestampProcessor as TP
+
+
+
+"""
+    Execution body of main
+"""
+def main(args):
+
+    """ Configure the logger """
+
+    LOGGING_STREAM = sys.stderr
+    logging.basicConfig(level=logging.DEBUG, stream=LOGGING_STREAM, format='%(asctime)s %(levelname)-8s %(message)s', datefmt='%b-%d %H:%M:%S')
+
+    lttfl = DL.LongTermTrendsFactLoader()
+
+    fact_tables = sorted(lttfl._FACT_SQL_.keys())
+    if args.fact_table:
+        for fact_table in args.fact_table:
+            if not(fact_table in lttfl._FACT_SQL_):
+                logging.error('Unknown fact table: %s' % fact_table)
+                return 1
+        fact_tables = args.fact_table
+
+    start_obj = TP.timestamp_to_obj(args.start_time, 1)
+    end_obj = TP.timestamp_to_obj(args.end_time, 1)
+    step = datetime.timedelta(hours=args.step)
+
+    while start_obj < end_obj:
+
+        """ refresh_range includes the last hour of the range """
+        last_obj = min(start_obj + step, end_obj) - datetime.timedelta(hours=1)
+
+        start_time = TP.timestamp_from_obj(start_obj, 1, 3)
+        last_time = TP.timestamp_from_obj(last_obj, 1, 3)
+
+        logging.info('Refreshing long term trends facts from %s to %s ....' % (start_time, last_time))
+
+        if lttfl.refresh_range(start_time, last_time, fact_tables=fact_tables) < 0:
+            logging.error('Fact refresh failed, stopping at %s.' % start_time)
+            return 1
+
+        start_obj = start_obj + step
+
+    logging.info('Long term trends fact backfill complete.')
+
+    return 0
+
+
+"""
+    Call main, exit when execution is complete
+
+    Argument parsing (argparse) and pass to main
+
+"""
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description='Re-aggregates the hourly fact tables read by the long term trends reporting over a range of hours.'
+    )
+
+    parser.add_argument('start_time', metavar="<start_time>", help='Start of the range, a 14-digit timestamp on the hour.')
+    parser.add_argument('end_time', metavar="<end_time>", help='End of the range (exclusive), a 14-digit timestamp on the hour.')
+    parser.add_argument('-s', '--step', metavar="<input>", type=int, help='Hours refreshed per transaction.', default=24)
+    parser.add_argument('-f', '--fact_table', metavar="<input>", action='append', help='Fact table to refresh, may be repeated.  Defaults to all of them.', default=None)
+
+    args = parser.parse_args()
+
+    sys.exit(main(args))
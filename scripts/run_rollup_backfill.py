@@ -0,0 +1,77 @@
+"""
+
+    Wrapper script to (re)build the minutely rollups of banner_impressions and landing_page_requests over a range of time.
+    The range is refreshed an hour at a time so that each transaction stays small.
+
+    e.g. python run_rollup_backfill.py 20111201000000 20111215000000
+
+"""
+
+
+""" Import python base modules """
+import sys, argparse, logging, datetime
+import settings as projSet
+sys.path.append(projSet.__project_home__)
+
+""" Import Analytics modules """
+import classes.DataLoader as DL
+import classes.TimestampProcessor as TP
+
+
+
+"""
+    Execution body of main
+"""
+def main(args):
+
+    """ Configure the logger """
+
+    LOGGING_STREAM = sys.stderr
+    logging.basicConfig(level=logging.DEBUG, stream=LOGGING_STREAM, format='%(asctime)s %(levelname)-8s %(message)s', datefmt='%b-%d %H:%M:%S')
+
+    mrtl = DL.MinutelyRollupTableLoader()
+
+    start_obj = TP.timestamp_to_obj(args.start_time, 1)
+    end_obj = TP.timestamp_to_obj(args.end_time, 1)
+    step = datetime.timedelta(minutes=args.step)
+
+    while start_obj < end_obj:
+
+        """ refresh includes the last minute of the range """
+        last_obj = min(start_obj + step, end_obj) - datetime.timedelta(minutes=1)
+
+        start_time = TP.timestamp_from_obj(start_obj, 1, 2)
+        last_time = TP.timestamp_from_obj(last_obj, 1, 2)
+
+        logging.info('Refreshing rollups from %s to %s ....' % (start_time, last_time))
+
+        if mrtl.refresh(start_time, last_time) < 0:
+            logging.error('Rollup refresh failed, stopping at %s.' % start_time)
+            return 1
+
+        start_obj = start_obj + step
+
+    logging.info('Rollup backfill complete.')
+
+    return 0
+
+
+"""
+    Call main, exit when execution is complete
+
+    Argument parsing (argparse) and pass to main
+
+"""
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description='Rebuilds the minutely banner impression and landing page rollups used by the interval reporting queries.'
+    )
+
+    parser.add_argument('start_time', metavar="<start_time>", help='Start of the range, a 14-digit timestamp.')
+    parser.add_argument('end_time', metavar="<end_time>", help='End of the range (exclusive), a 14-digit timestamp.')
+    parser.add_argument('-s', '--step', metavar="<input>", type=int, help='Minutes refreshed per transaction.', default=60)
+
+    args = parser.parse_args()
+
+    sys.exit(main(args))
@@ -0,0 +1,150 @@
+"""
+
+    Micro-benchmark comparing squid log line parsing with urlparse / cgi.parse_qs (as previously done per line by the
+    miners) against classes.SquidLineParser.  Reports lines per second for each on a sample log.
+
+    e.g. python run_squid_parser_benchmark.py -f bannerImpressions-2011-11-14-03AM--15.log.gz
+
+"""
+
+
+""" Import python base modules """
+import sys, argparse, logging, time, urlparse as up, cgi
+import settings as projSet
+sys.path.append(projSet.__project_home__)
+
+""" Import Analytics modules """
+import classes.FileHandler as FH
+import classes.SquidLineParser as SLP
+
+
+"""
+    The parsing previously performed for each line of a banner impression log
+"""
+def legacy_parse_impression_line(line):
+
+    lineArgs = line.split()
+
+    try:
+        time_stamp = lineArgs[2]
+        time_bits = time_stamp.split('T')
+        date_fields = time_bits[0].split('-')
+        time_fields = time_bits[1].split(':')
+        time_stamp = date_fields[0] + date_fields[1] + date_fields[2] + time_fields[0] + time_fields[1] + '00'
+
+    except (ValueError, IndexError):
+        return None
+
+    try:
+        url = lineArgs[8]
+    except IndexError:
+        url = 'Unavailable'
+
+    queryBits = cgi.parse_qs(up.urlparse(url)[4])
+
+    project = ''
+    if ('db' in queryBits.keys()):
+        project = queryBits['db'][0]
+
+    if (project == '' and 'sitename' in queryBits.keys()):
+        project = queryBits['sitename'][0]
+
+    if ('banner' in queryBits.keys()):
+        banner = queryBits['banner'][0]
+    else:
+        banner = 'NONE'
+
+    if ('userlang' in queryBits.keys()):
+        lang = queryBits['userlang'][0]
+    else:
+        lang = 'NONE'
+
+    if ('country' in queryBits.keys()):
+        country = queryBits['country'][0]
+    else:
+        country = 'NONE'
+
+    return (banner, country, project, lang, time_stamp)
+
+
+"""
+    Time a parsing function over the lines, returns lines per second
+"""
+def time_parser(parse_function, lines, repeats):
+
+    start = time.time()
+
+    for i in range(repeats):
+        for line in lines:
+            parse_function(line)
+
+    elapsed = time.time() - start
+
+    if elapsed == 0:
+        return float('inf')
+
+    return len(lines) * repeats / elapsed
+
+
+"""
+    Execution body of main
+"""
+def main(args):
+
+    """ Configure the logger """
+    LOGGING_STREAM = sys.stderr
+    logging.basicConfig(level=logging.DEBUG, stream=LOGGING_STREAM, format='%(asctime)s %(levelname)-8s %(message)s', datefmt='%b-%d %H:%M:%S')
+
+    """ Read the sample into memory so that only parsing is timed """
+    log_file = FH.SquidLogReader(projSet.__squid_log_local_home__ + args.filename)
+    lines = list()
+
+    for line in log_file:
+        lines.append(line)
+        if args.max_lines > 0 and len(lines) >= args.max_lines:
+            break
+
+    log_file.close()
+
+    logging.info('Benchmarking parsers on %s lines from %s ...' % (str(len(lines)), args.filename))
+
+    parser = SLP.SquidLineParser()
+
+    """ Ensure both parsers agree before timing them """
+    mismatches = 0
+    for line in lines:
+        if legacy_parse_impression_line(line) != parser.parse_impression_line(line):
+            mismatches = mismatches + 1
+
+    if mismatches:
+        logging.error('Parsers disagree on %s lines.' % str(mismatches))
+
+    legacy_rate = time_parser(legacy_parse_impression_line, lines, args.repeats)
+    fast_rate = time_parser(parser.parse_impression_line, lines, args.repeats)
+
+    logging.info('urlparse + cgi.parse_qs:  %.0f lines/sec' % legacy_rate)
+    logging.info('SquidLineParser:          %.0f lines/sec' % fast_rate)
+    logging.info('Speedup:                  %.2fx' % (fast_rate / legacy_rate))
+
+    return 0
+
+
+"""
+    Call main, exit when execution is complete
+
+    Argument parsing (argparse) and pass to main
+
+"""
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description='Compares squid log line parsing throughput of the miners before and after SquidLineParser.'
+    )
+
+    parser.add_argument('-f', '--filename', metavar="<input>", type=str, help='Name of a log in the local squid log folder.', required=True)
+    parser.add_argument('-n', '--max_lines', metavar="<input>", type=int, help='Maximum number of lines to sample (0 for all).', default=100000)
+    parser.add_argument('-r', '--repeats', metavar="<input>", type=int, help='Number of passes over the sample.', default=3)
+
+    args = parser.parse_args()
+
+    main(args)
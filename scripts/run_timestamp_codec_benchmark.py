@@ -0,0 +1,164 @@
+"""
+
+    Micro-benchmark comparing the per-timestamp conversions previously done by TimestampProcessor (string slicing and
+    concatenation on every call, format re-detection in timestamp_convert_format) against TimestampCodec.  Timestamps
+    are generated to repeat each minute as request logs do.  Reports timestamps per second for each conversion.
+
+    e.g. python run_timestamp_codec_benchmark.py -n 200000 -m 60
+
+"""
+
+
+""" Import python base modules """
+import sys, argparse, logging, time, datetime, random, re
+import settings as projSet
+sys.path.append(projSet.__project_home__)
+
+""" Import Analytics modules """
+import classes.TimestampProcessor as TP
+
+
+"""
+    The conversions previously performed by TimestampProcessor
+"""
+def legacy_get_format(timestamp):
+
+    if re.search('[0-9]{14}', timestamp):
+        return 1
+    elif re.search('.*-.*-.* .*:.*:.*', timestamp):
+        return 2
+    else:
+        return -1
+
+def legacy_convert_format(ts, format_from, format_to):
+
+    format_from = legacy_get_format(ts)
+
+    if format_from == 1:
+        if format_to == 1:
+            new_timestamp = ts
+        elif format_to == 2:
+            new_timestamp = ts[0:4] + '-' + ts[4:6] + '-' + ts[6:8] + ' ' + ts[8:10] + ':' + ts[10:12] + ':' + ts[12:14]
+
+    elif format_from == 2:
+        if format_to == 1:
+            new_timestamp = ts[0:4] + ts[5:7] + ts[8:10] + ts[11:13] + ts[14:16] + ts[17:19]
+        elif format_to == 2:
+            new_timestamp = ts
+
+    return new_timestamp
+
+def legacy_to_obj(timestamp, format):
+
+    if format == 1:
+        time_obj = datetime.datetime(int(timestamp[0:4]), int(timestamp[4:6]), int(timestamp[6:8]), \
+                                    int(timestamp[8:10]), int(timestamp[10:12]), int(timestamp[12:14]))
+
+    elif format == 2:
+        time_obj = datetime.datetime(int(timestamp[0:4]), int(timestamp[5:7]), int(timestamp[8:10]), \
+                                    int(timestamp[11:13]), int(timestamp[14:16]), int(timestamp[17:19]))
+
+    return time_obj
+
+
+"""
+    Build timestamps spread over num_minutes minutes with random seconds
+"""
+def gen_timestamps(num_timestamps, num_minutes):
+
+    start = datetime.datetime(2011, 11, 30, 23, 30)
+    minutes = [start + datetime.timedelta(minutes=i) for i in range(num_minutes)]
+
+    timestamps = list()
+    for i in range(num_timestamps):
+        time_obj = random.choice(minutes) + datetime.timedelta(seconds=random.randint(0, 59))
+        timestamps.append(time_obj.strftime('%Y%m%d%H%M%S'))
+
+    timestamps.sort()
+
+    return timestamps
+
+
+"""
+    Time a conversion over the timestamps, returns timestamps per second
+"""
+def time_conversion(convert_function, timestamps, repeats):
+
+    start = time.time()
+
+    for i in range(repeats):
+        convert_function(timestamps)
+
+    elapsed = time.time() - start
+
+    if elapsed == 0:
+        return float('inf')
+
+    return len(timestamps) * repeats / elapsed
+
+
+"""
+    Execution body of main
+"""
+def main(args):
+
+    """ Configure the logger """
+    LOGGING_STREAM = sys.stderr
+    logging.basicConfig(level=logging.DEBUG, stream=LOGGING_STREAM, format='%(asctime)s %(levelname)-8s %(message)s', datefmt='%b-%d %H:%M:%S')
+
+    flat_timestamps = gen_timestamps(args.num_timestamps, args.minutes)
+    mysql_timestamps = [legacy_convert_format(ts, 1, 2) for ts in flat_timestamps]
+
+    logging.info('Benchmarking on %s timestamps over %s minutes ...' % (str(len(flat_timestamps)), str(args.minutes)))
+
+    codec = TP.TimestampCodec()
+
+    """ Ensure both implementations agree before timing them """
+    if codec.convert_list(mysql_timestamps, 2, 1) != flat_timestamps or \
+            codec.convert_list(flat_timestamps, 1, 2) != mysql_timestamps or \
+            codec.to_obj_list(flat_timestamps, 1) != [legacy_to_obj(ts, 1) for ts in flat_timestamps] or \
+            codec.from_datetime64(codec.to_datetime64(mysql_timestamps), 1) != flat_timestamps:
+        logging.error('TimestampCodec disagrees with the previous conversions.')
+
+    benchmarks = [
+        ('format 2 -> 1 (per call)', lambda ts_list: [legacy_convert_format(ts, 2, 1) for ts in ts_list], \
+            lambda ts_list: [codec.convert(ts, 2, 1) for ts in ts_list], mysql_timestamps),
+        ('format 2 -> 1 (list)', lambda ts_list: [legacy_convert_format(ts, 2, 1) for ts in ts_list], \
+            lambda ts_list: codec.convert_list(ts_list, 2, 1), mysql_timestamps),
+        ('format 1 -> datetime', lambda ts_list: [legacy_to_obj(ts, 1) for ts in ts_list], \
+            lambda ts_list: codec.to_obj_list(ts_list, 1), flat_timestamps),
+        ('format 1 -> datetime64', lambda ts_list: [legacy_to_obj(ts, 1) for ts in ts_list], \
+            lambda ts_list: codec.to_datetime64(ts_list, 1), flat_timestamps),
+    ]
+
+    for name, legacy_function, codec_function, timestamps in benchmarks:
+
+        legacy_rate = time_conversion(legacy_function, timestamps, args.repeats)
+        codec_rate = time_conversion(codec_function, timestamps, args.repeats)
+
+        logging.info('%-26s legacy: %10.0f ts/sec   codec: %10.0f ts/sec   speedup: %.2fx' % (name, legacy_rate, codec_rate, codec_rate / legacy_rate))
+
+    logging.info('Codec cache: %s' % str(codec.get_stats()))
+
+    return 0
+
+
+"""
+    Call main, exit when execution is complete
+
+    Argument parsing (argparse) and pass to main
+
+"""
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description='Compares timestamp conversion throughput of TimestampProcessor before and after TimestampCodec.'
+    )
+
+    parser.add_argument('-n', '--num_timestamps', metavar="<input>", type=int, help='Number of timestamps to convert.', default=200000)
+    parser.add_argument('-m', '--minutes', metavar="<input>", type=int, help='Number of distinct minutes the timestamps span.', default=60)
+    parser.add_argument('-r', '--repeats', metavar="<input>", type=int, help='Number of passes over the timestamps.', default=3)
+
+    args = parser.parse_args()
+
+    main(args)
@@ -4,6 +4,7 @@
 -- report_LP_metrics_minutely.sql
 --
 -- This query returns aggregate landing page results 
+-- Views are summed from the minutely rollups (MinutelyRollupTableLoader)
 -- This is consumed by the test view /Fundraising_Tools/web_reporting/tests
 --
 
@@ -24,15 +25,15 @@ amount_normal / donations as avg_donation_norm
 from
 
 (select 
-DATE_FORMAT(request_time,'%sY%sm%sd%sH') as dt_hr,
-FLOOR(MINUTE(request_time) / %s) * %s as dt_min,
+DATE_FORMAT(on_minute,'%sY%sm%sd%sH') as dt_hr,
+FLOOR(MINUTE(on_minute) / %s) * %s as dt_min,
 landing_page,
-count(*) as views,
+sum(views) as views,
 utm_campaign
 
-from landing_page_requests
+from landing_page_requests_minutely
 
-where request_time >=  '%s' and request_time < '%s'
+where on_minute >=  '%s' and on_minute < '%s'
 and utm_campaign = '%s'
 and country regexp '%s' 
 
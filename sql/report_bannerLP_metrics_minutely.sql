@@ -4,6 +4,7 @@
 -- report_bannerLP_metrics_minutely.sql
 --
 -- This query returns minute by minute banner/landing page combo results 
+-- Impressions and views are summed from the minutely rollups (MinutelyRollupTableLoader)
 -- This is consumed by the test view /Fundraising_Tools/web_reporting/tests
 --
 
@@ -33,8 +34,8 @@ from
 DATE_FORMAT(on_minute,'%sY%sm%sd%sH') as dt_hr,
 FLOOR(MINUTE(on_minute) / %s) * %s as dt_min,
 utm_source, 
-sum(counts) as impressions
-from banner_impressions 
+sum(impressions) as impressions
+from banner_impressions_minutely 
 where on_minute > '%s' and on_minute < '%s' 
 and country regexp '%s' 
 group by 1,2,3) as imp
@@ -42,14 +43,14 @@ group by 1,2,3) as imp
 join
 
 (select 
-DATE_FORMAT(request_time,'%sY%sm%sd%sH') as dt_hr,
-FLOOR(MINUTE(request_time) / %s) * %s as dt_min,
+DATE_FORMAT(on_minute,'%sY%sm%sd%sH') as dt_hr,
+FLOOR(MINUTE(on_minute) / %s) * %s as dt_min,
 utm_source, 
 landing_page,
-count(*) as views,
+sum(views) as views,
 utm_campaign
-from landing_page_requests
-where request_time >=  '%s' and request_time < '%s'
+from landing_page_requests_minutely
+where on_minute >=  '%s' and on_minute < '%s'
 and utm_campaign regexp '%s'
 and country regexp '%s' 
 group by 1,2,3,4) as lp
@@ -59,12 +60,12 @@ on imp.utm_source =  lp.utm_source and imp.dt_hr =  lp.dt_hr and imp.dt_min =  l
 join 
 
 (select 
-DATE_FORMAT(request_time,'%sY%sm%sd%sH') as dt_hr,
-FLOOR(MINUTE(request_time) / %s) * %s as dt_min,
+DATE_FORMAT(on_minute,'%sY%sm%sd%sH') as dt_hr,
+FLOOR(MINUTE(on_minute) / %s) * %s as dt_min,
 utm_source, 
-count(*) as total_views
-from landing_page_requests
-where request_time >= '%s' and request_time < '%s'
+sum(views) as total_views
+from landing_page_requests_minutely
+where on_minute >= '%s' and on_minute < '%s'
 and country regexp '%s' 
 group by 1,2,3) as lp_tot
 
@@ -4,6 +4,7 @@
 -- report_bannerLP_metrics_minutely_1S.sql
 --
 -- This query returns minute by minute banner/landing page combo results for one step tests
+-- Impressions are summed from the minutely rollups (MinutelyRollupTableLoader)
 -- This is consumed by the test view /Fundraising_Tools/web_reporting/tests
 --
 
@@ -32,8 +33,8 @@ from
 DATE_FORMAT(on_minute,'%sY%sm%sd%sH') as dt_hr,
 FLOOR(MINUTE(on_minute) / %s) * %s as dt_min,
 utm_source, 
-sum(counts) as impressions
-from banner_impressions 
+sum(impressions) as impressions
+from banner_impressions_minutely 
 where on_minute > '%s' and on_minute < '%s' 
 and country regexp '%s' 
 
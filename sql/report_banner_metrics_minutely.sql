@@ -4,6 +4,7 @@
 -- report_banner_metrics_minutely.sql
 --
 -- This query returns minute by minute banner results 
+-- Impressions and views are summed from the minutely rollups (MinutelyRollupTableLoader)
 -- This is consumed by the test view /Fundraising_Tools/web_reporting/tests
 --
 
@@ -29,9 +30,9 @@ from
 DATE_FORMAT(on_minute,'%sY%sm%sd%sH') as dt_hr,
 FLOOR(MINUTE(on_minute) / %s) * %s as dt_min,
 utm_source, 
-sum(counts) as impressions
+sum(impressions) as impressions
 
-from banner_impressions 
+from banner_impressions_minutely 
 
 where on_minute > '%s' and on_minute < '%s' 
 and country regexp '%s' 
@@ -41,15 +42,15 @@ group by 1,2,3) as imp
 join
 
 (select 
-DATE_FORMAT(request_time,'%sY%sm%sd%sH') as dt_hr,
-FLOOR(MINUTE(request_time) / %s) * %s as dt_min,
+DATE_FORMAT(on_minute,'%sY%sm%sd%sH') as dt_hr,
+FLOOR(MINUTE(on_minute) / %s) * %s as dt_min,
 utm_source, 
-count(*) as views,
+sum(views) as views,
 utm_campaign
 
-from landing_page_requests
+from landing_page_requests_minutely
 
-where request_time >=  '%s' and request_time < '%s'
+where on_minute >=  '%s' and on_minute < '%s'
 and utm_campaign = '%s'
 and country regexp '%s' 
 
@@ -60,14 +61,14 @@ on imp.utm_source =  lp.utm_source and imp.dt_hr =  lp.dt_hr and imp.dt_min =  l
 join 
 
 (select 
-DATE_FORMAT(request_time,'%sY%sm%sd%sH') as dt_hr,
-FLOOR(MINUTE(request_time) / %s) * %s as dt_min,
+DATE_FORMAT(on_minute,'%sY%sm%sd%sH') as dt_hr,
+FLOOR(MINUTE(on_minute) / %s) * %s as dt_min,
 utm_source, 
-count(*) as total_views
+sum(views) as total_views
 
-from landing_page_requests
+from landing_page_requests_minutely
 
-where request_time >= '%s' and request_time < '%s'
+where on_minute >= '%s' and on_minute < '%s'
 and country regexp '%s' 
 
 group by 1,2,3) as lp_tot
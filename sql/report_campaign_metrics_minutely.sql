@@ -12,15 +12,15 @@ from
 
 
 (select 
-DATE_FORMAT(request_time,'%sY%sm%sd%sH') as dt_hr,
-FLOOR(MINUTE(request_time) / %s) * %s as dt_min,
+DATE_FORMAT(on_minute,'%sY%sm%sd%sH') as dt_hr,
+FLOOR(MINUTE(on_minute) / %s) * %s as dt_min,
 utm_source as banner, 
 landing_page,
-count(*) as views
+sum(views) as views
 
-from landing_page_requests
+from landing_page_requests_minutely
 
-where request_time >=  '%s' and request_time < '%s' 
+where on_minute >=  '%s' and on_minute < '%s' 
 and utm_campaign regexp '%s'
 and country regexp '%s'
 
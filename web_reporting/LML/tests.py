@@ -7,6 +7,10 @@ Replace this with more appropriate tests for your application.
 
 from django.test import TestCase
 
+import cgi
+
+import classes.SquidLineParser as SLP
+
 
 class SimpleTest(TestCase):
     def test_basic_addition(self):
@@ -14,3 +18,29 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+class ParseQueryTest(TestCase):
+    """
+    SquidLineParser.parse_query must extract the same values as the first value of cgi.parse_qs that the miners used.
+    """
+
+    queries = ['title=Special:BannerLoader&banner=B20110601_JWJN001_BR&userlang=pt&db=ptwiki&sitename=Wikip%C3%A9dia&country=BR',
+               'banner=B1&country=&country=US',
+               'banner=B1;country=CA&utm_source=a+b%2Bc',
+               'ban%6Eer=B2&count%72y=FR&user+lang=de',
+               'banner&country=JP&=x&banner=B3',
+               '']
+
+    keys = set(['banner', 'country', 'userlang', 'db', 'sitename', 'utm_source', 'user lang'])
+
+    def test_matches_parse_qs(self):
+        parser = SLP.SquidLineParser()
+
+        for query in self.queries:
+            expected = dict([(key, values[0]) for key, values in cgi.parse_qs(query).iteritems() if key in self.keys])
+            self.assertEqual(parser.parse_query(query, self.keys), expected, query)
+
+    def test_encoded_keys(self):
+        fields = SLP.SquidLineParser().parse_query('ban%6Eer=B2&count%72y=FR', self.keys)
+        self.assertEqual(fields, {'banner' : 'B2', 'country' : 'FR'})
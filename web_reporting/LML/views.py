@@ -25,7 +25,7 @@ from django.shortcuts import render_to_response
 from django.template import RequestContext
 
 """ Import python base modules """
-import MySQLdb, logging, sys, datetime
+import MySQLdb, logging, sys, datetime, re
 
 """ Import Analytics modules """
 import classes.DataLoader as DL
@@ -176,9 +176,17 @@ def mining_patterns_add(request):
     except:
         
         err_msg = 'Fields to add mining pattern incorrect.'
-        pass 
-        
-    mptl.insert_row(pattern_type=type, pattern=regexp)
+        regexp = None
+    
+    """ Only store patterns that compile - landing page patterns are compiled together by the miner's matcher """
+    if regexp != None:
+        try:
+            re.compile(request.POST['regexp_pattern'])
+            mptl.insert_row(pattern_type=type, pattern=regexp)
+            
+        except re.error:
+            err_msg = 'Invalid regular expression: %s' % request.POST['regexp_pattern']
+    
     banner_patterns, lp_patterns = mptl.get_pattern_lists()
     
     return render_to_response('LML/mining_patterns.html', {'err_msg' : err_msg , 'banner_patterns' : banner_patterns, 'lp_patterns' : lp_patterns},  context_instance=RequestContext(request))
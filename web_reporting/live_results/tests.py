@@ -7,6 +7,19 @@ Replace this with more appropriate tests for your application.
 
 from django.test import TestCase
 
+import cPickle, datetime, json, os, shutil, tempfile, threading
+
+import classes.DataCaching as DC
+import classes.DataLoader as DL
+import classes.Helper as Hlp
+import classes.TimestampProcessor as TP
+
+
+def nonzero_values(results, metric_name):
+    """ The rows of a metric of an IntervalResults object keyed on artifact, leaving out artifacts without data """
+    metric = results.get_metric(metric_name).tolist()
+    return dict([(key, metric[index]) for index, key in enumerate(results.get_keys()) if any(metric[index])])
+
 
 class SimpleTest(TestCase):
     def test_basic_addition(self):
@@ -14,3 +27,371 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+class IntervalResultsTest(TestCase):
+    """
+    IntervalResults buckets the rows of the interval reporting queries onto a grid of sampling intervals.
+    """
+
+    col_names = ['ts', 'banner', 'impressions', 'donations']
+    start = datetime.datetime(2011, 12, 1, 10, 0)
+
+    def load(self, start, end, rows, chunk_size=None):
+        results = DL.IntervalResults(start, end, 5)
+        if chunk_size:
+            results._CHUNK_SIZE_ = chunk_size
+        results.load_rows(iter(rows), self.col_names, lambda row: row[1], 0)
+        return results
+
+    def test_load_rows(self):
+        rows = [('20111201100000', 'B1', 5, 1), ('20111201101200', 'B1', 7, None), ('20111201100500', 'B2', 3, 2),
+                ('20111201095500', 'B2', 100, 100), ('20111201103500', 'B1', 100, 100)]
+        results = self.load(self.start, self.start + datetime.timedelta(minutes=30), rows)
+
+        self.assertEqual(results.get_keys(), ['B1', 'B2'])
+        self.assertEqual(len(results.get_times()), 7)
+        self.assertEqual(results.get_metric('impressions').tolist(), [[5, 0, 7, 0, 0, 0, 0], [0, 3, 0, 0, 0, 0, 0]])
+        self.assertEqual(results.get_metric('donations').tolist(), [[1, 0, 0, 0, 0, 0, 0], [0, 2, 0, 0, 0, 0, 0]])
+        self.assertFalse('banner' in results._metrics_)
+
+    def test_load_rows_in_chunks(self):
+        rows = [('201112011%s00' % str(minute).zfill(3), 'B%d' % (minute % 3), minute, 1) for minute in range(0, 60, 5)]
+        end = self.start + datetime.timedelta(minutes=55)
+
+        whole = self.load(self.start, end, rows)
+        chunked = self.load(self.start, end, rows, chunk_size=2)
+
+        self.assertEqual(chunked.get_keys(), whole.get_keys())
+        self.assertEqual(chunked.get_metric('impressions').tolist(), whole.get_metric('impressions').tolist())
+
+    def test_regrid_and_splice(self):
+        rows = [('20111201100000', 'B0', 9, 9), ('20111201101000', 'B1', 1, 0), ('20111201102000', 'B1', 2, 1),
+                ('20111201102500', 'B2', 3, 0), ('20111201103500', 'B1', 4, 0), ('20111201104500', 'B3', 5, 1)]
+        old_end = self.start + datetime.timedelta(minutes=30)
+        new_start = self.start + datetime.timedelta(minutes=15)
+        new_end = self.start + datetime.timedelta(minutes=45)
+        delta_start = self.start + datetime.timedelta(minutes=20)
+
+        old = self.load(self.start, old_end, [row for row in rows if row[0] <= '20111201103000'])
+        regridded = old.regrid(new_start, new_end)
+
+        """ Artifacts without data in the new range are dropped """
+        self.assertEqual(regridded.get_keys(), ['B1', 'B2'])
+        self.assertEqual(nonzero_values(regridded, 'impressions'), {'B1' : [0, 2, 0, 0, 0, 0, 0], 'B2' : [0, 0, 3, 0, 0, 0, 0]})
+
+        """ Splicing the rows since delta_start onto the regridded result gives the result of loading the new range """
+        regridded.splice(self.load(delta_start, new_end, [row for row in rows if row[0] >= '20111201102000']))
+        full = self.load(new_start, new_end, rows)
+
+        for metric_name in ['impressions', 'donations']:
+            self.assertEqual(nonzero_values(regridded, metric_name), nonzero_values(full, metric_name))
+
+
+class AlignToGridTest(TestCase):
+    """
+    align_to_grid places each sample in the grid bucket that starts at or before it.
+    """
+
+    times = {'B1': ['20111201100000', '20111201100700', '20111201101400'], 'B2': ['20111201100500', '20111201100600']}
+    metrics = {'B1': [1, 2, 3], 'B2': [4, 5]}
+
+    def test_bucketing(self):
+        times, metrics = TP.align_to_grid(self.times, self.metrics, 5)
+
+        self.assertEqual(times['B1'].tolist(), [0, 5, 10])
+        self.assertEqual(times['B2'].tolist(), [0, 5, 10])
+        self.assertEqual(metrics['B1'].tolist(), [1, 2, 3])
+        self.assertEqual(metrics['B2'].tolist(), [0, 5, 0])
+
+    def test_start_and_end(self):
+        times, metrics = TP.align_to_grid(self.times, self.metrics, 5, start='20111201100500', end='20111201101000')
+
+        self.assertEqual(times['B1'].tolist(), [0, 5])
+        self.assertEqual(metrics['B1'].tolist(), [2, 3])
+        self.assertEqual(metrics['B2'].tolist(), [5, 0])
+
+    def test_time_unit(self):
+        times, metrics = TP.align_to_grid(self.times, self.metrics, 30, time_unit=TP.HOUR)
+
+        self.assertEqual(times['B1'].tolist(), [0.0])
+        self.assertEqual(metrics['B1'].tolist(), [3])
+
+    def test_empty(self):
+        self.assertEqual(TP.align_to_grid(dict(), dict(), 5), [dict(), dict()])
+
+
+class TimestampCodecTest(TestCase):
+    """
+    TimestampCodec converts between the flat (1) and MySQL (2) timestamp formats, datetime objects and datetime64 arrays.
+    """
+
+    flat = ['20111201100507', '20111201100559', '20111231235900']
+    mysql = ['2011-12-01 10:05:07', '2011-12-01 10:05:59', '2011-12-31 23:59:00']
+
+    def test_convert(self):
+        codec = TP.TimestampCodec()
+
+        self.assertEqual(codec.get_format(self.flat[0]), 1)
+        self.assertEqual(codec.get_format(self.mysql[0]), 2)
+        self.assertEqual(codec.convert_list(self.flat, 1, 2), self.mysql)
+        self.assertEqual(codec.convert_list(self.mysql, 2, 1), self.flat)
+
+        """ A stated format that does not match the timestamp falls back to detection """
+        self.assertEqual(codec.convert(self.mysql[0], 1, 1), self.flat[0])
+
+    def test_to_and_from_obj(self):
+        codec = TP.TimestampCodec()
+
+        self.assertEqual(codec.to_obj(self.flat[0]), datetime.datetime(2011, 12, 1, 10, 5, 7))
+        self.assertEqual(codec.to_obj_list(self.mysql), codec.to_obj_list(self.flat))
+        self.assertEqual(codec.from_obj(datetime.datetime(2011, 12, 1, 10, 5, 7), 1, 1), '20111201100000')
+        self.assertEqual(codec.from_obj(datetime.datetime(2011, 12, 1, 10, 5, 7), 2, 3), self.mysql[0])
+
+    def test_datetime64(self):
+        codec = TP.TimestampCodec()
+        times = codec.to_datetime64(self.flat)
+
+        self.assertEqual(times.tolist(), codec.to_obj_list(self.flat))
+        self.assertEqual(codec.from_datetime64(times, 1), self.flat)
+        self.assertEqual(codec.from_datetime64(codec.to_datetime64(self.mysql), 2), self.mysql)
+        self.assertEqual(codec.to_datetime64(self.flat, unit='m').tolist()[0], datetime.datetime(2011, 12, 1, 10, 5))
+
+    def test_cache_size(self):
+        codec = TP.TimestampCodec(cache_size=1)
+        codec.convert_list(self.flat, 1, 2)
+
+        """ Timestamps in the same minute share a cache entry, the full cache is emptied for the last minute """
+        self.assertEqual(codec.get_stats()['misses'], 2)
+        self.assertEqual(codec.get_stats()['mysql_cache_size'], 1)
+
+    def test_bad_format(self):
+        codec = TP.TimestampCodec()
+
+        self.assertRaises(ValueError, codec.convert, 'not a timestamp', 1, 2)
+        self.assertRaises(ValueError, codec.from_obj, datetime.datetime(2011, 12, 1), 3, 3)
+
+
+class LRUCacheTest(TestCase):
+    """
+    LRUCache bounds the number of entries and, when a maximum weight is given, the total weight of the entries.
+    """
+
+    def test_size(self):
+        cache = Hlp.LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+
+        self.assertTrue('a' in cache and 'c' in cache)
+        self.assertFalse('b' in cache)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get_stats()['evictions'], 1)
+
+    def test_weight(self):
+        cache = Hlp.LRUCache(10, max_weight=10)
+        cache.put('a', 1, weight=4)
+        cache.put('b', 2, weight=4)
+        cache.get('a')
+        cache.put('c', 3, weight=5)
+
+        """ The least recently used entry is evicted until the new entry fits """
+        self.assertEqual(len(cache), 2)
+        self.assertFalse('b' in cache)
+        self.assertEqual(cache.get_stats()['weight'], 9)
+
+        """ Entries heavier than the cache are not stored and do not evict anything """
+        cache.put('d', 4, weight=11)
+        self.assertFalse('d' in cache)
+        self.assertEqual(len(cache), 2)
+
+    def test_weight_accounting(self):
+        cache = Hlp.LRUCache(10, max_weight=10)
+        cache.put('a', 1, weight=4)
+        cache.put('a', 2, weight=6)
+
+        self.assertEqual(cache.get('a'), 2)
+        self.assertEqual(cache.get_stats()['weight'], 6)
+
+        cache.remove('a')
+        self.assertEqual(cache.get_stats()['weight'], 0)
+
+        cache.put('b', 1, weight=3)
+        cache.clear()
+        self.assertEqual(cache.get_stats()['weight'], 0)
+        self.assertEqual(len(cache), 0)
+
+
+class PackDataListsTest(TestCase):
+    """
+    pack_data_lists stores the combined template data as flat arrays, unpack_data_lists renders it back to javascript.
+    """
+
+    combined = {'data' : [[[[0, 1], [5, 2.5]], [[0, 3]], []], [0.25, 1, 7], []], 'labels' : ['impressions', 'rates', 'empty']}
+
+    def test_round_trip(self):
+        packed = Hlp.pack_data_lists(self.combined)
+
+        self.assertEqual(packed['num_series'], [3, 0, 0])
+        self.assertEqual(packed['offsets'].tolist(), [0, 2, 3, 3])
+        self.assertEqual(packed['labels'], self.combined['labels'])
+
+        unpacked = Hlp.unpack_data_lists(packed)
+
+        self.assertEqual(json.loads(unpacked['data']), self.combined['data'])
+        self.assertEqual(unpacked['labels'], self.combined['labels'])
+
+    def test_unpacked_input(self):
+        self.assertEqual(Hlp.unpack_data_lists(self.combined), self.combined)
+
+
+class IntervalLoader(object):
+    """
+    Stands in for the interval reporting loader of LiveResults_DataCaching, serving the rows loaded so far.
+    """
+
+    _query_type_ = 'test'
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def run_query_columnar(self, start_time, end_time, interval, campaign, **kwargs):
+        results = DL.IntervalResults(TP.timestamp_to_obj(start_time, 1), TP.timestamp_to_obj(end_time, 1), interval)
+        rows = [row for row in self.rows if start_time <= row[0] <= end_time]
+        results.load_rows(iter(rows), ['ts', 'banner', 'impressions'], lambda row: row[1], 0)
+        return results
+
+
+class IntervalCarryOverTest(TestCase):
+    """
+    LiveResults_DataCaching.run_interval_query carries the intervals of the previous run over up to its settled end time 
+    less the settle window.  However the settled end time moves the result must be that of querying the full window.
+    """
+
+    rows = [('201112011%s00' % str(minute).zfill(3), 'B1', 1) for minute in range(0, 65, 5)]
+
+    def run_query(self, previous_results, previous_timestamp, rows, start_time, end_time):
+        return DC.LiveResults_DataCaching().run_interval_query(IntervalLoader(rows), previous_results, previous_timestamp, \
+                                                               start_time, end_time, 5, '', settle_minutes=15)
+
+    def assertFullQuery(self, results, rows, start_time, end_time):
+        full = IntervalLoader(rows).run_query_columnar(start_time, end_time, 5, '')
+        self.assertEqual(nonzero_values(results, 'impressions'), nonzero_values(full, 'impressions'))
+
+    def test_stalled_watermark(self):
+        previous = IntervalLoader(self.rows).run_query_columnar('20111201100000', '20111201110000', 5, '')
+
+        """ Rows loaded late before the unchanged settled end time and after it are both picked up """
+        rows = self.rows + [('20111201104500', 'B2', 4), ('20111201110500', 'B2', 5)]
+        results = self.run_query(previous, '20111201105000', rows, '20111201100500', '20111201110500')
+
+        self.assertFullQuery(results, rows, '20111201100500', '20111201110500')
+
+    def test_watermark_moves_back(self):
+        previous = IntervalLoader(self.rows).run_query_columnar('20111201100000', '20111201110000', 5, '')
+
+        """ A log from 10:20 is mined again, moving the settled end time back from 10:50 and changing its counts """
+        rows = [(row[0], row[1], 3) if '20111201102000' <= row[0] < '20111201104000' else row for row in self.rows]
+        results = self.run_query(previous, min('20111201105000', '20111201102000'), rows, '20111201100500', '20111201110500')
+
+        self.assertFullQuery(results, rows, '20111201100500', '20111201110500')
+
+        """ Carrying over up to the earlier settled end time would have kept the old counts """
+        stale = self.run_query(previous, '20111201105000', rows, '20111201100500', '20111201110500')
+        self.assertNotEqual(nonzero_values(stale, 'impressions'), nonzero_values(results, 'impressions'))
+
+
+class SnapshotStoreTest(TestCase):
+    """
+    SnapshotStore publishes each generation by renaming a complete file over the snapshot path under an exclusive lock, and 
+    reloads the data only when the file behind the path changes.
+    """
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'test.snap')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write_snapshot(self, generation, data):
+        """ Publish as a writer in another process would - that process's loads are not shared with this one """
+        tmp_path = self.path + '.other.tmp'
+        with open(tmp_path, 'wb') as snapshot_file:
+            snapshot_file.write('SNAPSHOT %d 20111201100000\n' % generation)
+            cPickle.dump(data, snapshot_file, cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, self.path)
+
+    def test_empty_store(self):
+        caching = type('EmptyCaching', (DC.DataCaching,), {'CACHING_HOME' : self.path})()
+
+        self.assertEqual(DC.SnapshotStore(self.path).load_signed(), (0, dict(), None))
+        self.assertEqual(caching.retrieve_cached_data('key'), None)
+        self.assertEqual(caching.get_derived('key', 'name', lambda data: data), None)
+
+    def test_publish(self):
+        store = DC.SnapshotStore(self.path)
+        self.assertEqual(store.publish({'a' : 1}), 1)
+
+        """ A reader holding the published file keeps reading it whole while the next generation is renamed in """
+        reader = open(self.path, 'rb')
+        self.assertEqual(store.publish({'a' : 2}), 2)
+
+        try:
+            self.assertEqual(reader.readline().split()[:2], ['SNAPSHOT', '1'])
+            self.assertEqual(cPickle.load(reader), {'a' : 1})
+        finally:
+            reader.close()
+
+        self.assertEqual(store.load(), (2, {'a' : 2}))
+        self.assertEqual(sorted(os.listdir(self.dir)), ['test.snap', 'test.snap.lock'])
+
+    def test_concurrent_updates(self):
+        generations = list()
+
+        def add_keys(writer):
+            store = DC.SnapshotStore(self.path)
+            for index in range(10):
+                key = '%d.%d' % (writer, index)
+                generations.append(store.update(lambda data: dict(data.items() + [(key, index)])))
+
+        threads = [threading.Thread(target=add_keys, args=(writer,)) for writer in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        """ Every update published its own generation and none was lost """
+        self.assertEqual(sorted(generations), range(1, 41))
+        self.assertEqual(len(DC.SnapshotStore(self.path).load()[1]), 40)
+
+    def test_reload_on_new_file(self):
+        store = DC.SnapshotStore(self.path)
+        self.write_snapshot(1, {'a' : 1})
+
+        generation, data, signature = store.load_signed()
+        self.assertTrue(store.load_signed()[1] is data)
+
+        """ A new file is loaded even if it reuses the generation, e.g. after the store was recreated """
+        self.write_snapshot(1, {'a' : 2})
+
+        self.assertEqual(store.load()[1], {'a' : 2})
+        self.assertNotEqual(store.load_signed()[2], signature)
+
+    def test_derived_rebuilt_on_new_file(self):
+        caching = type('DerivedCaching', (DC.DataCaching,), {'CACHING_HOME' : self.path})()
+        builds = list()
+
+        def build(data):
+            builds.append(data)
+            return data['a'] * 10
+
+        self.write_snapshot(1, {'key' : {'a' : 1}})
+        self.assertEqual(caching.get_derived('key', 'times ten', build), 10)
+        self.assertEqual(caching.get_derived('key', 'times ten', build), 10)
+        self.assertEqual(len(builds), 1)
+
+        self.write_snapshot(1, {'key' : {'a' : 2}})
+        self.assertEqual(caching.get_derived('key', 'times ten', build), 20)
+        self.assertEqual(len(builds), 2)
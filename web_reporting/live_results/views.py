@@ -17,6 +17,11 @@
     
     get_data_lists        -- composes the donation query data into a format expected by the template
     combine_data_lists    -- combines the separate data sets from different queries into one in a format expected by the template 
+    build_legend_html     -- legend tables for the index summary table, kept per cache generation
+    build_summary_table   -- index summary table for a set of filters, kept per cache generation
+    build_plot_data       -- index plot data for a campaign filter, kept per cache generation
+    build_totals_data     -- fundraiser totals template data for a country, kept per cache generation
+    render_no_data        -- page shown until the caching job of a view has published its data
     
 """
 
@@ -84,36 +89,50 @@ def index(request):
         
     
     """
-        Call up cached results
+        Call up cached results - the summary table and plot data are built once per cache generation and filter
     """     
     
     cache = DC.LiveResults_DataCaching()
+    
     dict_param = cache.retrieve_cached_data(view_keys.LIVE_RESULTS_DICT_KEY)
+    if dict_param == None:
+        return render_no_data(request, 'Live Results')
     
-    measured_metrics_counts = dict_param['measured_metrics_counts']
-    results = dict_param['results']
-    column_names = dict_param['column_names']
-    sampling_interval = dict_param['interval']    
-    duration_hrs = dict_param['duration']
+    legend_html = cache.get_derived(view_keys.LIVE_RESULTS_DICT_KEY, 'legend_html', build_legend_html)
+    summary_table = cache.get_derived(view_keys.LIVE_RESULTS_DICT_KEY, ('summary_table', campaign_regexp_filter, min_donation, iso_filter), \
+                                      build_summary_table, campaign_regexp_filter, min_donation, iso_filter)
     
-    start_time = dict_param['start_time']
-    end_time = dict_param['end_time']
-        
-    ir_cmpgn = DR.IntervalReporting(query_type=FDH._QTYPE_CAMPAIGN_ + FDH._QTYPE_TIME_, generate_plot=False)
-    ir_banner = DR.IntervalReporting(query_type=FDH._QTYPE_BANNER_ + FDH._QTYPE_TIME_, generate_plot=False)
-    ir_lp = DR.IntervalReporting(query_type=FDH._QTYPE_LP_ + FDH._QTYPE_TIME_, generate_plot=False)
+    """  
+        Build template parameters
+    """
     
-    ir_cmpgn._counts_ = dict_param['ir_cmpgn_counts']
-    ir_banner._counts_ = dict_param['ir_banner_counts']
-    ir_lp._counts_ = dict_param['ir_lp_counts']
+    template_dict = dict(cache.get_derived(view_keys.LIVE_RESULTS_DICT_KEY, ('plot_data', campaign_regexp_filter), build_plot_data, campaign_regexp_filter))
     
-    ir_cmpgn._times_ = dict_param['ir_cmpgn_times']
-    ir_banner._times_ = dict_param['ir_banner_times']
-    ir_lp._times_ = dict_param['ir_lp_times']
+    template_dict['summary_table'] = legend_html + summary_table
+    template_dict['latest_log_end_time'] = dict_param['end_time']
+    template_dict['start_time'] = dict_param['start_time']
+    
+    return render_to_response('live_results/index.html', template_dict, context_instance=RequestContext(request))
 
-    metric_legend_table = dict_param['metric_legend_table']
-    conf_legend_table = dict_param['conf_legend_table']
 
+"""
+    Builds the legend tables shown above the live results summary table from the cached data
+"""
+def build_legend_html(dict_param):
+    
+    return '<h4><u>Metrics Legend:</u></h4><div class="spacer"></div>' + dict_param['metric_legend_table'] + \
+    '<div class="spacer"></div><h4><u>Confidence Legend for Hypothesis Testing:</u></h4><div class="spacer"></div>' + dict_param['conf_legend_table'] + \
+    '<div class="spacer"></div><div class="spacer"></div>'
+
+
+"""
+    Builds the live results summary table from the cached data for the filters posted to the index view
+"""
+def build_summary_table(dict_param, campaign_regexp_filter, min_donation, iso_filter):
+    
+    measured_metrics_counts = dict_param['measured_metrics_counts']
+    results = dict_param['results']
+    column_names = dict_param['column_names']
     
     """ Filtering -- donations and artifacts """
     
@@ -166,14 +185,28 @@ def index(request):
     else:
         summary_table = '<p><font size="4">No data available.</font></p>'
         
-    summary_table = '<h4><u>Metrics Legend:</u></h4><div class="spacer"></div>' + metric_legend_table + \
-    '<div class="spacer"></div><h4><u>Confidence Legend for Hypothesis Testing:</u></h4><div class="spacer"></div>' + conf_legend_table + '<div class="spacer"></div><div class="spacer"></div>' + summary_table
+    return summary_table
 
 
-        
-    """ 
-        Prepare Live Plots
-    """
+"""
+    Builds the campaign, banner and landing page plot data from the cached data
+"""
+def build_plot_data(dict_param, campaign_regexp_filter):
+    
+    sampling_interval = dict_param['interval']    
+    duration_hrs = dict_param['duration']
+    
+    ir_cmpgn = DR.IntervalReporting(query_type=FDH._QTYPE_CAMPAIGN_ + FDH._QTYPE_TIME_, generate_plot=False)
+    ir_banner = DR.IntervalReporting(query_type=FDH._QTYPE_BANNER_ + FDH._QTYPE_TIME_, generate_plot=False)
+    ir_lp = DR.IntervalReporting(query_type=FDH._QTYPE_LP_ + FDH._QTYPE_TIME_, generate_plot=False)
+    
+    ir_cmpgn._counts_ = dict_param['ir_cmpgn_counts']
+    ir_banner._counts_ = dict_param['ir_banner_counts']
+    ir_lp._counts_ = dict_param['ir_lp_counts']
+    
+    ir_cmpgn._times_ = dict_param['ir_cmpgn_times']
+    ir_banner._times_ = dict_param['ir_banner_times']
+    ir_lp._times_ = dict_param['ir_lp_times']
     
     """ compose a list of zero data """    
     empty_data = [[1.0, 0.0]] * (duration_hrs * 60 / sampling_interval + 1)
@@ -184,18 +217,8 @@ def index(request):
     cmpgn_data_dict = ir_cmpgn.get_data_lists(['C_', 'C11_', campaign_regexp_filter], empty_data)
     cmpgn_banner_dict = ir_banner.get_data_lists(['B_', 'B11_'], empty_data)
     cmpgn_lp_dict = ir_lp.get_data_lists(['L11_', '^cc'], empty_data)
-        
-        
-    """  
-        Build template parameters
-    """
     
-    template_dict = Hlp.combine_data_lists([cmpgn_data_dict, cmpgn_banner_dict, cmpgn_lp_dict]) # combine the separate data sets
-    template_dict['summary_table'] = summary_table
-    template_dict['latest_log_end_time'] = end_time
-    template_dict['start_time'] = start_time
-    
-    return render_to_response('live_results/index.html', template_dict, context_instance=RequestContext(request))
+    return Hlp.combine_data_lists([cmpgn_data_dict, cmpgn_banner_dict, cmpgn_lp_dict]) # combine the separate data sets
 
 
 """
@@ -203,8 +226,12 @@ def index(request):
 """
 def long_term_trends(request):
     
+    """ The template data is formatted from the packed series once per cache generation """
     cache = DC.LTT_DataCaching()
-    dict_param = cache.retrieve_cached_data(view_keys.LTT_DICT_KEY)
+    dict_param = cache.get_derived(view_keys.LTT_DICT_KEY, 'template_data', Hlp.unpack_data_lists)
+    
+    if dict_param == None:
+        return render_no_data(request, 'Long Term Trends')
     
     return render_to_response('live_results/long_term_trends.html', dict_param, context_instance=RequestContext(request))
 
@@ -215,9 +242,14 @@ def long_term_trends(request):
 def fundraiser_totals(request):
     
     cache = DC.Fundraiser_Totals_DataCaching()
-    data = cache.retrieve_cached_data(view_keys.FR_TOT_DICT_KEY)
     
-    dict_param = data['Total']
+    """ The template data is shared between requests - copy before adding to it """
+    dict_param = cache.get_derived(view_keys.FR_TOT_DICT_KEY, ('template_data', 'Total'), build_totals_data, 'Total')
+    
+    if dict_param == None:
+        return render_no_data(request, 'Fundraiser Totals')
+    
+    dict_param = dict(dict_param)
     dict_param['err_msg'] = ''
     dict_param['country'] = 'Total'
     
@@ -229,20 +261,34 @@ def fundraiser_totals(request):
 def fundraiser_totals_cntry(request, country):
     
     cache = DC.Fundraiser_Totals_DataCaching()
-    data = cache.retrieve_cached_data(view_keys.FR_TOT_DICT_KEY)
+    
+    if cache.retrieve_cached_data(view_keys.FR_TOT_DICT_KEY) == None:
+        return render_no_data(request, 'Fundraiser Totals')
     
     try: 
-        dict_param_country = data[country]
+        dict_param_country = dict(cache.get_derived(view_keys.FR_TOT_DICT_KEY, ('template_data', country), build_totals_data, country))
         dict_param_country['err_msg'] = ''
         dict_param_country['country'] = country
         return render_to_response('live_results/fundraiser_totals.html', dict_param_country, context_instance=RequestContext(request))
     
     except:
-        dict_param = data['Total']
+        dict_param = dict(cache.get_derived(view_keys.FR_TOT_DICT_KEY, ('template_data', 'Total'), build_totals_data, 'Total'))
         dict_param['err_msg'] = 'Could not find totals for that country.'
         dict_param['country'] = 'Total'
         return render_to_response('live_results/fundraiser_totals.html', dict_param, context_instance=RequestContext(request))
 
+"""
+    Formats the template data of a country's fundraiser totals from the packed series in the cached data
+"""
+def build_totals_data(data, country):
+    return Hlp.unpack_data_lists(data[country])
+
+"""
+    Shown in place of a view whose caching job has not published any data yet, e.g. just after deployment
+"""
+def render_no_data(request, title):
+    return render_to_response('live_results/no_data.html', {'title' : title}, context_instance=RequestContext(request))
+
 """
     Generates a listing of impressions for all countries and banners
 """
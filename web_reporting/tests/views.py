@@ -379,13 +379,15 @@ def generate_reporting_objects(test_name, start_time, end_time, campaign, label_
         DETERMINE LANGUAGE BREAKDOWN 
         ============================
     """
+    ccl = DL.CiviCRMLoader()
+    
     html_language = ''
     if(1):
         logging.info('')
         logging.info('Determining Languages Distribution:')
         logging.info('===================================\n')
         
-        columns, data = DL.CiviCRMLoader().get_donor_by_language(campaign, start_time, end_time)
+        columns, data = ccl.get_donor_by_language(campaign, start_time, end_time)
         html_language = DR.DataReporting()._write_html_table(data, columns)
         
     """ 
@@ -395,8 +397,6 @@ def generate_reporting_objects(test_name, start_time, end_time, campaign, label_
     logging.info('')
     logging.info('Determining Payment Methods:')
     logging.info('============================\n')
-        
-    ccl = DL.CiviCRMLoader()
     
     pm_data_counts, pm_data_conversions  = ccl.get_payment_methods(campaign, start_time, end_time, country=country)
 